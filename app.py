@@ -1,21 +1,126 @@
+import os
+
 import streamlit as st
+import numpy as np
 import pandas as pd
 import altair as alt
 import folium
 from streamlit_folium import folium_static
 import plotly.express as px
 import plotly.graph_objects as go
-import geopandas as gpd
-import zipfile
-import tempfile
-import os
-import io
+
+from lluvia.animation import animated_station_bars, animated_station_map, frame_positions, payload_bytes
+from lluvia.charts import annual_chart
+from lluvia.export import (FILE_TYPES, GEO_FORMATS, TABLE_FORMATS, file_bytes, frame_chunks, long_chunks,
+                           station_chunks, wide_chunks, write_stations, write_table)
+from lluvia.gaps import METHODS as GAP_METHODS, GapFiller
+from lluvia.interpolation import interpolate
+from lluvia.loading import LAT_WGS84, LON_WGS84, missing_columns, read_shapefile_zip, source_key
+from lluvia.long_table import LongTable
+from lluvia.maps import area_layer, choropleth_layer, point_layer, raster_layer, station_layer
+from lluvia.profiling import TRACE_MEMORY, RerunProfiler, html_size, json_size
+from lluvia.search import StationSearch
+from lluvia.spatial import StationIndex
+from lluvia.stats import INFO_COLUMNS, MAX_COL, MEAN_COL, MIN_COL, StatsCube, stats_table
+from lluvia.store import bundled_source, read_stations
+from lluvia.table import PAGE_SIZES, column_limits, page_count, styled_page, table_page
+from lluvia.trends import (DECREASING, INCREASING, NO_TREND, P_COL, SLOPE_COL, TREND_COL, TREND_COLORS,
+                           mann_kendall)
+from lluvia.zonal import GROUP_COLUMNS, STATISTICS, ZonalIndex, normalize_name
 
 # Título de la aplicación
 st.set_page_config(layout="wide")
 st.title('☔ Visor de Información Geoespacial de Precipitación 🌧️')
 st.markdown("---")
 
+
+# --- Carga en caché ---
+# Los datos se leen una sola vez por contenido (hash de los bytes subidos o mtime+tamaño
+# del archivo local) y el resultado se comparte entre reruns y sesiones. Los objetos
+# devueltos son compartidos: el script no debe modificarlos en sitio.
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner=False)
+def load_stations(key, _source):
+    # Años en float32 y columnas de agrupación categóricas (ver lluvia.store)
+    return read_stations(_source)
+
+
+@st.cache_resource(max_entries=4, ttl=6 * 3600, show_spinner=False)
+def load_shapefile(key, _source, fields=None):
+    # Se lee desde memoria; ``fields`` (tupla) limita las columnas que se decodifican del .dbf
+    return read_shapefile_zip(_source, fields=fields)
+
+
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner=False)
+def get_gap_filler(key, _df):
+    # Vecinos y correlaciones de cada pareja estación-vecino, una vez por conjunto de datos
+    return GapFiller(_df)
+
+
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner="Rellenando años faltantes...")
+def get_gap_fill(key, method, min_correlation, _df):
+    result = get_gap_filler(key, _df).fill(method, min_correlation=min_correlation)
+    return result, result.to_frame(_df)
+
+
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner=False)
+def get_stats_cube(key, _df):
+    # Sumas prefijas y tablas dispersas: cualquier rango de años se consulta en O(1) por estación
+    return StatsCube.from_frame(_df)
+
+
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner=False)
+def get_long_table(key, _df):
+    # Formato largo compartido por todas las pestañas en lugar de un melt por gráfico
+    return LongTable(_df)
+
+
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner=False)
+def get_station_search(key, _df):
+    # Palabras ordenadas y trigramas de nombre, código, municipio y vereda
+    return StationSearch(_df)
+
+
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner=False)
+def get_station_index(key, _df):
+    # STRtree sobre las coordenadas CMT12 (metros) del CSV
+    return StationIndex.from_frame(_df)
+
+
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner="Calculando tendencias de la red...")
+def get_trends(key, start_year, end_year, _long_table):
+    # Mann-Kendall, pendiente de Sen y anomalías de todas las estaciones para el rango de años
+    years, values = _long_table.matrix(None, start_year, end_year)
+    return mann_kendall(values.T, years)
+
+
+@st.cache_resource(max_entries=8, ttl=6 * 3600, show_spinner=False)
+def get_zonal_index(key, _df):
+    # Códigos enteros por municipio, departamento, subregión, cuenca, vereda y celda
+    return ZonalIndex(_df)
+
+
+@st.cache_resource(max_entries=6, ttl=3600, show_spinner="Interpolando la superficie de precipitación...")
+def get_precip_grid(key, start_year, end_year, rows_key, resolution_km, method, max_distance_km, _long_table, _rows):
+    # Todos los años del rango en una sola pasada; cambiar el año mostrado no recalcula la grilla
+    years, values = _long_table.matrix(_rows, start_year, end_year)
+    stations = _long_table.stations(_rows)
+    return interpolate(stations[LON_WGS84].to_numpy(), stations[LAT_WGS84].to_numpy(), years, values,
+                       resolution_km=resolution_km, method=method, max_distance_km=max_distance_km)
+
+
+@st.cache_resource(max_entries=6, ttl=3600, show_spinner=False)
+def get_areal_means(grid_key, boundaries_key, _grid, _boundaries):
+    return _grid.areal_means(_boundaries.geometry.to_numpy())
+
+
+# --- Perfilado opcional de cada recarga ---
+# Se activa en el panel de diagnóstico al final de la barra lateral (o con LLUVIA_PROFILE=1).
+# La memoria sólo se mide si el proceso se inició con LLUVIA_PROFILE_MEMORY=1, y cada etapa
+# se agrega como una línea JSON al archivo LLUVIA_PROFILE_LOG sólo si esa variable está definida
+profile_default = os.environ.get('LLUVIA_PROFILE') == '1'
+profiler = RerunProfiler(enabled=st.session_state.get('perfilado', profile_default),
+                         log_path=os.environ.get('LLUVIA_PROFILE_LOG') or None)
+
 # --- Sección para la carga de datos ---
 with st.expander("📂 Cargar Datos"):
     st.write("Carga tu archivo `mapaCV.csv` y los archivos del shapefile (`.shp`, `.shx`, `.dbf`) comprimidos en un único archivo `.zip`.")
@@ -23,20 +128,24 @@ with st.expander("📂 Cargar Datos"):
     # Carga de archivos CSV
     uploaded_file_csv = st.file_uploader("Cargar archivo .csv (mapaCV.csv)", type="csv")
     df = None
+    df_key = None
     if uploaded_file_csv:
         try:
-            df = pd.read_csv(uploaded_file_csv, sep=';')
-            # Renombrar columnas con los nombres correctos del usuario
-            df = df.rename(columns={'Mpio': 'municipio', 'NOMBRE_VER': 'vereda'})
+            data = uploaded_file_csv.getvalue()
+            df_key = source_key(data)
+            with profiler.stage('carga: CSV'):
+                df = load_stations(df_key, data)
             st.success("Archivo CSV cargado exitosamente.")
         except Exception as e:
             st.error(f"Error al leer el archivo CSV: {e}")
             df = None
     else:
         try:
-            df = pd.read_csv('mapaCV.csv', sep=';')
-            # Renombrar columnas con los nombres correctos del usuario
-            df = df.rename(columns={'Mpio': 'municipio', 'NOMBRE_VER': 'vereda'})
+            # Si existe el store Parquet (python -m lluvia.store mapaCV.csv) se usa en lugar del CSV
+            source = bundled_source('mapaCV.csv')
+            df_key = source_key(source)
+            with profiler.stage('carga: CSV'):
+                df = load_stations(df_key, source)
             st.warning("Se ha cargado el archivo CSV usando ';' como separador.")
         except (FileNotFoundError, pd.errors.ParserError):
             st.warning("No se pudo leer 'mapaCV.csv'. Por favor, cárgalo manualmente o revisa su formato.")
@@ -47,73 +156,148 @@ with st.expander("📂 Cargar Datos"):
     gdf = None
     if uploaded_zip:
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                with zipfile.ZipFile(uploaded_zip, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                
-                shp_files = [f for f in os.listdir(temp_dir) if f.endswith('.shp')]
-                if shp_files:
-                    shp_path = os.path.join(temp_dir, shp_files[0])
-                    gdf = gpd.read_file(shp_path)
-                    
-                    # Asignar el CRS correcto y convertir a WGS84
-                    # MAGNA-SIRGAS_CMT12 corresponde a EPSG:9377
-                    gdf.set_crs("EPSG:9377", inplace=True)
-                    gdf = gdf.to_crs("EPSG:4326")
-                    
-                    st.success("Archivos Shapefile cargados exitosamente y sistema de coordenadas configurado y convertido a WGS84.")
-                else:
-                    st.error("No se encontró ningún archivo .shp en el archivo ZIP. Asegúrate de que el archivo .zip contenga al menos un .shp.")
-                    gdf = None
+            data = uploaded_zip.getvalue()
+            # El mapa sólo usa el nombre de la estación; el resto de la información sale del CSV
+            with profiler.stage('carga: shapefile'):
+                gdf = load_shapefile(source_key(data), data, fields=('Nom_Est',))
+            st.success("Archivos Shapefile cargados exitosamente y sistema de coordenadas configurado y convertido a WGS84.")
+        except FileNotFoundError as e:
+            st.error(f"{e} Asegúrate de que el archivo .zip contenga al menos un .shp con sus archivos .shx y .dbf.")
+            gdf = None
         except Exception as e:
             st.error(f"Error al procesar el archivo ZIP: {e}")
 
+    # Carga opcional de límites (polígonos de municipios o veredas) para el filtro espacial
+    uploaded_boundaries = st.file_uploader("Cargar límites de municipios o veredas (.zip, opcional)", type="zip")
+    boundaries = None
+    if uploaded_boundaries:
+        try:
+            data = uploaded_boundaries.getvalue()
+            boundaries_key = source_key(data)
+            with profiler.stage('carga: límites'):
+                boundaries = load_shapefile(boundaries_key, data)
+            st.success("Límites cargados exitosamente.")
+        except FileNotFoundError as e:
+            st.error(f"Límites: {e}")
+        except Exception as e:
+            st.error(f"Error al procesar el archivo ZIP de límites: {e}")
+
 if df is not None:
     # Validar que las columnas necesarias existan
-    required_cols = ['Nom_Est', 'Latitud', 'Longitud', 'municipio', 'Celda_XY', 'vereda', 'Id_estacion', 'departamento']
-    missing_cols = [col for col in required_cols if col not in df.columns]
+    missing_cols = missing_columns(df)
     
     if missing_cols:
         st.error(f"Error: Las siguientes columnas requeridas no se encuentran en el archivo CSV: {', '.join(missing_cols)}. Por favor, verifica los nombres de las columnas en tu archivo.")
     else:
-        # Convertir columnas a tipo numérico, manejando errores de 'nan'
-        df['Latitud'] = pd.to_numeric(df['Latitud'], errors='coerce')
-        df['Longitud'] = pd.to_numeric(df['Longitud'], errors='coerce')
-        
-        # Eliminar filas con valores NaN en latitud/longitud
-        df.dropna(subset=['Latitud', 'Longitud'], inplace=True)
-        
+        # Las coordenadas ya vienen convertidas a número y sin filas vacías desde la carga
         # Verificar si el DataFrame está vacío después de la limpieza
         if df.empty:
             st.error("El DataFrame está vacío. Por favor, asegúrate de que tu archivo CSV contenga datos válidos en las columnas 'Nom_Est', 'Latitud' y 'Longitud'.")
         else:
             # --- Configuración de pestañas ---
-            tab1, tab2, tab3, tab4 = st.tabs([
+            tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
                 "📊 Datos Tabulados", 
                 "📈 Gráficos de Precipitación", 
                 "🌎 Mapa de Estaciones", 
-                "🎬 Animación de Lluvia"
-            ])
+                "🎬 Animación de Lluvia",
+                "🗂️ Agregación Zonal",
+                "📉 Tendencias"
+            ], key='vista', on_change='rerun')
+            # Sólo se ejecuta la pestaña visible (``tab.open``) y cada pestaña es un fragmento:
+            # sus propios controles la vuelven a ejecutar sin recalcular el resto de la página
 
             # --- Pestaña para opciones de filtrado ---
             st.sidebar.header("⚙️ Opciones de Filtrado")
+
+            # Relleno opcional de años faltantes (vacíos o 0) con estaciones vecinas. La tabla
+            # rellenada reemplaza a ``df`` con su propia clave, así que todo lo que se calcula
+            # y guarda en caché más abajo usa los datos rellenados.
+            gap_result = None
+            with st.sidebar.expander("🩹 Relleno de años faltantes"):
+                fill_gaps = st.checkbox("Rellenar con estaciones vecinas", value=False,
+                                        help="Años vacíos o en 0 se estiman a partir de las estaciones cercanas y correlacionadas.")
+                fill_method = st.selectbox("Método:", list(GAP_METHODS), format_func=GAP_METHODS.get)
+                # El inverso de la distancia no usa la correlación: queda fuera de la clave para que
+                # mover el deslizador no recalcule el mismo relleno ni descarte las cachés de ``df_key``
+                uses_correlation = fill_method != 'idw'
+                min_correlation = st.slider("Correlación mínima con el vecino:", 0.0, 0.95, 0.5, step=0.05,
+                                            disabled=not uses_correlation, help="No aplica al inverso de la distancia.")
+                if not uses_correlation:
+                    min_correlation = None
+                if fill_gaps:
+                    with profiler.stage('relleno de años'):
+                        gap_result, df = get_gap_fill(df_key, fill_method, min_correlation, df)
+                    fill_key = f"{fill_method}:{min_correlation}" if uses_correlation else fill_method
+                    df_key = f"{df_key}|relleno:{fill_key}"
+                    st.caption(f"{int(gap_result.filled.sum())} de {int(gap_result.missing.sum())} años faltantes rellenados.")
             
             # Selectores por municipio y celda, ahora multiseleccionables
-            municipios = sorted(df['municipio'].unique())
+            with profiler.stage('filtros: índice por grupo'):
+                zonal_index = get_zonal_index(df_key, df)
+            municipios = list(zonal_index.labels['municipio'])
             selected_municipio = st.sidebar.multiselect("Elige uno o más municipios:", municipios)
             
-            celdas = sorted(df['Celda_XY'].unique())
+            celdas = list(zonal_index.labels['Celda_XY'])
             selected_celda = st.sidebar.multiselect("Elige una o más celdas:", celdas)
 
-            # Filtrar el DataFrame según la selección de municipio y celda
-            filtered_df_by_loc = df.copy()
+            # Máscara de estaciones según la selección de municipio y celda (sobre los códigos de grupo)
+            loc_mask = np.ones(len(df), dtype=bool)
             if selected_municipio:
-                filtered_df_by_loc = filtered_df_by_loc[filtered_df_by_loc['municipio'].isin(selected_municipio)]
+                loc_mask &= zonal_index.mask('municipio', selected_municipio)
             if selected_celda:
-                filtered_df_by_loc = filtered_df_by_loc[filtered_df_by_loc['Celda_XY'].isin(selected_celda)]
+                loc_mask &= zonal_index.mask('Celda_XY', selected_celda)
+
+            # Filtro espacial: consultas sobre el índice de estaciones en lugar de recorrer la tabla
+            st.sidebar.subheader("🗺️ Filtro espacial")
+            with profiler.stage('filtros: índice espacial'):
+                station_index = get_station_index(df_key, df)
+            spatial_modes = ['Ninguno', 'Rectángulo (lat/lon)', 'Distancia a un punto']
+            if boundaries is not None:
+                spatial_modes.append('Dentro de polígonos')
+            spatial_mode = st.sidebar.selectbox("Filtrar estaciones por ubicación:", spatial_modes)
+
+            spatial_rows = None
+            spatial_area = None
+            min_lon, min_lat, max_lon, max_lat = station_index.bounds_lonlat()
+            if spatial_mode == 'Rectángulo (lat/lon)':
+                col_lat, col_lon = st.sidebar.columns(2)
+                with col_lat:
+                    lat_from = st.number_input("Latitud mínima:", value=round(min_lat, 4), format="%.4f")
+                    lat_to = st.number_input("Latitud máxima:", value=round(max_lat, 4), format="%.4f")
+                with col_lon:
+                    lon_from = st.number_input("Longitud mínima:", value=round(min_lon, 4), format="%.4f")
+                    lon_to = st.number_input("Longitud máxima:", value=round(max_lon, 4), format="%.4f")
+                spatial_rows = station_index.in_bbox(lon_from, lat_from, lon_to, lat_to)
+                spatial_area = station_index.bbox_area(lon_from, lat_from, lon_to, lat_to)
+            elif spatial_mode == 'Distancia a un punto':
+                col_lat, col_lon = st.sidebar.columns(2)
+                with col_lat:
+                    point_lat = st.number_input("Latitud del punto:", value=6.2442, format="%.4f")
+                with col_lon:
+                    point_lon = st.number_input("Longitud del punto:", value=-75.5812, format="%.4f")
+                radius_km = st.sidebar.number_input("Radio (km):", min_value=0.0, value=25.0, step=5.0)
+                spatial_rows = station_index.within_distance(point_lon, point_lat, radius_km)
+                spatial_area = station_index.circle_area(point_lon, point_lat, radius_km)
+            elif spatial_mode == 'Dentro de polígonos':
+                boundary_fields = [col for col in boundaries.columns if col != boundaries.geometry.name]
+                boundary_field = st.sidebar.selectbox("Campo con el nombre del polígono:", boundary_fields)
+                boundary_names = sorted(boundaries[boundary_field].dropna().astype(str).unique())
+                selected_boundaries = st.sidebar.multiselect("Elige uno o más polígonos:", boundary_names)
+                if selected_boundaries:
+                    spatial_area = boundaries.geometry[boundaries[boundary_field].astype(str).isin(selected_boundaries)]
+                    spatial_rows = station_index.in_polygon(spatial_area.to_numpy(), crs=boundaries.crs)
+
+            if spatial_rows is not None:
+                in_area = np.zeros(len(df), dtype=bool)
+                in_area[spatial_rows] = True
+                loc_mask &= in_area
+                st.sidebar.caption(f"{len(spatial_rows)} estaciones dentro del área.")
             
-            # Selección de estaciones, ordenadas alfabéticamente
-            all_stations = sorted(filtered_df_by_loc['Nom_Est'].unique())
+            # Selección de estaciones: la lista sólo trae las mejores coincidencias de la búsqueda
+            # (sobre el índice precalculado) y las estaciones ya elegidas, no toda la red
+            station_search = get_station_search(df_key, df)
+            search_query = st.sidebar.text_input("Buscar estación (nombre, código, municipio o vereda):", key='busqueda',
+                                                 help="No distingue tildes ni mayúsculas y tolera errores de escritura.")
             
             col1, col2 = st.sidebar.columns(2)
             with col1:
@@ -121,19 +305,42 @@ if df is not None:
             with col2:
                 clear_all = st.checkbox("Eliminar selección", value=False)
             
-            selected_stations_list = []
+            # Búsquedas agregadas completas con el botón de selección masiva
+            bulk_queries = st.session_state.setdefault('busquedas_agregadas', [])
             if select_all:
-                selected_stations_list = all_stations
+                selected_mask = loc_mask
             elif clear_all:
-                selected_stations_list = []
+                selected_mask = np.zeros(len(df), dtype=bool)
             else:
-                selected_stations_list = st.sidebar.multiselect(
+                with profiler.stage('filtros: búsqueda'):
+                    matches = station_search.search(search_query, loc_mask)
+                picked = st.session_state.get('estaciones', [])
+                picked = st.sidebar.multiselect(
                     "Elige las estaciones:",
-                    options=all_stations,
-                    default=[]
+                    options=list(dict.fromkeys(picked + list(station_search.names[matches]))),
+                    key='estaciones'
                 )
+                if search_query.strip():
+                    n_matches = int(station_search.matches(search_query, loc_mask).sum())
+                    # Una búsqueda ya agregada no se repite (su máscara se recalcula en cada recarga)
+                    if (n_matches and search_query not in bulk_queries
+                            and st.sidebar.button(f"Agregar las {n_matches} estaciones que coinciden con «{search_query}»")):
+                        bulk_queries.append(search_query)
+                        st.rerun()
+                selected_mask = df['Nom_Est'].isin(picked).to_numpy()
+                for query in bulk_queries:
+                    selected_mask = selected_mask | station_search.matches(query, loc_mask)
+                if bulk_queries:
+                    st.sidebar.caption("Búsquedas agregadas: " + ", ".join(f"«{query}»" for query in bulk_queries))
+                    if st.sidebar.button("Quitar búsquedas agregadas"):
+                        bulk_queries.clear()
+                        st.rerun()
 
-            selected_stations_df = df[df['Nom_Est'].isin(selected_stations_list)]
+            # Posiciones de las estaciones seleccionadas (el DataFrame cargado tiene índice 0..n-1)
+            with profiler.stage('filtros: selección'):
+                selected_rows = np.flatnonzero(selected_mask)
+                selected_stations_df = df.iloc[selected_rows]
+                selected_stations_list = df['Nom_Est'].to_numpy()[selected_rows]
 
             # Deslizadores para años
             start_year, end_year = st.sidebar.slider(
@@ -148,8 +355,43 @@ if df is not None:
             # Asegura que las columnas de años existan en el DataFrame antes de usarlas
             years_to_analyze_present = [year for year in years_to_analyze if year in selected_stations_df.columns]
             
+            # --- Estadísticas por estación para el rango de años ---
+            # Se consultan sobre el cubo precalculado; las usan la tabla y la información del mapa
+            # Calcular max, min, mean, std y agregar una fila de resumen para todas las estaciones
+            stats_df = selected_stations_df[INFO_COLUMNS].copy()
+            stats_summary = {}
+            
+            if years_to_analyze_present and not selected_stations_df.empty:
+                with profiler.stage('estadísticas'):
+                    stats_df, stats_summary = stats_table(df, get_stats_cube(df_key, df), start_year, end_year, selected_rows)
+
+            # Controles para el eje vertical, compartidos por los gráficos y las animaciones
+            y_range = None
+            if not selected_stations_df.empty:
+                st.sidebar.subheader("Opciones de Eje Vertical (Y)")
+                axis_control = st.sidebar.radio("Elige el control del eje Y:", ('Automático', 'Personalizado'))
+                if axis_control == 'Personalizado':
+                    # Límites tomados del resumen del cubo de estadísticas
+                    min_precip = stats_summary.get(MIN_COL, float('nan'))
+                    max_precip = stats_summary.get(MAX_COL, float('nan'))
+                    
+                    min_y = st.sidebar.number_input("Valor mínimo del eje Y:", value=float(min_precip), format="%.2f")
+                    max_y = st.sidebar.number_input("Valor máximo del eje Y:", value=float(max_precip), format="%.2f")
+                    if min_y >= max_y:
+                        st.sidebar.warning("El valor mínimo debe ser menor que el valor máximo.")
+                    else:
+                        y_range = (min_y, max_y)
+
+            # --- Formato largo (estación, año, precipitación) para gráficos y animaciones ---
+            # Con todas las estaciones seleccionadas es una vista sin copia de la tabla compartida
+            with profiler.stage('formato largo'):
+                long_table = get_long_table(df_key, df)
+            long_rows = None if len(selected_rows) == len(df) else selected_rows
+
             # --- Pestaña para datos tabulados ---
-            with tab1:
+            @st.fragment
+            @profiler.timed('pestaña: Datos Tabulados')
+            def tabulated_view():
                 st.header("📊 Datos Tabulados de las Estaciones")
                 st.markdown("---")
                 
@@ -159,134 +401,131 @@ if df is not None:
                     st.subheader("Información básica de las Estaciones Seleccionadas")
                     
                     # Columnas adicionales del CSV
-                    info_cols = ['Nom_Est', 'Id_estacion', 'porc_datos', 'departamento', 'municipio', 'vereda', 'Celda_XY']
-                    
-                    cols_to_display = [col for col in info_cols + years_to_analyze_present if col in df.columns]
-                    df_to_display = selected_stations_df[cols_to_display].set_index('Nom_Est')
-
-                    # Aplicar escala de colores a los datos de precipitación
-                    if not df_to_display.empty and years_to_analyze_present:
-                        try:
-                            styled_df = df_to_display.style.background_gradient(cmap='RdYlBu_r', subset=years_to_analyze_present)
-                            st.dataframe(styled_df)
-                        except Exception as e:
-                            st.error(f"Error al aplicar estilo de tabla: {e}. Mostrando tabla sin estilo.")
-                            st.dataframe(df_to_display)
+                    info_cols = ['Id_estacion', 'Porc_datos', 'departamento', 'municipio', 'vereda', 'Celda_XY']
+                    available_cols = [col for col in info_cols + years_to_analyze_present if col in df.columns]
+
+                    # Columnas, orden y página; sólo la página visible se colorea y se envía al navegador.
+                    # Se guardan las columnas que el usuario ocultó (no las visibles), así que al cambiar
+                    # el rango de años su elección se conserva y los años nuevos aparecen
+                    hidden_cols = st.session_state.setdefault('columnas_ocultas', set())
+
+                    def remember_hidden_cols(options):
+                        shown = set(st.session_state['columnas_tabla'])
+                        st.session_state['columnas_ocultas'] = (hidden_cols - set(options)) | (set(options) - shown)
+
+                    st.session_state['columnas_tabla'] = [col for col in available_cols if col not in hidden_cols]
+                    cols_to_display = st.multiselect("Columnas a mostrar:", available_cols, key='columnas_tabla',
+                                                     on_change=remember_hidden_cols, args=(available_cols,))
+                    col_table1, col_table2, col_table3, col_table4 = st.columns(4)
+                    with col_table1:
+                        sort_by = st.selectbox("Ordenar tabla por:", ['Nom_Est'] + available_cols)
+                    with col_table2:
+                        sort_ascending = st.radio("Sentido:", ('Ascendente', 'Descendente'), horizontal=True) == 'Ascendente'
+                    with col_table3:
+                        page_size = st.selectbox("Filas por página:", PAGE_SIZES, index=1)
+                    n_pages = page_count(len(selected_stations_df), page_size)
+                    with col_table4:
+                        page = st.number_input("Página:", min_value=1, max_value=n_pages, value=1, step=1)
+
+                    df_page = table_page(selected_stations_df, page, page_size, sort_by=sort_by, ascending=sort_ascending,
+                                         columns=['Nom_Est'] + cols_to_display)
+                    page_rows = df_page.index.to_numpy()
+                    df_page = df_page.set_index('Nom_Est')
+                    first_row = (page - 1) * page_size + 1
+                    st.caption(f"Estaciones {first_row}–{first_row + len(df_page) - 1} de {len(selected_stations_df)} (página {page} de {n_pages}).")
+
+                    # Escala de colores de los datos de precipitación, con los límites de toda la selección
+                    color_cols = [col for col in years_to_analyze_present if col in cols_to_display]
+                    if not df_page.empty and color_cols:
+                        low, high = column_limits(selected_stations_df, color_cols)
+                        marks = None
+                        if gap_result is not None:
+                            year_positions = np.searchsorted(gap_result.years, [int(col) for col in color_cols])
+                            marks = gap_result.filled[page_rows][:, year_positions]
+                        st.dataframe(styled_page(df_page, color_cols, low, high, cmap='RdYlBu_r', marks=marks))
+                        if gap_result is not None:
+                            st.caption(f"\\* Año rellenado con estaciones vecinas ({GAP_METHODS[gap_result.method]}).")
                     else:
-                        st.dataframe(df_to_display)
+                        st.dataframe(df_page)
 
-                    # Nueva tabla con estadísticas
+                    # Nueva tabla con estadísticas (calculada antes de las pestañas)
                     st.subheader("Estadísticas de Precipitación")
-                    
-                    # Prepara el DataFrame para estadísticas
-                    stats_df = selected_stations_df[['Nom_Est', 'Id_estacion', 'municipio', 'vereda']].copy()
-                    
-                    if years_to_analyze_present and not selected_stations_df.empty:
-                        # Calcular max, min, mean, std
-                        stats_df['Precipitación Máxima (mm)'] = selected_stations_df[years_to_analyze_present].max(axis=1).round(2)
-                        stats_df['Año Máximo'] = selected_stations_df[years_to_analyze_present].idxmax(axis=1)
-                        stats_df['Precipitación Mínima (mm)'] = selected_stations_df[years_to_analyze_present].min(axis=1).round(2)
-                        stats_df['Año Mínimo'] = selected_stations_df[years_to_analyze_present].idxmin(axis=1)
-                        stats_df['Precipitación Media (mm)'] = selected_stations_df[years_to_analyze_present].mean(axis=1).round(2)
-                        stats_df['Desviación Estándar'] = selected_stations_df[years_to_analyze_present].std(axis=1).round(2)
-
-                        # Agregar una fila de resumen para todas las estaciones
-                        df_melted_stats = selected_stations_df.melt(
-                            id_vars=['Nom_Est'],
-                            value_vars=years_to_analyze_present,
-                            var_name='Año',
-                            value_name='Precipitación'
-                        )
-                        
-                        if not df_melted_stats.empty:
-                            max_precip = df_melted_stats['Precipitación'].max()
-                            min_precip = df_melted_stats['Precipitación'].min()
-                            
-                            try:
-                                max_year = df_melted_stats[df_melted_stats['Precipitación'] == max_precip]['Año'].iloc[0]
-                            except IndexError:
-                                max_year = 'N/A'
-                            
-                            try:
-                                min_year = df_melted_stats[df_melted_stats['Precipitación'] == min_precip]['Año'].iloc[0]
-                            except IndexError:
-                                min_year = 'N/A'
-                            
-                            summary_row = pd.DataFrame([{
-                                'Nom_Est': 'Todas las estaciones',
-                                'Id_estacion': '',
-                                'municipio': '',
-                                'vereda': '',
-                                'Precipitación Máxima (mm)': max_precip,
-                                'Año Máximo': max_year,
-                                'Precipitación Mínima (mm)': min_precip,
-                                'Año Mínimo': min_year,
-                                'Precipitación Media (mm)': df_melted_stats['Precipitación'].mean().round(2),
-                                'Desviación Estándar': df_melted_stats['Precipitación'].std().round(2)
-                            }])
-                            stats_df = pd.concat([stats_df, summary_row], ignore_index=True)
 
                     st.dataframe(stats_df.set_index('Nom_Est'))
 
+                    # Exportación: el archivo se genera por bloques sólo al pulsar el botón de descarga
+                    # (en otro hilo, fuera de la recarga, por eso no se mide con el perfilador)
+                    with st.expander("⬇️ Exportar"):
+                        col_export1, col_export2 = st.columns(2)
+                        with col_export1:
+                            table_format = st.radio("Formato de las tablas:", list(TABLE_FORMATS), format_func=TABLE_FORMATS.get,
+                                                    horizontal=True)
+                        with col_export2:
+                            layout = st.radio("Forma de la selección:", ('Ancha', 'Larga'), horizontal=True,
+                                              help="Ancha: una columna por año. Larga: una fila por estación y año.")
+                        extension, mime = FILE_TYPES[table_format]
+                        chunks = wide_chunks if layout == 'Ancha' else long_chunks
+
+                        def export_selection():
+                            return file_bytes(write_table(chunks(df, selected_rows, start_year, end_year), table_format))
+
+                        def export_stats():
+                            return file_bytes(write_table(frame_chunks(stats_df), table_format))
+
+                        col_export1, col_export2 = st.columns(2)
+                        with col_export1:
+                            st.download_button(f"Selección ({len(selected_rows)} estaciones, {start_year}-{end_year})",
+                                               data=export_selection, mime=mime,
+                                               file_name=f"precipitacion_{layout.lower()}_{start_year}-{end_year}{extension}")
+                        with col_export2:
+                            st.download_button("Tabla de estadísticas", data=export_stats, mime=mime,
+                                               file_name=f"estadisticas_{start_year}-{end_year}{extension}")
+
+                        geo_format = st.radio("Formato de las estaciones con sus estadísticas:", list(GEO_FORMATS),
+                                              format_func=GEO_FORMATS.get, horizontal=True)
+                        extension, mime = FILE_TYPES[geo_format]
+
+                        def export_stations():
+                            return file_bytes(write_stations(station_chunks(df, selected_rows, stats_df), geo_format))
+
+                        st.download_button("Estaciones (puntos WGS84)", data=export_stations, mime=mime,
+                                           file_name=f"estaciones_{start_year}-{end_year}{extension}")
+
             # --- Pestaña para gráficos ---
-            with tab2:
+            @st.fragment
+            @profiler.timed('pestaña: Gráficos')
+            def charts_view():
                 st.header("📈 Gráficos de Precipitación")
                 st.markdown("---")
                 
                 if selected_stations_df.empty:
                     st.info("Por favor, selecciona al menos una estación en la barra lateral.")
                 else:
-                    # Controles para el eje vertical
-                    st.subheader("Opciones de Eje Vertical (Y)")
-                    axis_control = st.radio("Elige el control del eje Y:", ('Automático', 'Personalizado'))
-                    y_range = None
-                    if axis_control == 'Personalizado':
-                        df_melted_temp = selected_stations_df.melt(
-                            id_vars=['Nom_Est'],
-                            value_vars=years_to_analyze_present,
-                            var_name='Año',
-                            value_name='Precipitación'
-                        )
-                        min_precip = df_melted_temp['Precipitación'].min()
-                        max_precip = df_melted_temp['Precipitación'].max()
-                        
-                        min_y = st.number_input("Valor mínimo del eje Y:", value=float(min_precip), format="%.2f")
-                        max_y = st.number_input("Valor máximo del eje Y:", value=float(max_precip), format="%.2f")
-                        if min_y >= max_y:
-                            st.warning("El valor mínimo debe ser menor que el valor máximo.")
-                        else:
-                            y_range = (min_y, max_y)
+                    with profiler.stage('gráficos: formato largo'):
+                        df_melted = long_table.frame(long_rows, start_year, end_year)
 
                     st.subheader("Precipitación Anual por Estación")
                     chart_type = st.radio("Elige el tipo de gráfico:", ('Líneas', 'Barras'))
                     
-                    df_melted = selected_stations_df.melt(
-                        id_vars=['Nom_Est'],
-                        value_vars=years_to_analyze_present,
-                        var_name='Año',
-                        value_name='Precipitación'
-                    )
-                    df_melted['Año'] = df_melted['Año'].astype(int)
-
                     # Aplicar el rango del eje Y si es personalizado
                     y_scale = alt.Scale(domain=y_range) if y_range else alt.Scale()
+                    with profiler.stage('gráficos: Altair'):
+                        chart = annual_chart(df_melted, kind='line' if chart_type == 'Líneas' else 'bar', y_range=y_range)
 
-                    if chart_type == 'Líneas':
-                        chart = alt.Chart(df_melted).mark_line(point=True).encode(
-                            x=alt.X('Año:O', title='Año', axis=alt.Axis(format='d')),
-                            y=alt.Y('Precipitación:Q', title='Precipitación (mm)', scale=y_scale),
-                            color=alt.Color('Nom_Est', title='Estación'),
-                            tooltip=['Nom_Est', 'Año', 'Precipitación']
-                        ).interactive()
-                    else:
-                        chart = alt.Chart(df_melted).mark_bar().encode(
-                            x=alt.X('Año:O', title='Año', axis=alt.Axis(format='d')),
-                            y=alt.Y('Precipitación:Q', title='Precipitación (mm)', scale=y_scale),
-                            color=alt.Color('Nom_Est', title='Estación'),
-                            tooltip=['Nom_Est', 'Año', 'Precipitación']
-                        ).interactive()
+                    # Años rellenados con estaciones vecinas, marcados sobre el gráfico
+                    if gap_result is not None:
+                        df_filled = df_melted[gap_result.long_mask(long_rows, start_year, end_year)]
+                        if not df_filled.empty:
+                            chart = chart + alt.Chart(df_filled).mark_point(shape='diamond', size=90, filled=False, color='black').encode(
+                                x='Año:O',
+                                y=alt.Y('Precipitación:Q', scale=y_scale),
+                                tooltip=['Nom_Est', 'Año', 'Precipitación']
+                            )
+                            st.caption("◇ Años rellenados con estaciones vecinas.")
                     
-                    st.altair_chart(chart, use_container_width=True)
+                    with profiler.stage('gráficos: st.altair_chart'):
+                        st.altair_chart(chart, use_container_width=True)
+                    profiler.payload('gráficos: Altair (bytes)', lambda: json_size(chart))
 
                     st.subheader("Comparación de Precipitación entre Estaciones")
                     compare_year = st.selectbox(
@@ -305,33 +544,41 @@ if df is not None:
                         df_compare = df_compare.sort_values(by='Precipitación', ascending=True)
 
                     # Aplicar el rango del eje Y al gráfico de barras de Plotly
-                    fig_bar = px.bar(
-                        df_compare,
-                        x='Nom_Est',
-                        y='Precipitación',
-                        title=f'Precipitación en el año {compare_year}',
-                        labels={'Nom_Est': 'Estación', 'Precipitación': 'Precipitación (mm)'},
-                        range_y=y_range
-                    )
-                    st.plotly_chart(fig_bar, use_container_width=True)
-
-                    # Nuevo gráfico de caja (Boxplot)
-                    st.subheader("Análisis de Distribución (Box Plot)")
-                    if not df_melted.empty:
-                        fig_box = px.box(
-                            df_melted,
+                    with profiler.stage('gráficos: barras Plotly'):
+                        fig_bar = px.bar(
+                            df_compare,
                             x='Nom_Est',
                             y='Precipitación',
-                            title='Distribución de Precipitación por Estación',
+                            title=f'Precipitación en el año {compare_year}',
                             labels={'Nom_Est': 'Estación', 'Precipitación': 'Precipitación (mm)'},
                             range_y=y_range
                         )
-                        st.plotly_chart(fig_box, use_container_width=True)
+                    with profiler.stage('gráficos: st.plotly_chart'):
+                        st.plotly_chart(fig_bar, use_container_width=True)
+                    profiler.payload('gráficos: barras Plotly (bytes)', lambda: json_size(fig_bar))
+
+                    # Nuevo gráfico de caja (Boxplot)
+                    st.subheader("Análisis de Distribución (Box Plot)")
+                    if not df_melted.empty:
+                        with profiler.stage('gráficos: caja Plotly'):
+                            fig_box = px.box(
+                                df_melted,
+                                x='Nom_Est',
+                                y='Precipitación',
+                                title='Distribución de Precipitación por Estación',
+                                labels={'Nom_Est': 'Estación', 'Precipitación': 'Precipitación (mm)'},
+                                range_y=y_range
+                            )
+                        with profiler.stage('gráficos: st.plotly_chart'):
+                            st.plotly_chart(fig_box, use_container_width=True)
+                        profiler.payload('gráficos: caja Plotly (bytes)', lambda: json_size(fig_box))
                     else:
                         st.info("No hay datos para generar el gráfico de caja.")
 
             # --- Pestaña para el mapa ---
-            with tab3:
+            @st.fragment
+            @profiler.timed('pestaña: Mapa')
+            def map_view():
                 st.header("🌎 Mapa de Ubicación de las Estaciones")
                 st.markdown("---")
                 
@@ -361,6 +608,8 @@ if df is not None:
                             st.session_state.reset_map_colombia = False
                             st.session_state.reset_map_antioquia = False
 
+                    gdf_selected = gdf[gdf['Nom_Est'].isin(selected_stations_list)]
+
                     # Crear el mapa de Folium
                     if 'reset_map_colombia' in st.session_state and st.session_state.reset_map_colombia:
                         map_center = [4.5709, -74.2973] # Centro de Colombia
@@ -372,7 +621,6 @@ if df is not None:
                         m = folium.Map(location=map_center, zoom_start=8, tiles="CartoDB positron")
                         st.session_state.reset_map_antioquia = False
                     elif 'center_on_stations' in st.session_state and st.session_state.center_on_stations:
-                        gdf_selected = gdf[gdf['Nom_Est'].isin(selected_stations_list)]
                         if not gdf_selected.empty:
                             map_center = [gdf_selected.geometry.centroid.y.mean(), gdf_selected.geometry.centroid.x.mean()]
                             m = folium.Map(location=map_center, zoom_start=8, tiles="CartoDB positron")
@@ -384,8 +632,6 @@ if df is not None:
                             m = folium.Map(location=map_center, zoom_start=6, tiles="CartoDB positron")
                         st.session_state.center_on_stations = False
                     else:
-                        gdf_selected = gdf[gdf['Nom_Est'].isin(selected_stations_list)]
-                        
                         if not gdf_selected.empty:
                             map_center = [gdf_selected.geometry.centroid.y.mean(), gdf_selected.geometry.centroid.x.mean()]
                             m = folium.Map(location=map_center, zoom_start=8, tiles="CartoDB positron")
@@ -398,47 +644,80 @@ if df is not None:
                             map_center = [4.5709, -74.2973]
                             m = folium.Map(location=map_center, zoom_start=6, tiles="CartoDB positron")
                     
-                    gdf_selected = gdf[gdf['Nom_Est'].isin(selected_stations_list)]
-                    gdf_selected = gdf_selected.merge(stats_df, on='Nom_Est', how='left')
+                    # Contorno del filtro espacial activo
+                    if spatial_area is not None:
+                        area_layer(spatial_area).add_to(m)
 
-                    if not gdf_selected.empty:
-                        # Añadir las áreas (polígonos) del shapefile al mapa
-                        folium.GeoJson(
-                            gdf_selected.to_json(),
-                            name='Áreas del Shapefile',
-                            tooltip=folium.features.GeoJsonTooltip(fields=['Nom_Est', 'municipio', 'vereda', 'Precipitación Media (mm)'],
-                                                                    aliases=['Estación', 'Municipio', 'Vereda', 'Precipitación Media'],
-                                                                    style=("background-color: white; color: #333333; font-family: sans-serif; font-size: 12px; padding: 10px;"))
-                        ).add_to(m)
-
-                        # Añadir los marcadores circulares para las estaciones
-                        for idx, row in gdf_selected.iterrows():
-                            if pd.notna(row['Latitud']) and pd.notna(row['Longitud']):
-                                pop_up_text = (
-                                    f"<b>Estación:</b> {row['Nom_Est']}<br>"
-                                    f"<b>Municipio:</b> {row['municipio']}<br>"
-                                    f"<b>Vereda:</b> {row['vereda']}<br>"
-                                    f"<b>Precipitación Media:</b> {row['Precipitación Media (mm)']:.2f} mm"
-                                )
-                                tooltip_text = f"Estación: {row['Nom_Est']}"
+                    # Superficie interpolada a partir de las estaciones seleccionadas
+                    grid = None
+                    with st.expander("🗺️ Superficie interpolada"):
+                        show_surface = st.checkbox("Mostrar superficie de precipitación", value=False)
+                        col_surf1, col_surf2, col_surf3 = st.columns(3)
+                        with col_surf1:
+                            method_label = st.radio("Método:", ('IDW', 'Kriging ordinario'), horizontal=True)
+                        with col_surf2:
+                            resolution_km = st.number_input("Resolución de la grilla (km):", min_value=1.0, value=5.0, step=1.0)
+                        with col_surf3:
+                            max_distance_km = st.number_input("Distancia máxima a una estación (km, 0 = sin límite):",
+                                                              min_value=0.0, value=50.0, step=10.0)
+                        surface_year = st.selectbox("Año de la superficie:", ['Promedio del rango'] + years_to_analyze_present)
+                        surface_levels = st.slider("Número de clases de color:", min_value=0, max_value=15, value=8,
+                                                   help="0 muestra una escala continua.")
 
-                                icon_size = 12
+                        if show_surface and years_to_analyze_present:
+                            grid_key = (df_key, start_year, end_year, source_key(selected_rows.tobytes()),
+                                        float(resolution_km), 'idw' if method_label == 'IDW' else 'kriging',
+                                        float(max_distance_km) or None)
+                            with profiler.stage('mapa: superficie interpolada'):
+                                grid = get_precip_grid(*grid_key, long_table, selected_rows)
+                            surface = grid.surface(None if surface_year == 'Promedio del rango' else surface_year)
+                            st.caption(f"Grilla de {len(grid.lat)} × {len(grid.lon)} celdas de {grid.resolution_km:.1f} km.")
+                            if np.isfinite(surface).any():
+                                image, legend = raster_layer(surface, grid.bounds, levels=surface_levels or None)
+                                image.add_to(m)
+                                legend.add_to(m)
 
-                                folium.CircleMarker(
-                                    location=[row['Latitud'], row['Longitud']],
-                                    radius=icon_size / 2,
-                                    popup=pop_up_text,
-                                    tooltip=tooltip_text,
-                                    color='blue',
-                                    fill=True,
-                                    fill_color='blue',
-                                    fill_opacity=0.6
-                                ).add_to(m)
+                    station_info = stats_df.reindex(columns=['Nom_Est', 'municipio', 'vereda', MEAN_COL])
+                    gdf_selected = gdf_selected.drop(columns=['municipio', 'vereda', MEAN_COL], errors='ignore').merge(station_info, on='Nom_Est', how='left')
 
-                        folium_static(m)
+                    if not gdf_selected.empty:
+                        # Una sola capa de puntos agrupados; marcadores, tooltips y popups se generan en el navegador
+                        with profiler.stage('mapa: capa de estaciones'):
+                            station_layer(
+                                gdf_selected,
+                                fields=['Nom_Est', 'municipio', 'vereda', MEAN_COL],
+                                aliases=['Estación', 'Municipio', 'Vereda', 'Precipitación Media (mm)'],
+                            ).add_to(m)
+
+                        with profiler.stage('mapa: folium_static'):
+                            folium_static(m)
+                        profiler.payload('mapa: HTML (bytes)', lambda: html_size(m))
+
+                    # Promedios areales de la superficie por polígono de los límites cargados
+                    if grid is not None and boundaries is not None:
+                        st.subheader("Promedios areales de la superficie interpolada")
+                        areal_fields = [col for col in boundaries.columns if col != boundaries.geometry.name]
+                        areal_field = st.selectbox("Campo con el nombre del polígono (municipio o vereda):", areal_fields,
+                                                   key='areal_field')
+                        areal_means, areal_cells = get_areal_means(grid_key, boundaries_key, grid, boundaries)
+                        areal_df = pd.DataFrame(areal_means.round(2), columns=[str(year) for year in grid.years])
+                        # Promedio de los años con valor; los polígonos sin ningún año quedan en NaN
+                        areal_valid = np.isfinite(areal_means)
+                        areal_counts = areal_valid.sum(axis=1)
+                        areal_average = np.where(areal_valid, areal_means, 0.0).sum(axis=1) / np.maximum(areal_counts, 1)
+                        areal_df.insert(0, 'Promedio del rango', np.round(np.where(areal_counts > 0, areal_average, np.nan), 2))
+                        areal_df.insert(0, 'Celdas', areal_cells)
+                        areal_df.insert(0, areal_field, boundaries[areal_field].astype(str).to_numpy())
+                        areal_df = areal_df[areal_cells > 0]
+                        if areal_df.empty:
+                            st.info("Ningún polígono de los límites cargados cubre celdas de la grilla.")
+                        else:
+                            st.dataframe(areal_df, hide_index=True)
 
             # --- Pestaña para animaciones ---
-            with tab4:
+            @st.fragment
+            @profiler.timed('pestaña: Animación')
+            def animation_view():
                 st.header("🎬 Animación de Precipitación Anual")
                 st.markdown("---")
                 
@@ -447,61 +726,235 @@ if df is not None:
                 else:
                     animation_type = st.radio("Selecciona el tipo de animación:", ('Barras Animadas', 'Mapa Animado'))
 
+                    # Opciones de compresión: la geometría viaja una vez y cada cuadro sólo lleva sus valores
+                    with st.expander("⚙️ Opciones de la animación"):
+                        frame_step = st.slider("Mostrar un año de cada:", min_value=1, max_value=10, value=1)
+                        max_mb = st.number_input("Tamaño máximo de los cuadros (MB):", min_value=0.5, value=8.0, step=0.5)
+                        quantize = st.checkbox("Redondear a mm enteros (cuadros más livianos)", value=False)
+                    max_bytes = int(max_mb * 1024 * 1024)
+
+                    if years_to_analyze_present:
+                        anim_years, anim_values = long_table.matrix(long_rows, start_year, end_year)
+                        anim_stations = long_table.stations(long_rows)
+                        n_frames = len(frame_positions(
+                            len(anim_years),
+                            payload_bytes(1, len(anim_stations), quantize, sizes=animation_type == 'Mapa Animado'),
+                            step=frame_step,
+                            max_bytes=max_bytes
+                        ))
+                        if n_frames < len(range(0, len(anim_years), frame_step)):
+                            st.caption(f"Se muestran {n_frames} de {len(anim_years)} años para no superar {max_mb:.1f} MB.")
+
                     if animation_type == 'Barras Animadas':
                         if years_to_analyze_present:
-                            df_melted_anim = selected_stations_df.melt(
-                                id_vars=['Nom_Est'],
-                                value_vars=years_to_analyze_present,
-                                var_name='Año',
-                                value_name='Precipitación'
-                            )
-                            df_melted_anim['Año'] = df_melted_anim['Año'].astype(str)
-
                             # Aplicar el rango del eje Y si es personalizado a la animación de barras
-                            fig = px.bar(
-                                df_melted_anim,
-                                x='Nom_Est',
-                                y='Precipitación',
-                                animation_frame='Año',
-                                color='Nom_Est',
-                                title='Precipitación Anual por Estación',
-                                labels={'Nom_Est': 'Estación', 'Precipitación': 'Precipitación (mm)'},
-                                range_y=y_range
-                            )
-                            st.plotly_chart(fig, use_container_width=True)
+                            with profiler.stage('animación: barras'):
+                                fig = animated_station_bars(
+                                    anim_stations['Nom_Est'],
+                                    anim_years,
+                                    anim_values,
+                                    range_y=y_range,
+                                    quantize=quantize,
+                                    step=frame_step,
+                                    max_bytes=max_bytes
+                                )
+                            with profiler.stage('animación: st.plotly_chart'):
+                                st.plotly_chart(fig, use_container_width=True)
+                            profiler.payload('animación: Plotly (bytes)', lambda: json_size(fig))
                         else:
                             st.info("El rango de años seleccionado no contiene datos de precipitación para las estaciones seleccionadas. Por favor, ajusta el rango de años.")
                     else: # Mapa Animado
                         if years_to_analyze_present:
-                            df_melted_map = selected_stations_df.melt(
-                                id_vars=['Nom_Est', 'Latitud', 'Longitud'],
-                                value_vars=years_to_analyze_present,
-                                var_name='Año',
-                                value_name='Precipitación'
-                            )
-                            
+                            # Coordenadas WGS84 (LAT_WGS84/LON_WGS84), reproyectadas una sola vez al cargar el CSV
                             # Aplicar el rango de color del eje Y si es personalizado a la animación del mapa
-                            fig = px.scatter_mapbox(
-                                df_melted_map,
-                                lat="Latitud",
-                                lon="Longitud",
-                                hover_name="Nom_Est",
-                                hover_data={"Precipitación": True, "Año": True, "Latitud": False, "Longitud": False},
-                                color="Precipitación",
-                                size="Precipitación",
-                                color_continuous_scale=px.colors.sequential.Bluyl,
-                                animation_frame="Año",
-                                mapbox_style="open-street-map",
-                                zoom=7,
-                                title="Precipitación Anual Animada en el Mapa",
-                                range_color=y_range
-                            )
-                            fig.update_layout(
-                                mapbox_style="open-street-map",
-                                mapbox_zoom=7,
-                                mapbox_center={"lat": df_melted_map['Latitud'].mean(), "lon": df_melted_map['Longitud'].mean()},
-                            )
-                            fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-                            st.plotly_chart(fig, use_container_width=True)
+                            with profiler.stage('animación: mapa'):
+                                fig = animated_station_map(
+                                    anim_stations['Nom_Est'],
+                                    anim_stations[LAT_WGS84].to_numpy(),
+                                    anim_stations[LON_WGS84].to_numpy(),
+                                    anim_years,
+                                    anim_values,
+                                    value_range=y_range,
+                                    quantize=quantize,
+                                    step=frame_step,
+                                    max_bytes=max_bytes
+                                )
+                            with profiler.stage('animación: st.plotly_chart'):
+                                st.plotly_chart(fig, use_container_width=True)
+                            profiler.payload('animación: Plotly (bytes)', lambda: json_size(fig))
                         else:
                             st.info("El rango de años seleccionado no contiene datos de precipitación para las estaciones seleccionadas. Por favor, ajusta el rango de años.")
+
+            # --- Pestaña para la agregación zonal ---
+            @st.fragment
+            @profiler.timed('pestaña: Agregación Zonal')
+            def zonal_view():
+                st.header("🗂️ Agregación Zonal")
+                st.markdown("---")
+
+                col_zonal1, col_zonal2, col_zonal3 = st.columns(3)
+                with col_zonal1:
+                    zonal_column = st.selectbox("Agrupar por:", zonal_index.columns, format_func=GROUP_COLUMNS.get)
+                with col_zonal2:
+                    zonal_stat = st.selectbox("Estadístico:", list(STATISTICS), format_func=STATISTICS.get)
+                with col_zonal3:
+                    zonal_scope = st.radio("Estaciones:", ('Todas', 'Filtradas', 'Seleccionadas'), horizontal=True)
+
+                zonal_rows = {'Todas': None, 'Filtradas': np.flatnonzero(loc_mask), 'Seleccionadas': selected_rows}[zonal_scope]
+                zonal = zonal_index.aggregate(zonal_column, zonal_rows, start_year, end_year)
+
+                if not len(zonal):
+                    st.info("No hay estaciones para agregar con la selección actual.")
+                else:
+                    group_label = GROUP_COLUMNS[zonal_column]
+                    zonal_table = zonal.frame(zonal_stat)
+                    st.subheader(f"{STATISTICS[zonal_stat]} por {group_label.lower()}")
+                    st.dataframe(zonal_table, hide_index=True)
+                    st.download_button(
+                        "Descargar tabla (CSV)",
+                        zonal_table.to_csv(index=False).encode('utf-8'),
+                        file_name=f"agregacion_{zonal_column}_{start_year}_{end_year}.csv",
+                        mime='text/csv',
+                    )
+
+                    # Series por grupo; por defecto los grupos con más estaciones
+                    st.subheader("Series por grupo")
+                    default_groups = list(zonal.labels[np.argsort(-zonal.n_stations, kind='stable')[:5]])
+                    zonal_groups = st.multiselect("Grupos a graficar:", list(zonal.labels), default=default_groups)
+                    if zonal_groups:
+                        series = zonal.long_frame(zonal_stat, zonal_groups)
+                        chart = alt.Chart(series).mark_line(point=True).encode(
+                            x=alt.X('Año:O', title='Año'),
+                            y=alt.Y(f'{STATISTICS[zonal_stat]}:Q', title=STATISTICS[zonal_stat]),
+                            color=alt.Color(f'{group_label}:N', title=group_label),
+                            tooltip=[group_label, 'Año', alt.Tooltip(f'{STATISTICS[zonal_stat]}:Q', format='.2f')]
+                        ).interactive()
+                        st.altair_chart(chart, use_container_width=True)
+
+                    # Mapa coroplético: cruza los nombres de los grupos con un campo de los límites cargados
+                    st.subheader("Mapa coroplético")
+                    if boundaries is None:
+                        st.info("Carga los límites (municipios o veredas) en la sección 'Cargar Datos' para ver el mapa coroplético.")
+                    else:
+                        boundary_fields = [col for col in boundaries.columns if col != boundaries.geometry.name]
+                        choropleth_field = st.selectbox("Campo de los límites con el nombre del grupo:", boundary_fields,
+                                                        key='choropleth_field')
+                        group_values = dict(zip((normalize_name(label) for label in zonal.labels), zonal.range_mean(zonal_stat)))
+                        polygon_values = np.array([group_values.get(normalize_name(name), np.nan)
+                                                   for name in boundaries[choropleth_field]], dtype='float64')
+                        if not np.isfinite(polygon_values).any():
+                            st.warning(f"Ningún valor del campo '{choropleth_field}' coincide con los grupos de {group_label.lower()}.")
+                        else:
+                            min_lon, min_lat, max_lon, max_lat = boundaries.total_bounds
+                            m_zonal = folium.Map(tiles="CartoDB positron")
+                            m_zonal.fit_bounds([[min_lat, min_lon], [max_lat, max_lon]])
+                            layer, legend = choropleth_layer(boundaries, polygon_values, choropleth_field,
+                                                             f"{STATISTICS[zonal_stat]} ({start_year}-{end_year})")
+                            layer.add_to(m_zonal)
+                            legend.add_to(m_zonal)
+                            with profiler.stage('zonal: folium_static'):
+                                folium_static(m_zonal)
+                            profiler.payload('zonal: HTML del mapa (bytes)', lambda: html_size(m_zonal))
+
+            # --- Pestaña para tendencias y anomalías ---
+            @st.fragment
+            @profiler.timed('pestaña: Tendencias')
+            def trends_view():
+                st.header("📉 Tendencias y Anomalías")
+                st.markdown("---")
+
+                if not years_to_analyze_present or end_year - start_year < 2:
+                    st.info("Elige un rango de al menos tres años para calcular tendencias.")
+                    return
+
+                col_trend1, col_trend2, col_trend3 = st.columns(3)
+                with col_trend1:
+                    alpha = st.selectbox("Nivel de significancia:", (0.01, 0.05, 0.1), index=1)
+                with col_trend2:
+                    threshold = st.slider("Umbral de anomalía (desviaciones estándar):", 0.5, 2.5, 1.0, step=0.25,
+                                          help="Años con anomalía estandarizada por encima (húmedos) o por debajo (secos) del umbral.")
+                with col_trend3:
+                    trend_scope = st.radio("Estaciones:", ('Toda la red', 'Seleccionadas'), horizontal=True, key='trend_scope')
+
+                # Se calcula una vez por rango de años para toda la red; aquí sólo se filtra
+                with profiler.stage('tendencias: Mann-Kendall'):
+                    trends = get_trends(df_key, start_year, end_year, long_table)
+                trend_rows = np.arange(len(df)) if trend_scope == 'Toda la red' else selected_rows
+                if not len(trend_rows):
+                    st.info("Por favor, selecciona al menos una estación en la barra lateral.")
+                    return
+
+                trend_table = trends.frame(trend_rows, alpha=alpha, threshold=threshold)
+                trend_table.insert(0, 'municipio', df['municipio'].to_numpy()[trend_rows])
+                trend_table.insert(0, 'Nom_Est', df['Nom_Est'].to_numpy()[trend_rows])
+
+                counts = trend_table[TREND_COL].value_counts()
+                col_count1, col_count2, col_count3 = st.columns(3)
+                col_count1.metric(INCREASING, int(counts.get(INCREASING, 0)))
+                col_count2.metric(DECREASING, int(counts.get(DECREASING, 0)))
+                col_count3.metric(NO_TREND, int(counts.get(NO_TREND, 0)))
+
+                st.subheader("Mann-Kendall y pendiente de Sen por estación")
+                st.dataframe(trend_table, hide_index=True)
+
+                st.subheader("Mapa de tendencias")
+                m_trend = folium.Map(tiles="CartoDB positron")
+                trend_lat = df[LAT_WGS84].to_numpy()[trend_rows]
+                trend_lon = df[LON_WGS84].to_numpy()[trend_rows]
+                m_trend.fit_bounds([[trend_lat.min(), trend_lon.min()], [trend_lat.max(), trend_lon.max()]])
+                fields = ['Nom_Est', TREND_COL, SLOPE_COL, P_COL]
+                point_layer(
+                    trend_lat, trend_lon,
+                    {**{field: trend_table[field] for field in fields},
+                     'color': trend_table[TREND_COL].map(TREND_COLORS)},
+                    fields=fields,
+                    aliases=['Estación', 'Tendencia', 'Pendiente de Sen (mm/año)', 'Valor p'],
+                    name='Tendencias',
+                    color_field='color',
+                ).add_to(m_trend)
+                with profiler.stage('tendencias: folium_static'):
+                    folium_static(m_trend)
+                profiler.payload('tendencias: HTML del mapa (bytes)', lambda: html_size(m_trend))
+                st.caption(f":blue[● {INCREASING}] · :red[● {DECREASING}] · :gray[● {NO_TREND}] "
+                           f"(significancia {alpha})")
+
+                # Anomalías estandarizadas por estación y año
+                st.subheader("Anomalías estandarizadas (z-score)")
+                max_heatmap_stations = 100
+                heat_rows = trend_rows[:max_heatmap_stations]
+                if len(trend_rows) > max_heatmap_stations:
+                    st.caption(f"Se muestran las primeras {max_heatmap_stations} de {len(trend_rows)} estaciones.")
+                anomalies = pd.DataFrame({
+                    'Nom_Est': np.repeat(df['Nom_Est'].to_numpy()[heat_rows], len(trends.years)),
+                    'Año': np.tile(trends.years, len(heat_rows)),
+                    'Anomalía': np.round(trends.zscores[heat_rows].ravel(), 2),
+                })
+                heatmap = alt.Chart(anomalies).mark_rect().encode(
+                    x=alt.X('Año:O', title='Año'),
+                    y=alt.Y('Nom_Est:N', title='Estación'),
+                    color=alt.Color('Anomalía:Q', scale=alt.Scale(scheme='redblue', domainMid=0), title='z-score'),
+                    tooltip=['Nom_Est', 'Año', 'Anomalía']
+                )
+                st.altair_chart(heatmap, use_container_width=True)
+
+            for tab, view in ((tab1, tabulated_view), (tab2, charts_view), (tab3, map_view),
+                              (tab4, animation_view), (tab5, zonal_view), (tab6, trends_view)):
+                if tab.open:
+                    with tab:
+                        view()
+
+# --- Panel de diagnóstico: tiempos, memoria y tamaños de la recarga ---
+profiler.finish()
+with st.sidebar.expander("🛠️ Diagnóstico de rendimiento", expanded=profiler.enabled):
+    st.checkbox("Medir cada recarga", value=profile_default, key='perfilado',
+                help="Tiempo (y pico de memoria, con LLUVIA_PROFILE_MEMORY=1) de cada etapa y tamaño de los gráficos y mapas enviados al navegador.")
+    if profiler.enabled:
+        st.dataframe(profiler.frame(), hide_index=True)
+        notes = [f"Recarga {profiler.run_id}."]
+        if not TRACE_MEMORY:
+            notes.append("Para medir la memoria, inicie la aplicación con `LLUVIA_PROFILE_MEMORY=1`.")
+        if profiler.log_path:
+            notes.append(f"Las recargas de una sola pestaña se registran en `{profiler.log_path}`.")
+        else:
+            notes.append("Para guardar las mediciones, defina `LLUVIA_PROFILE_LOG`.")
+        st.caption(" ".join(notes))
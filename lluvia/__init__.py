@@ -0,0 +1 @@
+"""Utilidades del visor de precipitación: carga, limpieza y cálculo sobre los datos de estaciones."""
@@ -0,0 +1,167 @@
+"""Animaciones Plotly comprimidas por cuadro (mapa de estaciones y barras).
+
+``px.scatter_mapbox``/``px.bar`` con ``animation_frame`` repiten en cada cuadro todas
+las columnas de cada estación (lat, lon, nombre, datos del hover). Aquí la traza base
+lleva la geometría y los nombres una sola vez y cada cuadro sólo actualiza los arreglos
+de valores de esa traza:
+
+* los valores viajan como arreglos tipados (``float32``, o ``uint16`` si se cuantizan a
+  mm enteros) que Plotly serializa en base64;
+* el tamaño de los marcadores se cuantiza a píxeles en ``uint8``;
+* se pueden saltar años (``step``) y limitar el número de cuadros a un presupuesto de bytes.
+"""
+import math
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Presupuesto por defecto para los arreglos de todos los cuadros
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+MIN_MARKER_SIZE = 4
+MAX_MARKER_SIZE = 20
+
+
+def encode_values(values, quantize=False):
+    """Arreglo compacto para un cuadro: ``uint16`` en mm enteros si se cuantiza y cabe, ``float32`` en otro caso."""
+    values = np.asarray(values)
+    if quantize:
+        rounded = np.rint(values)
+        if np.isfinite(rounded).all() and (rounded >= 0).all() and (rounded <= np.iinfo(np.uint16).max).all():
+            return rounded.astype(np.uint16)
+        return rounded.astype(np.float32)
+    return values.astype(np.float32, copy=False)
+
+
+def frame_positions(n_years, bytes_per_frame, step=1, max_bytes=DEFAULT_MAX_BYTES):
+    """Posiciones de los años que se animan: uno de cada ``step`` y, si hace falta, menos para respetar ``max_bytes``.
+
+    Siempre se conserva al menos un cuadro.
+    """
+    step = max(1, int(step))
+    if max_bytes and bytes_per_frame > 0:
+        max_frames = max(1, int(max_bytes // bytes_per_frame))
+        step = max(step, math.ceil(n_years / max_frames))
+    return np.arange(0, n_years, step)
+
+
+def payload_bytes(n_frames, n_stations, quantize=False, sizes=False):
+    """Tamaño aproximado (antes de base64) de los arreglos de todos los cuadros."""
+    per_value = (2 if quantize else 4) + (1 if sizes else 0)
+    return n_frames * n_stations * per_value
+
+
+def _value_range(values, value_range):
+    if value_range:
+        return value_range
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return (0.0, 1.0)
+    return (float(finite.min()), float(finite.max()))
+
+
+def _marker_sizes(values, value_range):
+    """Tamaño en píxeles (uint8) proporcional a la raíz del valor, como el área en ``px.scatter``."""
+    low, high = value_range
+    span = high - low if high > low else 1.0
+    scaled = np.sqrt(np.clip((np.nan_to_num(values, nan=low) - low) / span, 0.0, 1.0))
+    return np.rint(MIN_MARKER_SIZE + scaled * (MAX_MARKER_SIZE - MIN_MARKER_SIZE)).astype(np.uint8)
+
+
+def _animation_controls(frame_names, duration=500, redraw=True):
+    """Botones de reproducción y deslizador equivalentes a los de Plotly Express.
+
+    Los mapas necesitan ``redraw=True``; las barras pueden animarse sin redibujar.
+    """
+    play = dict(frame=dict(duration=duration, redraw=redraw), fromcurrent=True, transition=dict(duration=0))
+    pause = dict(frame=dict(duration=0, redraw=False), mode='immediate', transition=dict(duration=0))
+    updatemenus = [dict(
+        type='buttons', direction='left', showactive=False, x=0.1, y=0, xanchor='right', yanchor='top',
+        pad=dict(r=10, t=70),
+        buttons=[dict(label='&#9654;', method='animate', args=[None, play]),
+                 dict(label='&#9724;', method='animate', args=[[None], pause])],
+    )]
+    sliders = [dict(
+        active=0, x=0.1, y=0, len=0.9, xanchor='left', yanchor='top', pad=dict(b=10, t=60),
+        currentvalue=dict(prefix='Año='),
+        steps=[dict(label=name, method='animate',
+                    args=[[name], dict(frame=dict(duration=0, redraw=redraw), mode='immediate', transition=dict(duration=0))])
+               for name in frame_names],
+    )]
+    return updatemenus, sliders
+
+
+def animated_station_map(names, lat, lon, years, values, value_range=None, quantize=False, step=1,
+                         max_bytes=DEFAULT_MAX_BYTES, title="Precipitación Anual Animada en el Mapa",
+                         zoom=7, colorscale=px.colors.sequential.Bluyl):
+    """Mapa animado con la geometría en la traza base y sólo color/tamaño en cada cuadro.
+
+    ``values`` es la matriz (años × estaciones) en el mismo orden que ``names``/``lat``/``lon``.
+    """
+    values = np.asarray(values)
+    bytes_per_frame = payload_bytes(1, values.shape[1], quantize=quantize, sizes=True)
+    positions = frame_positions(len(years), bytes_per_frame, step=step, max_bytes=max_bytes)
+    value_range = _value_range(values[positions], value_range)
+    frame_names = [str(int(years[pos])) for pos in positions]
+
+    def marker(row):
+        return dict(color=encode_values(row, quantize), size=_marker_sizes(row, value_range))
+
+    first = values[positions[0]]
+    fig = go.Figure(
+        data=[go.Scattermap(
+            lat=np.asarray(lat, dtype=np.float32),
+            lon=np.asarray(lon, dtype=np.float32),
+            mode='markers',
+            text=list(names),
+            hovertemplate="<b>%{text}</b><br>Precipitación (mm)=%{marker.color}<extra></extra>",
+            marker=dict(**marker(first), colorscale=colorscale, cmin=value_range[0], cmax=value_range[1],
+                        showscale=True, colorbar=dict(title='Precipitación')),
+        )],
+        frames=[go.Frame(name=name, traces=[0], data=[go.Scattermap(marker=marker(values[pos]))])
+                for name, pos in zip(frame_names, positions)],
+    )
+    updatemenus, sliders = _animation_controls(frame_names)
+    fig.update_layout(
+        title=title,
+        map=dict(style='open-street-map', zoom=zoom,
+                 center=dict(lat=float(np.nanmean(lat)), lon=float(np.nanmean(lon)))),
+        updatemenus=updatemenus,
+        sliders=sliders,
+        margin={"r": 0, "t": 40, "l": 0, "b": 0},
+    )
+    return fig
+
+
+def animated_station_bars(names, years, values, range_y=None, quantize=False, step=1,
+                          max_bytes=DEFAULT_MAX_BYTES, title='Precipitación Anual por Estación'):
+    """Barras animadas con los nombres y colores en la traza base y sólo ``y`` en cada cuadro."""
+    values = np.asarray(values)
+    bytes_per_frame = payload_bytes(1, values.shape[1], quantize=quantize)
+    positions = frame_positions(len(years), bytes_per_frame, step=step, max_bytes=max_bytes)
+    frame_names = [str(int(years[pos])) for pos in positions]
+    if range_y is None:
+        low, high = _value_range(values[positions], None)
+        range_y = (min(0.0, low), high * 1.05 if high > 0 else 1.0)
+
+    palette = px.colors.qualitative.Plotly
+    fig = go.Figure(
+        data=[go.Bar(
+            x=list(names),
+            y=encode_values(values[positions[0]], quantize),
+            marker=dict(color=[palette[i % len(palette)] for i in range(len(names))]),
+            hovertemplate="Estación=%{x}<br>Precipitación (mm)=%{y}<extra></extra>",
+        )],
+        frames=[go.Frame(name=name, traces=[0], data=[go.Bar(y=encode_values(values[pos], quantize))])
+                for name, pos in zip(frame_names, positions)],
+    )
+    updatemenus, sliders = _animation_controls(frame_names, redraw=False)
+    fig.update_layout(
+        title=title,
+        xaxis=dict(title='Estación'),
+        yaxis=dict(title='Precipitación (mm)', range=list(range_y)),
+        updatemenus=updatemenus,
+        sliders=sliders,
+    )
+    return fig
@@ -0,0 +1,215 @@
+"""Procesamiento por lotes, sin la interfaz de Streamlit.
+
+Cada trabajo es un grupo de estaciones (p. ej. un municipio) y un rango de años. Los
+trabajos se reparten entre procesos; cada proceso lee los datos y arma los índices
+(``StatsCube``, ``LongTable``, ``ZonalIndex``) una sola vez y luego atiende todos los
+trabajos que le tocan. Sólo se leen las columnas que usan los trabajos y los años de
+sus rangos (todos si se rellenan años, que usa el registro completo de los vecinos);
+con un store Parquet (``lluvia.store``) el resto ni se decodifica. Por cada trabajo se escribe, en
+``<salida>/<columna>/<grupo>_<inicio>-<fin>/``:
+
+* ``estadisticas.csv`` (o ``.parquet``): la tabla por estación de la pestaña tabulada;
+* ``serie.png`` y ``serie.html``: la serie anual por estación (Matplotlib y Altair);
+* ``mapa.html``: las estaciones del grupo en un mapa de Folium.
+
+Al final se escribe ``resumen.csv`` con una fila por trabajo.
+
+Ejemplo::
+
+    python -m lluvia.batch mapaCV.csv --filter departamento=Antioquia --years 1981-2010 --years 1991-2020 -j 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import folium
+import numpy as np
+import pandas as pd
+
+from lluvia.charts import annual_chart, annual_chart_png
+from lluvia.gaps import COVERAGE_COL, METHODS as GAP_METHODS, GapFiller
+from lluvia.loading import LAT_WGS84, LON_WGS84
+from lluvia.long_table import STATION_COL, LongTable
+from lluvia.maps import point_layer
+from lluvia.stats import INFO_COLUMNS, MEAN_COL, StatsCube, stats_table
+from lluvia.store import read_stations, source_years
+from lluvia.zonal import GROUP_COLUMNS, ZonalIndex, normalize_name
+
+STATS_FORMATS = ('csv', 'parquet')
+
+# Estado de cada proceso de trabajo, armado una sola vez por ``_init_worker``
+_context = {}
+
+
+class BatchContext:
+    """Datos e índices compartidos por todos los trabajos de un proceso."""
+
+    def __init__(self, source, fill_method=None, min_correlation=0.5, filters=None, columns=None, years=None):
+        # El relleno necesita todos los años de los vecinos
+        df = read_stations(source, columns, None if fill_method is not None else years)
+        if fill_method is not None:
+            df = GapFiller(df).fill(fill_method, min_correlation=min_correlation).to_frame(df)
+        self.df = df
+        self.zonal_index = ZonalIndex(df)
+        self.stats_cube = StatsCube.from_frame(df)
+        self.long_table = LongTable(df)
+        self.base_mask = filter_mask(self.zonal_index, filters)
+
+    def rows(self, column, group):
+        return np.flatnonzero(self.base_mask & self.zonal_index.mask(column, [group]))
+
+
+def job_columns(group_by, filters=None):
+    """Columnas que usan los trabajos: identificación, cobertura, coordenadas, agrupación y filtros."""
+    return list(dict.fromkeys([*INFO_COLUMNS, COVERAGE_COL, LAT_WGS84, LON_WGS84, group_by, *(filters or {})]))
+
+
+def filter_mask(zonal_index, filters=None):
+    """Máscara de las estaciones que cumplen todos los filtros ``columna -> valores``."""
+    mask = np.ones(zonal_index.n_stations, dtype=bool)
+    for column, labels in (filters or {}).items():
+        mask &= zonal_index.mask(column, labels)
+    return mask
+
+
+def group_labels(zonal_index, column, mask):
+    """Grupos de ``column`` con al menos una estación en ``mask``."""
+    codes = zonal_index.codes[column][mask]
+    return zonal_index.labels[column][np.unique(codes[codes >= 0])].tolist()
+
+
+def parse_years(text):
+    """``'1991-2020'`` -> ``(1991, 2020)``; un solo año da un rango de un año."""
+    start, _, end = text.partition('-')
+    start = int(start)
+    end = int(end) if end else start
+    if end < start:
+        raise argparse.ArgumentTypeError(f"Rango de años invertido: {text!r}")
+    return start, end
+
+
+def parse_filter(text):
+    """``'departamento=Antioquia'`` -> ``('departamento', 'Antioquia')``."""
+    column, sep, value = text.partition('=')
+    if not sep or column not in GROUP_COLUMNS:
+        raise argparse.ArgumentTypeError(f"Filtro no válido: {text!r} (use COLUMNA=VALOR con COLUMNA en {', '.join(GROUP_COLUMNS)})")
+    return column, value
+
+
+def job_directory(output_dir, column, group, start_year, end_year):
+    slug = '_'.join(normalize_name(group).lower().replace('/', ' ').split()) or 'sin_nombre'
+    return os.path.join(output_dir, column, f"{slug}_{start_year}-{end_year}")
+
+
+def station_map(df, rows, stats):
+    """Mapa de Folium con las estaciones de ``rows`` y su precipitación media en el rango."""
+    lat = df[LAT_WGS84].to_numpy()[rows]
+    lon = df[LON_WGS84].to_numpy()[rows]
+    fmap = folium.Map(location=[float(np.nanmean(lat)), float(np.nanmean(lon))], zoom_start=9)
+    properties = {'Nom_Est': df['Nom_Est'].to_numpy()[rows], 'municipio': df['municipio'].astype(str).to_numpy()[rows],
+                  MEAN_COL: stats[MEAN_COL].to_numpy()[:len(rows)]}
+    point_layer(lat, lon, properties, fields=list(properties), aliases=['Estación:', 'Municipio:', 'Media (mm):'],
+                cluster=len(rows) > 50).add_to(fmap)
+    fmap.fit_bounds([[float(np.nanmin(lat)), float(np.nanmin(lon))], [float(np.nanmax(lat)), float(np.nanmax(lon))]])
+    return fmap
+
+
+def run_job(context, output_dir, column, group, start_year, end_year, stats_format='csv', charts=True, maps=True):
+    """Procesa un trabajo y devuelve su fila del resumen."""
+    started = time.perf_counter()
+    rows = context.rows(column, group)
+    directory = job_directory(output_dir, column, group, start_year, end_year)
+    os.makedirs(directory, exist_ok=True)
+    files = []
+
+    stats, summary = stats_table(context.df, context.stats_cube, start_year, end_year, rows)
+    path = os.path.join(directory, f"estadisticas.{stats_format}")
+    if stats_format == 'parquet':
+        stats.to_parquet(path, index=False)
+    else:
+        stats.to_csv(path, index=False)
+    files.append(path)
+
+    if charts and len(rows):
+        years, values = context.long_table.matrix(rows, start_year, end_year)
+        names = context.long_table.stations(rows)[STATION_COL]
+        title = f"{GROUP_COLUMNS.get(column, column)} {group}, {start_year}-{end_year}"
+        files.append(annual_chart_png(years, values, names, os.path.join(directory, 'serie.png'), title=title))
+        path = os.path.join(directory, 'serie.html')
+        annual_chart(context.long_table.frame(rows, start_year, end_year)).properties(title=title).save(path)
+        files.append(path)
+
+    if maps and len(rows):
+        path = os.path.join(directory, 'mapa.html')
+        station_map(context.df, rows, stats).save(path)
+        files.append(path)
+
+    return {
+        'columna': column,
+        'grupo': group,
+        'inicio': start_year,
+        'fin': end_year,
+        'estaciones': len(rows),
+        MEAN_COL: summary.get(MEAN_COL, np.nan),
+        'archivos': len(files),
+        'directorio': directory,
+        'segundos': round(time.perf_counter() - started, 3),
+    }
+
+
+def _init_worker(source, fill_method, min_correlation, filters, columns, years):
+    _context['context'] = BatchContext(source, fill_method, min_correlation, filters, columns, years)
+
+
+def _run_worker_job(args):
+    return run_job(_context['context'], *args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcula estadísticas y exporta gráficos y mapas por grupo de estaciones y rango de años.")
+    parser.add_argument('source', help="CSV de estaciones separado por ';' o store Parquet (ver lluvia.store)")
+    parser.add_argument('--group-by', default='municipio', choices=list(GROUP_COLUMNS), help="Columna de agrupación (por defecto, municipio)")
+    parser.add_argument('--groups', nargs='+', help="Grupos a procesar (por defecto, todos los que queden tras los filtros)")
+    parser.add_argument('--years', action='append', type=parse_years, metavar='INICIO-FIN',
+                        help="Rango de años; se puede repetir (por defecto, todos los años)")
+    parser.add_argument('--filter', action='append', type=parse_filter, default=[], metavar='COLUMNA=VALOR',
+                        help="Limita las estaciones (p. ej. departamento=Antioquia); se puede repetir")
+    parser.add_argument('--fill', choices=list(GAP_METHODS), help="Rellena los años faltantes con el método indicado")
+    parser.add_argument('--min-correlation', type=float, default=0.5, help="Correlación mínima de los vecinos al rellenar")
+    parser.add_argument('-o', '--output-dir', default='salida', help="Directorio de salida (por defecto, ./salida)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Número de procesos")
+    parser.add_argument('--stats-format', choices=STATS_FORMATS, default='csv')
+    parser.add_argument('--no-charts', dest='charts', action='store_false', help="No exporta los gráficos")
+    parser.add_argument('--no-map', dest='maps', action='store_false', help="No exporta los mapas")
+    args = parser.parse_args(argv)
+
+    filters = {}
+    for column, value in args.filter:
+        filters.setdefault(column, []).append(value)
+
+    # El proceso principal sólo arma la lista de trabajos; los cálculos se hacen en los procesos
+    df = read_stations(args.source, columns=[args.group_by, *filters], years=[])
+    zonal_index = ZonalIndex(df, columns=[args.group_by, *filters])
+    groups = args.groups or group_labels(zonal_index, args.group_by, filter_mask(zonal_index, filters))
+    all_years = [int(year) for year in source_years(args.source)]
+    year_ranges = args.years or [(min(all_years), max(all_years))]
+    jobs = [(args.output_dir, args.group_by, group, start, end, args.stats_format, args.charts, args.maps)
+            for group in groups for start, end in year_ranges]
+    del df, zonal_index
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=_init_worker,
+                             initargs=(args.source, args.fill, args.min_correlation, filters,
+                                       job_columns(args.group_by, filters), year_ranges)) as executor:
+        results = list(executor.map(_run_worker_job, jobs, chunksize=max(1, len(jobs) // (4 * max(1, args.jobs)))))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary_path = os.path.join(args.output_dir, 'resumen.csv')
+    pd.DataFrame(results).to_csv(summary_path, index=False)
+    print(f"{len(results)} trabajos ({len(groups)} grupos × {len(year_ranges)} rangos) en "
+          f"{time.perf_counter() - started:.1f} s -> {summary_path}")
+
+
+if __name__ == '__main__':
+    main()
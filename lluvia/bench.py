@@ -0,0 +1,307 @@
+"""Mediciones de rendimiento sobre redes sintéticas de estaciones.
+
+Genera CSV con la forma de ``mapaCV.csv`` (separados por ';', una columna por año) y
+shapefiles de puntos comprimidos en ZIP para cada tamaño de red, y mide cada etapa que
+la aplicación ejecuta al cargar los datos y en cada recarga: lectura del CSV, lectura y
+reproyección del shapefile, lectura completa y proyectada (como ``lluvia.batch``) del
+store Parquet, índices por conjunto de datos (incluido el de búsqueda), filtros y
+búsqueda de la barra lateral, estadísticas, formato largo, gráficos de Altair y Plotly
+y mapa de Folium.
+
+Cada etapa se repite ``--repeat`` veces (se informan el mínimo y la mediana) y se ejecuta
+una vez más bajo ``tracemalloc`` para medir el pico de memoria reservada desde Python y
+NumPy (la memoria interna de Arrow no se cuenta). Para los gráficos y el mapa también se
+informa el tamaño serializado que recibe el navegador. Los resultados se escriben como
+JSON Lines, un registro por tamaño y etapa, para comparar versiones::
+
+    python -m lluvia.bench --stations 1000 10000 100000 -o resultados.jsonl
+"""
+import argparse
+import datetime
+import importlib.metadata
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import zipfile
+
+import altair as alt
+import folium
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import pyproj
+import shapefile
+
+from lluvia.charts import annual_chart
+from lluvia.batch import job_columns
+from lluvia.loading import SOURCE_CRS, read_shapefile_zip, read_stations_csv
+from lluvia.long_table import PRECIP_COL, STATION_COL, LongTable
+from lluvia.maps import station_layer
+from lluvia.profiling import json_size
+from lluvia.search import StationSearch
+from lluvia.stats import MEAN_COL, StatsCube, stats_table
+from lluvia.store import read_stations, store_path, write_store, year_columns
+from lluvia.zonal import ZonalIndex
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_YEARS = (1970, 2021)
+
+# Extensión aproximada de la red real en CMT12 (metros)
+X_RANGE = (4_480_000.0, 5_000_000.0)
+Y_RANGE = (2_050_000.0, 2_600_000.0)
+
+# Tamaño de celda de ``Celda_XY`` (metros)
+CELL_SIZE = 50_000.0
+
+DEPARTAMENTOS = ('Antioquia', 'Chocó', 'Córdoba', 'Caldas', 'Risaralda')
+SUBREGIONES = ('ORIENTE', 'NORTE', 'OCCIDENTE', 'URABA', 'NORDESTE', 'SUROESTE', 'BAJO CAUCA', 'Valle de Aburrá')
+AREAS = ('MagdalenaCauca', 'Caribe', 'Pacifico')
+
+
+def synthetic_stations(n_stations, years=DEFAULT_YEARS, missing_fraction=0.05, seed=0):
+    """Tabla de estaciones con las columnas de ``mapaCV.csv`` y valores anuales aleatorios.
+
+    Hay un municipio por cada ~8 estaciones y un 5 % de años vacíos (y otro tanto en 0)
+    para que el relleno y las estadísticas encuentren huecos como en los datos reales.
+    """
+    rng = np.random.default_rng(seed)
+    year_labels = [str(year) for year in range(years[0], years[1] + 1)]
+    ids = np.arange(10_000_000, 10_000_000 + n_stations)
+    x = rng.uniform(*X_RANGE, n_stations).round()
+    y = rng.uniform(*Y_RANGE, n_stations).round()
+
+    values = rng.integers(0, 101, (n_stations, len(year_labels))).astype('float64')
+    values[rng.random(values.shape) < missing_fraction] = np.nan
+    values[rng.random(values.shape) < missing_fraction] = 0.0
+    coverage = np.round(100.0 * (np.isfinite(values) & (values != 0)).mean(axis=1))
+
+    n_municipios = max(10, n_stations // 8)
+    municipio = rng.integers(0, n_municipios, n_stations)
+    cell_x = ((x - X_RANGE[0]) // CELL_SIZE).astype(int)
+    cell_y = ((y - Y_RANGE[0]) // CELL_SIZE).astype(int)
+    vereda = np.where(rng.random(n_stations) < 0.3, None,
+                      np.char.add('VEREDA ', rng.integers(0, n_stations, n_stations).astype(str)).astype(object))
+
+    df = pd.DataFrame({'Id_estacion': ids, 'Nom_Est': [f"ESTACION {i} [{i}]" for i in ids]})
+    df = pd.concat([df, pd.DataFrame(values, columns=year_labels)], axis=1)
+    celda = pd.Series(cell_x.astype(str)).str.cat(cell_y.astype(str), sep='-')
+    return df.assign(
+        Porc_datos=coverage,
+        Celda_XY='(' + celda + ')',
+        Cant_Est=rng.integers(1, 30, n_stations),
+        departamento=np.asarray(DEPARTAMENTOS)[municipio % len(DEPARTAMENTOS)],
+        municipio=np.char.add('Municipio ', municipio.astype(str)),
+        AH=np.asarray(AREAS)[municipio % len(AREAS)],
+        ZSZH=np.char.add('Zona ', (municipio // 4).astype(str)),
+        Longitud=x,
+        Latitud=y,
+        vereda=vereda,
+        SUBREGION=np.asarray(SUBREGIONES)[municipio % len(SUBREGIONES)],
+    )
+
+
+def write_csv(df, path):
+    """Escribe la tabla como ``mapaCV.csv``: separada por ';' y en UTF-8 con BOM."""
+    df.to_csv(path, sep=';', index=False, encoding='utf-8-sig')
+    return path
+
+
+def shapefile_zip_bytes(df, name='estaciones'):
+    """Shapefile de puntos (CMT12) de las estaciones comprimido en un ZIP en memoria."""
+    shp, shx, dbf = io.BytesIO(), io.BytesIO(), io.BytesIO()
+    with shapefile.Writer(shp=shp, shx=shx, dbf=dbf, shapeType=shapefile.POINT, encoding='utf-8') as writer:
+        writer.field('Nom_Est', 'C', size=80)
+        writer.field('Id_estacio', 'N', size=10)   # los nombres del .dbf tienen a lo sumo 10 caracteres
+        writer.field('municipio', 'C', size=40)
+        for x, y, nom, station_id, municipio in zip(df['Longitud'], df['Latitud'], df['Nom_Est'],
+                                                    df['Id_estacion'], df['municipio']):
+            writer.point(x, y)
+            writer.record(nom, int(station_id), municipio)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(f'{name}.shp', shp.getvalue())
+        zip_ref.writestr(f'{name}.shx', shx.getvalue())
+        zip_ref.writestr(f'{name}.dbf', dbf.getvalue())
+        zip_ref.writestr(f'{name}.prj', pyproj.CRS(SOURCE_CRS).to_wkt(pyproj.enums.WktVersion.WKT1_ESRI))
+        zip_ref.writestr(f'{name}.cpg', 'UTF-8')
+    return buffer.getvalue()
+
+
+def synthetic_files(n_stations, data_dir, years=DEFAULT_YEARS, seed=0):
+    """Rutas del CSV y del ZIP sintéticos de ``n_stations`` estaciones; se generan si no existen."""
+    csv_path = os.path.join(data_dir, f'mapaCV_{n_stations}.csv')
+    zip_path = os.path.join(data_dir, f'estaciones_{n_stations}.zip')
+    if not (os.path.exists(csv_path) and os.path.exists(zip_path)):
+        df = synthetic_stations(n_stations, years, seed=seed)
+        write_csv(df, csv_path)
+        with open(zip_path, 'wb') as f:
+            f.write(shapefile_zip_bytes(df))
+    return csv_path, zip_path
+
+
+def measure(func, repeat=3, memory=True):
+    """Ejecuta ``func`` ``repeat`` veces y devuelve su último resultado y las mediciones."""
+    times = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    record = {'seconds_min': round(min(times), 6), 'seconds_median': round(statistics.median(times), 6),
+              'repeat': len(times)}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            record['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+        finally:
+            tracemalloc.stop()
+    return result, record
+
+
+def run_stages(csv_path, zip_path, n_selected=50, n_municipios=3, repeat=3, memory=True, seed=0):
+    """Mide las etapas de la aplicación sobre un par de archivos; devuelve un registro por etapa."""
+    rng = np.random.default_rng(seed)
+    records = []
+
+    def stage(name, func, size=None):
+        result, record = measure(func, repeat=repeat, memory=memory)
+        record = {'stage': name, **record}
+        if size is not None:
+            record['bytes'] = size(result)
+        records.append(record)
+        return result
+
+    with open(zip_path, 'rb') as f:
+        zip_bytes = f.read()
+
+    df = stage('csv_parse', lambda: read_stations(csv_path))
+    # Store Parquet del mismo CSV (se escribe una vez, sin medir): lectura completa, como la
+    # aplicación, y proyectada a las columnas y la última década, como ``lluvia.batch``
+    parquet_path = store_path(csv_path)
+    if not os.path.exists(parquet_path):
+        write_store(read_stations_csv(csv_path), parquet_path)
+    stage('store_read', lambda: read_stations(parquet_path))
+    last_year = max(int(year) for year in year_columns(df.columns))
+    stage('store_read_projected', lambda: read_stations(parquet_path, columns=job_columns('municipio'),
+                                                        years=[(last_year - 9, last_year)]))
+    gdf = stage('shapefile_load', lambda: read_shapefile_zip(zip_bytes, fields=('Nom_Est',)))
+    zonal_index = stage('zonal_index', lambda: ZonalIndex(df))
+    cube = stage('stats_cube', lambda: StatsCube.from_frame(df))
+    long_table = stage('long_table', lambda: LongTable(df))
+    station_search = stage('station_search', lambda: StationSearch(df))
+
+    # Barra lateral, como en la aplicación: máscara de algunos municipios, mejores coincidencias
+    # de una búsqueda (opciones del selector), conteo para la selección masiva y posiciones
+    # de las estaciones elegidas
+    municipios = rng.choice(zonal_index.labels['municipio'], size=min(n_municipios, len(zonal_index.labels['municipio'])),
+                            replace=False)
+    names = df['Nom_Est'].to_numpy()
+    selected = rng.choice(names, size=min(n_selected, len(names)), replace=False)
+    # Nombre de una estación sin los últimos dígitos, en minúsculas y sin el código
+    query = str(selected[0]).split('[')[0].strip()[:-2].lower()
+
+    def sidebar_filter():
+        loc_mask = zonal_index.mask('municipio', municipios)
+        matches = station_search.search(query, loc_mask)
+        list(dict.fromkeys(list(selected) + list(station_search.names[matches])))
+        int(station_search.matches(query, loc_mask).sum())
+        return np.flatnonzero(df['Nom_Est'].isin(selected).to_numpy())
+
+    rows = stage('sidebar_filter', sidebar_filter)
+    years = [int(year) for year in year_columns(df.columns)]
+    start_year, end_year = min(years), max(years)
+    stats, _ = stage('stats', lambda: stats_table(df, cube, start_year, end_year, rows))
+    long_df = stage('melt', lambda: long_table.frame(rows, start_year, end_year))
+
+    def altair_spec():
+        # Sin el límite de 5000 filas de Altair, igual que ``st.altair_chart``
+        with alt.data_transformers.disable_max_rows():
+            return annual_chart(long_df).to_json()
+
+    stage('altair_chart', altair_spec, size=lambda spec: len(spec.encode('utf-8')))
+
+    def plotly_figures():
+        compare = long_df[long_df['Año'] == end_year]
+        return [px.bar(compare, x=STATION_COL, y=PRECIP_COL), px.box(long_df, x=STATION_COL, y=PRECIP_COL)]
+
+    stage('plotly_charts', plotly_figures, size=lambda figures: sum(json_size(figure) for figure in figures))
+
+    def folium_map():
+        station_info = stats.reindex(columns=['Nom_Est', 'municipio', 'vereda', MEAN_COL])
+        selected_gdf = gdf[gdf['Nom_Est'].isin(selected)].merge(station_info, on='Nom_Est', how='left')
+        fmap = folium.Map(location=[6.2442, -75.5812], zoom_start=8, tiles="CartoDB positron")
+        station_layer(selected_gdf, ['Nom_Est', 'municipio', 'vereda', MEAN_COL],
+                      ['Estación:', 'Municipio:', 'Vereda:', 'Media (mm):']).add_to(fmap)
+        return fmap.get_root().render()
+
+    stage('folium_map', folium_map, size=lambda html: len(html.encode('utf-8')))
+    return records
+
+
+# Distribuciones que intervienen en las etapas medidas; su versión se guarda con cada resultado
+PACKAGES = ('numpy', 'pandas', 'pyarrow', 'scipy', 'shapely', 'pyproj', 'geopandas', 'pyshp',
+            'plotly', 'altair', 'folium', 'branca')
+
+
+def package_version(name):
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def environment():
+    """Versión del código y del entorno, para comparar resultados entre corridas."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        **{name: package_version(name) for name in PACKAGES},
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide las etapas de la aplicación sobre redes sintéticas de estaciones.")
+    parser.add_argument('--stations', type=int, nargs='+', default=list(DEFAULT_SIZES), help="Tamaños de red (número de estaciones)")
+    parser.add_argument('--selected', type=int, default=50, help="Estaciones seleccionadas para estadísticas, gráficos y mapa")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones por etapa")
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="No mide el pico de memoria")
+    parser.add_argument('--data-dir', help="Directorio para los archivos sintéticos (por defecto, uno temporal)")
+    parser.add_argument('-o', '--output', help="Archivo JSON Lines al que se agregan los resultados (por defecto, la salida estándar)")
+    args = parser.parse_args(argv)
+
+    # Aviso de Folium por las teselas de CartoDB que usa la aplicación; no afecta las mediciones
+    warnings.filterwarnings('ignore', message='CartoDB tiles')
+    env = environment()
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for n_stations in args.stations:
+                csv_path, zip_path = synthetic_files(n_stations, data_dir)
+                for record in run_stages(csv_path, zip_path, n_selected=args.selected, repeat=args.repeat, memory=args.memory):
+                    out.write(json.dumps({**env, 'stations': n_stations, 'selected': args.selected, **record}) + '\n')
+                    out.flush()
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+if __name__ == '__main__':
+    main()
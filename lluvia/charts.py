@@ -0,0 +1,43 @@
+"""Gráficos de la serie anual por estación, para la aplicación y para los informes por lotes.
+
+``annual_chart`` arma el gráfico interactivo de Altair (líneas o barras) a partir de la
+tabla larga de ``LongTable.frame``; ``annual_chart_png`` dibuja la misma serie con
+Matplotlib sin pasar por ``pyplot``, de modo que puede usarse en procesos sin pantalla.
+"""
+import altair as alt
+from matplotlib.figure import Figure
+
+from lluvia.long_table import PRECIP_COL, STATION_COL, YEAR_COL
+
+# Con más estaciones la leyenda del PNG ocupa más que el gráfico
+MAX_LEGEND_STATIONS = 15
+
+
+def annual_chart(long_df, kind='line', y_range=None):
+    """Gráfico de Altair de precipitación anual por estación (``kind`` = ``'line'`` o ``'bar'``)."""
+    y_scale = alt.Scale(domain=y_range) if y_range else alt.Scale()
+    base = alt.Chart(long_df)
+    mark = base.mark_line(point=True) if kind == 'line' else base.mark_bar()
+    return mark.encode(
+        x=alt.X(f'{YEAR_COL}:O', title='Año', axis=alt.Axis(format='d')),
+        y=alt.Y(f'{PRECIP_COL}:Q', title='Precipitación (mm)', scale=y_scale),
+        color=alt.Color(STATION_COL, title='Estación'),
+        tooltip=[STATION_COL, YEAR_COL, PRECIP_COL]
+    ).interactive()
+
+
+def annual_chart_png(years, values, names, path, title=None, dpi=120):
+    """Guarda un PNG con una línea por estación; ``values`` es la matriz (años × estaciones)."""
+    fig = Figure(figsize=(10, 5), dpi=dpi)
+    ax = fig.subplots()
+    ax.plot(years, values, marker='o', markersize=3, linewidth=1)
+    ax.set_xlabel('Año')
+    ax.set_ylabel('Precipitación (mm)')
+    if title:
+        ax.set_title(title)
+    ax.grid(alpha=0.3)
+    if len(names) <= MAX_LEGEND_STATIONS:
+        ax.legend(list(names), fontsize='small', loc='upper left', bbox_to_anchor=(1.0, 1.0))
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
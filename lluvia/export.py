@@ -0,0 +1,229 @@
+"""Exportación por bloques de la selección, las estadísticas y las estaciones con geometría.
+
+Los archivos se escriben bloque a bloque (``chunk_size`` estaciones a la vez) en un
+archivo temporal en disco y ya comprimidos, en lugar de armar la tabla completa y su
+serialización en memoria:
+
+* CSV con gzip, escribiendo el texto de cada bloque a medida que se genera;
+* Parquet con zstd, un grupo de filas por bloque (``pyarrow.parquet.ParquetWriter``);
+* GeoJSON con gzip, escribiendo las ``Feature`` de cada bloque;
+* GeoPackage agregando cada bloque a la capa y comprimiendo el archivo en un ZIP.
+
+El formato ancho es el del CSV de entrada (una columna por año); el largo tiene una fila
+por estación y año, ordenada por estación. Los tipos de las columnas de texto se deciden
+una vez con la tabla completa (:func:`stable_dtypes`), así que todos los bloques tienen el
+mismo esquema aunque una columna sea toda nula en alguno de ellos. Las geometrías son los puntos WGS84 de las
+coordenadas del CSV, así que no hace falta haber cargado el shapefile.
+
+Cada función devuelve el archivo temporal abierto y posicionado al inicio, para copiarlo
+a disco o leerlo con :func:`file_bytes` (``st.download_button`` necesita los bytes).
+"""
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lluvia.loading import LAT_WGS84, LON_WGS84
+from lluvia.long_table import PRECIP_COL, STATION_COL, YEAR_COL
+from lluvia.maps import point_feature_collection
+from lluvia.store import year_columns
+
+CHUNK_SIZE = 2000
+
+TABLE_FORMATS = {'csv': 'CSV (gzip)', 'parquet': 'Parquet (zstd)'}
+GEO_FORMATS = {'geojson': 'GeoJSON (gzip)', 'gpkg': 'GeoPackage (zip)'}
+
+# Extensión y tipo MIME de cada formato
+FILE_TYPES = {
+    'csv': ('.csv.gz', 'application/gzip'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'geojson': ('.geojson.gz', 'application/gzip'),
+    'gpkg': ('.gpkg.zip', 'application/zip'),
+}
+
+
+def stable_dtypes(frame):
+    """Copia de ``frame`` con las columnas ``object`` convertidas a un tipo según todos sus valores.
+
+    Texto (con o sin nulos) pasa a ``'string'``, enteros con nulos a ``'Int64'`` y decimales
+    a ``float64``; las columnas mezcladas se convierten a texto. Así el tipo no depende de
+    qué valores caigan en cada bloque.
+    """
+    columns = {}
+    for col in frame.columns:
+        series = frame[col]
+        if series.dtype != object:
+            continue
+        kind = pd.api.types.infer_dtype(series, skipna=True)
+        if kind == 'integer':
+            columns[col] = series.astype('Int64')
+        elif kind in ('floating', 'mixed-integer-float'):
+            columns[col] = series.astype('float64')
+        elif kind in ('string', 'empty'):
+            columns[col] = series.astype('string')
+        else:
+            columns[col] = series.where(series.isna(), series.astype(str)).astype('string')
+    return frame.assign(**columns) if columns else frame
+
+
+def _chunks(rows, chunk_size):
+    rows = np.asarray(rows, dtype=np.intp)
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+def wide_chunks(df, rows, start_year=None, end_year=None, chunk_size=CHUNK_SIZE):
+    """Bloques de la selección en formato ancho: columnas descriptivas y los años del rango."""
+    years = year_columns(df.columns)
+    in_range = [year for year in years
+                if (start_year is None or int(year) >= start_year) and (end_year is None or int(year) <= end_year)]
+    info = stable_dtypes(df[[col for col in df.columns if col not in years]])
+    for block in _chunks(rows, chunk_size):
+        yield pd.concat([info.iloc[block], df[in_range].iloc[block]], axis=1)
+
+
+def long_chunks(df, rows, start_year=None, end_year=None, chunk_size=CHUNK_SIZE):
+    """Bloques de la selección en formato largo (``Id_estacion``, ``Nom_Est``, ``Año``, ``Precipitación``)."""
+    years = [year for year in year_columns(df.columns)
+             if (start_year is None or int(year) >= start_year) and (end_year is None or int(year) <= end_year)]
+    year_values = np.array([int(year) for year in years], dtype=np.int16)
+    for block in _chunks(rows, chunk_size):
+        values = df[years].iloc[block].to_numpy(dtype='float32')
+        yield pd.DataFrame({
+            'Id_estacion': np.repeat(df['Id_estacion'].to_numpy()[block], len(years)),
+            STATION_COL: np.repeat(df[STATION_COL].to_numpy()[block], len(years)),
+            YEAR_COL: np.tile(year_values, len(block)),
+            PRECIP_COL: values.ravel(),
+        })
+
+
+def frame_chunks(frame, chunk_size=CHUNK_SIZE):
+    """Bloques de filas de una tabla ya calculada (p. ej. las estadísticas)."""
+    frame = stable_dtypes(frame)
+    for start in range(0, len(frame), chunk_size):
+        yield frame.iloc[start:start + chunk_size]
+
+
+def write_csv(chunks, sep=','):
+    """CSV comprimido con gzip; el encabezado sale del primer bloque."""
+    out = tempfile.TemporaryFile()
+    with gzip.GzipFile(fileobj=out, mode='wb') as compressed:
+        text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(text, sep=sep, index=False, header=i == 0)
+        text.flush()
+        # Soltar el gzip sin cerrarlo: lo cierra el ``with`` y el archivo temporal sigue abierto
+        text.detach()
+    out.seek(0)
+    return out
+
+
+def table_schema(frame):
+    """Esquema de Arrow de ``frame`` según los tipos de sus columnas (las nulas quedan como texto)."""
+    schema = pa.Schema.from_pandas(frame.iloc[:0], preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+
+def write_parquet(chunks, compression='zstd', schema=None):
+    """Parquet con un grupo de filas por bloque.
+
+    Sin ``schema``, el esquema sale de los tipos del primer bloque (ver :func:`table_schema`),
+    que son los de todos si los bloques vienen de las funciones ``*_chunks``.
+    """
+    out = tempfile.TemporaryFile()
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                writer = pq.ParquetWriter(out, schema or table_schema(chunk), compression=compression)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+    out.seek(0)
+    return out
+
+
+def write_table(chunks, fmt, schema=None):
+    """Escribe los bloques en ``'csv'`` o ``'parquet'`` (``schema`` sólo se usa en Parquet)."""
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"Formato de tabla desconocido: {fmt!r}")
+    return write_parquet(chunks, schema=schema) if fmt == 'parquet' else write_csv(chunks)
+
+
+def station_chunks(df, rows, stats=None, columns=('Id_estacion', 'Nom_Est', 'departamento', 'municipio', 'vereda'),
+                   chunk_size=CHUNK_SIZE):
+    """Bloques de (latitud, longitud, propiedades) de las estaciones de ``rows``.
+
+    ``stats`` es una tabla con una fila por estación de ``rows`` en el mismo orden (las
+    filas sobrantes, como la de resumen, se ignoran); sus columnas se agregan a las propiedades.
+    """
+    columns = [col for col in columns if col in df.columns]
+    rows = np.asarray(rows, dtype=np.intp)
+    info = stable_dtypes(df[columns])
+    if stats is not None:
+        stats = stable_dtypes(stats.iloc[:len(rows)].drop(columns=columns, errors='ignore'))
+    for start, block in zip(range(0, len(rows), chunk_size), _chunks(rows, chunk_size)):
+        properties = info.iloc[block].reset_index(drop=True)
+        if stats is not None:
+            extra = stats.iloc[start:start + len(block)].reset_index(drop=True)
+            properties = pd.concat([properties, extra], axis=1)
+        yield df[LAT_WGS84].to_numpy()[block], df[LON_WGS84].to_numpy()[block], properties
+
+
+def write_geojson(chunks):
+    """FeatureCollection de puntos comprimida con gzip, escrita Feature por Feature."""
+    out = tempfile.TemporaryFile()
+    with gzip.GzipFile(fileobj=out, mode='wb') as compressed:
+        compressed.write(b'{"type": "FeatureCollection", "features": [\n')
+        first = True
+        for lat, lon, properties in chunks:
+            collection = point_feature_collection(lat, lon, {key: properties[key] for key in properties.columns})
+            lines = [json.dumps(feature, ensure_ascii=False) for feature in collection['features']]
+            if lines:
+                compressed.write((('' if first else ',\n') + ',\n'.join(lines)).encode('utf-8'))
+                first = False
+        compressed.write(b'\n]}\n')
+    out.seek(0)
+    return out
+
+
+def write_geopackage(chunks, layer='estaciones'):
+    """GeoPackage (capa de puntos WGS84) escrito por bloques y comprimido en un ZIP."""
+    out = tempfile.TemporaryFile()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f'{layer}.gpkg')
+        for i, (lat, lon, properties) in enumerate(chunks):
+            gdf = gpd.GeoDataFrame(properties, geometry=gpd.points_from_xy(lon, lat), crs='EPSG:4326')
+            gdf.to_file(path, layer=layer, driver='GPKG', mode='w' if i == 0 else 'a')
+        with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+            if os.path.exists(path):
+                with open(path, 'rb') as source, zip_ref.open(f'{layer}.gpkg', 'w') as target:
+                    shutil.copyfileobj(source, target, length=1 << 20)
+    out.seek(0)
+    return out
+
+
+def write_stations(chunks, fmt):
+    """Escribe los bloques de estaciones en ``'geojson'`` o ``'gpkg'``."""
+    if fmt not in GEO_FORMATS:
+        raise ValueError(f"Formato geográfico desconocido: {fmt!r}")
+    return write_geopackage(chunks) if fmt == 'gpkg' else write_geojson(chunks)
+
+
+def file_bytes(out):
+    """Contenido de un archivo devuelto por las funciones ``write_*``; lo cierra (y así lo borra)."""
+    with out:
+        return out.read()
@@ -0,0 +1,164 @@
+"""Relleno de años faltantes o sospechosos a partir de estaciones vecinas.
+
+Un año se considera faltante si está vacío (NaN) y, por defecto, también si vale 0
+(un total anual nulo suele ser un año sin registro). ``GapFiller`` precalcula una vez
+por conjunto de datos, en forma vectorizada:
+
+* los ``k`` vecinos más cercanos de cada estación (``cKDTree`` en CMT12, metros);
+* para cada pareja estación-vecino, sobre los años observados en ambas: el número de
+  años en común, la correlación, la razón de medias y la recta de regresión.
+
+Con eso cada método rellena todas las estaciones y años a la vez (por bloques de
+estaciones), ponderando sólo los vecinos con dato ese año:
+
+* ``normal_ratio``: valor del vecino escalado por la razón de medias, con peso
+  ``r² (n - 2) / (1 - r²)``;
+* ``regression``: predicción de la recta estación ~ vecino, con el mismo peso;
+* ``idw``: valor del vecino con peso ``1 / d²``.
+
+Los vecinos con ``Porc_datos`` menor que ``min_donor_coverage``, más lejos que
+``max_distance_km`` o (salvo en ``idw``) con correlación menor que ``min_correlation``
+no se usan.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from lluvia.loading import LAT_WGS84, LON_WGS84, SOURCE_CRS, TARGET_CRS, get_transformer
+from lluvia.store import year_columns
+
+METHODS = {
+    'normal_ratio': 'Razón normal',
+    'regression': 'Regresión',
+    'idw': 'Inverso de la distancia',
+}
+
+COVERAGE_COL = 'Porc_datos'
+
+
+class GapFillResult:
+    """Matriz rellenada (estaciones × años, float32) y máscaras de celdas faltantes y rellenadas."""
+
+    def __init__(self, years, values, missing, filled, method):
+        self.years = years
+        self.values = values
+        self.missing = missing
+        self.filled = filled
+        self.method = method
+
+    @property
+    def unfilled(self):
+        return self.missing & ~self.filled
+
+    def long_mask(self, rows=None, start_year=None, end_year=None):
+        """Celdas rellenadas en el orden año-mayor de ``LongTable.frame`` (mismos argumentos)."""
+        left = 0 if start_year is None else int(np.searchsorted(self.years, start_year, side='left'))
+        right = len(self.years) if end_year is None else int(np.searchsorted(self.years, end_year, side='right'))
+        filled = self.filled if rows is None else self.filled[np.asarray(rows, dtype=np.intp)]
+        return filled[:, left:right].T.ravel()
+
+    def to_frame(self, df):
+        """Copia de ``df`` con las columnas de año reemplazadas por la matriz rellenada."""
+        return df.assign(**{str(year): self.values[:, j] for j, year in enumerate(self.years)})
+
+
+class GapFiller:
+    """Vecinos y estadísticas de cada pareja estación-vecino, calculados una sola vez."""
+
+    def __init__(self, df, k=8, max_distance_km=50.0, min_overlap=10, min_donor_coverage=50.0,
+                 zeros_as_missing=True, chunk_size=8192):
+        years = year_columns(df.columns)
+        self.years = np.array([int(year) for year in years], dtype=np.int16)
+        self.raw = df[years].to_numpy(dtype='float64')
+        self.missing = ~np.isfinite(self.raw)
+        if zeros_as_missing:
+            self.missing |= self.raw == 0
+        self.observed = np.where(self.missing, np.nan, self.raw)
+        self.chunk_size = chunk_size
+
+        n_stations = len(df)
+        k = max(0, min(int(k), n_stations - 1))
+        self.k = k
+        x, y = get_transformer(TARGET_CRS, SOURCE_CRS).transform(df[LON_WGS84].to_numpy(dtype='float64'),
+                                                                 df[LAT_WGS84].to_numpy(dtype='float64'))
+        if k:
+            dist, idx = cKDTree(np.column_stack([x, y])).query(np.column_stack([x, y]), k=k + 1)
+            dist, idx = dist.reshape(n_stations, k + 1), idx.reshape(n_stations, k + 1)
+            # Quitar la propia estación (o el último vecino si otra estación comparte coordenadas)
+            is_self = idx == np.arange(n_stations)[:, None]
+            is_self[~is_self.any(axis=1), -1] = True
+            keep = ~is_self
+            self.neighbours = idx[keep].reshape(n_stations, k)
+            self.distances = dist[keep].reshape(n_stations, k)
+        else:
+            self.neighbours = np.zeros((n_stations, 0), dtype=np.intp)
+            self.distances = np.zeros((n_stations, 0))
+
+        donor = np.ones(n_stations, dtype=bool)
+        if COVERAGE_COL in df.columns:
+            coverage = df[COVERAGE_COL].to_numpy(dtype='float64')
+            donor = ~(coverage < min_donor_coverage)
+        self.usable = donor[self.neighbours] & (self.distances <= max_distance_km * 1000.0)
+
+        self.overlap = np.zeros(self.neighbours.shape, dtype=np.int32)
+        self.correlation = np.full(self.neighbours.shape, np.nan)
+        self.ratio = np.full(self.neighbours.shape, np.nan)
+        self.slope = np.full(self.neighbours.shape, np.nan)
+        self.intercept = np.full(self.neighbours.shape, np.nan)
+        for start in range(0, n_stations, chunk_size):
+            self._pair_statistics(slice(start, start + chunk_size))
+        self.usable &= self.overlap >= min_overlap
+
+    def _pair_statistics(self, block):
+        station = self.observed[block][:, None, :]                      # (estaciones, 1, años)
+        neighbour = self.observed[self.neighbours[block]]               # (estaciones, k, años)
+        both = np.isfinite(station) & np.isfinite(neighbour)
+        count = both.sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            a = np.where(both, station, 0.0)
+            b = np.where(both, neighbour, 0.0)
+            mean_a = a.sum(axis=2) / count
+            mean_b = b.sum(axis=2) / count
+            da = np.where(both, a - mean_a[..., None], 0.0)
+            db = np.where(both, b - mean_b[..., None], 0.0)
+            cov = (da * db).sum(axis=2)
+            var_a = (da ** 2).sum(axis=2)
+            var_b = (db ** 2).sum(axis=2)
+            self.overlap[block] = count
+            self.correlation[block] = cov / np.sqrt(var_a * var_b)
+            self.ratio[block] = mean_a / mean_b
+            self.slope[block] = cov / var_b
+            self.intercept[block] = mean_a - self.slope[block] * mean_b
+
+    def _weights(self, method, min_correlation):
+        if method == 'idw':
+            return np.where(self.usable, 1.0 / np.maximum(self.distances, 1.0) ** 2, 0.0)
+        r = np.nan_to_num(self.correlation)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weights = r ** 2 * (self.overlap - 2) / (1.0 - r ** 2)
+        # Correlación perfecta: peso alto pero finito
+        weights = np.where(r >= 1.0, 1e12, weights)
+        return np.where(self.usable & (r >= min_correlation), np.nan_to_num(weights), 0.0)
+
+    def fill(self, method='normal_ratio', min_correlation=0.5):
+        """Rellena las celdas faltantes de todas las estaciones con el método indicado."""
+        if method not in METHODS:
+            raise ValueError(f"Método de relleno desconocido: {method!r}")
+        weights = self._weights(method, min_correlation)
+        estimate = np.full(self.observed.shape, np.nan)
+        for start in range(0, len(self.observed), self.chunk_size):
+            block = slice(start, start + self.chunk_size)
+            donors = self.observed[self.neighbours[block]]              # (estaciones, k, años)
+            if method == 'normal_ratio':
+                donors = donors * self.ratio[block][..., None]
+            elif method == 'regression':
+                donors = self.intercept[block][..., None] + self.slope[block][..., None] * donors
+            has_value = np.isfinite(donors)
+            w = np.where(has_value, weights[block][..., None], 0.0)
+            total = w.sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                estimate[block] = np.where(total > 0, (w * np.where(has_value, donors, 0.0)).sum(axis=1) / total, np.nan)
+
+        filled = self.missing & np.isfinite(estimate)
+        # Los faltantes sin vecinos útiles conservan su valor original (vacío o 0)
+        values = np.where(filled, np.maximum(estimate, 0.0), self.raw)
+        return GapFillResult(self.years, values.astype('float32'), self.missing, filled, method)
@@ -0,0 +1,172 @@
+"""Superficies de precipitación anual interpoladas a partir de las estaciones.
+
+La grilla es regular en lon/lat (para superponerla exacta en el mapa), pero las distancias
+se calculan en MAGNA-SIRGAS CMT12 (metros). Para cada celda se buscan los ``k`` vecinos
+más cercanos con un ``cKDTree`` y se calculan sus pesos una sola vez:
+
+* ``idw``: inverso de la distancia elevado a ``power``;
+* ``kriging``: kriging ordinario local con variograma exponencial; los pesos no dependen
+  de la varianza de los datos, así que sirven para todos los años.
+
+Con esos pesos todos los años del rango se interpolan en una sola pasada vectorizada
+(por bloques de celdas para acotar la memoria). Si a una estación le falta el valor de un
+año, sus pesos de ese año se reparten entre los vecinos con dato.
+"""
+import math
+import warnings
+
+import numpy as np
+import shapely
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from lluvia.loading import SOURCE_CRS, TARGET_CRS, get_transformer
+
+METHODS = ('idw', 'kriging')
+
+KM_PER_DEGREE = 111.32
+
+# Límite de celdas de la grilla; si la resolución pedida lo supera, se engrosa
+DEFAULT_MAX_CELLS = 100_000
+
+
+def _project(lon, lat):
+    x, y = get_transformer(TARGET_CRS, SOURCE_CRS).transform(np.asarray(lon, dtype='float64'),
+                                                            np.asarray(lat, dtype='float64'))
+    return np.column_stack([x, y])
+
+
+def make_grid(lon, lat, resolution_km, padding_cells=2, max_cells=DEFAULT_MAX_CELLS):
+    """Ejes de la grilla (centros de celda en grados) que cubre las estaciones, y la resolución usada en km."""
+    step = resolution_km / KM_PER_DEGREE
+    lon_min, lon_max = np.nanmin(lon) - padding_cells * step, np.nanmax(lon) + padding_cells * step
+    lat_min, lat_max = np.nanmin(lat) - padding_cells * step, np.nanmax(lat) + padding_cells * step
+    n_cells = ((lon_max - lon_min) / step + 1) * ((lat_max - lat_min) / step + 1)
+    if n_cells > max_cells:
+        step *= math.sqrt(n_cells / max_cells)
+    lon_axis = np.arange(lon_min, lon_max + step / 2, step)
+    lat_axis = np.arange(lat_min, lat_max + step / 2, step)
+    return lon_axis, lat_axis, step * KM_PER_DEGREE
+
+
+def _idw_weights(dist, power):
+    return 1.0 / np.maximum(dist, 1e-6) ** power
+
+
+def _exponential_variogram(h, range_m, nugget):
+    return np.where(h > 0, nugget + (1.0 - nugget) * (1.0 - np.exp(-3.0 * h / range_m)), 0.0)
+
+
+def _kriging_weights(cell_xy, station_xy, idx, range_m, nugget):
+    """Pesos de kriging ordinario para cada celda con sus ``k`` vecinos, resolviendo todos los sistemas juntos."""
+    neighbours = station_xy[idx]                                      # (celdas, k, 2)
+    n_cells, k = idx.shape
+    pair = np.linalg.norm(neighbours[:, :, None, :] - neighbours[:, None, :, :], axis=-1)
+    lhs = np.ones((n_cells, k + 1, k + 1))
+    lhs[:, :k, :k] = _exponential_variogram(pair, range_m, nugget) + np.eye(k) * 1e-9
+    lhs[:, k, k] = 0.0
+    rhs = np.ones((n_cells, k + 1))
+    rhs[:, :k] = _exponential_variogram(np.linalg.norm(neighbours - cell_xy[:, None, :], axis=-1), range_m, nugget)
+    try:
+        solution = np.linalg.solve(lhs, rhs[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        solution = np.einsum('cij,cj->ci', np.linalg.pinv(lhs), rhs)
+    return solution[:, :k]
+
+
+class PrecipGrid:
+    """Resultado de la interpolación: ``values`` con forma (años × lat × lon) en float32."""
+
+    def __init__(self, lon, lat, years, values, resolution_km, method):
+        self.lon = lon
+        self.lat = lat
+        self.years = np.asarray(years)
+        self.values = values
+        self.resolution_km = resolution_km
+        self.method = method
+
+    @property
+    def bounds(self):
+        """Bordes de la grilla para Folium: ``[[lat_sur, lon_oeste], [lat_norte, lon_este]]``."""
+        half_lon = (self.lon[1] - self.lon[0]) / 2 if len(self.lon) > 1 else 0.0
+        half_lat = (self.lat[1] - self.lat[0]) / 2 if len(self.lat) > 1 else 0.0
+        return [[float(self.lat[0] - half_lat), float(self.lon[0] - half_lon)],
+                [float(self.lat[-1] + half_lat), float(self.lon[-1] + half_lon)]]
+
+    def surface(self, year=None):
+        """Superficie de un año o, si ``year`` es ``None``, el promedio del rango."""
+        if year is None:
+            # Celdas vacías en todos los años dan NaN (y un RuntimeWarning que se descarta)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                return np.nanmean(self.values, axis=0)
+        return self.values[int(np.searchsorted(self.years, int(year)))]
+
+    def areal_means(self, polygons):
+        """Promedio de las celdas cuyo centro cae en cada polígono (WGS84), para todos los años.
+
+        Devuelve una matriz (polígonos × años) y el número de celdas de cada polígono.
+        """
+        lon_grid, lat_grid = np.meshgrid(self.lon, self.lat)
+        centres = shapely.points(lon_grid.ravel(), lat_grid.ravel())
+        cell_idx, poly_idx = shapely.STRtree(centres).query(np.asarray(polygons), predicate='contains')[::-1]
+        membership = sparse.csr_matrix((np.ones(len(cell_idx)), (poly_idx, cell_idx)),
+                                       shape=(len(polygons), centres.size))
+        flat = self.values.reshape(len(self.years), -1).T            # (celdas, años)
+        valid = np.isfinite(flat)
+        totals = membership @ np.where(valid, flat, 0.0)
+        counts = membership @ valid.astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, totals / counts, np.nan)
+        return means, np.asarray(membership.sum(axis=1)).ravel().astype(int)
+
+
+def interpolate(lon, lat, years, values, resolution_km=5.0, method='idw', k=8, power=2.0,
+                range_km=50.0, nugget=0.0, max_distance_km=None, max_cells=DEFAULT_MAX_CELLS, chunk_size=16384):
+    """Interpola la matriz (años × estaciones) ``values`` sobre una grilla regular lon/lat.
+
+    ``max_distance_km`` deja vacías (NaN) las celdas cuya estación más cercana está más lejos.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Método de interpolación desconocido: {method!r}")
+    values = np.asarray(values, dtype='float32')
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.asarray(lat, dtype='float64')
+    lon_axis, lat_axis, resolution_km = make_grid(lon, lat, resolution_km, max_cells=max_cells)
+
+    station_xy = _project(lon, lat)
+    tree = cKDTree(station_xy)
+    k = max(1, min(int(k), len(station_xy)))
+
+    lon_grid, lat_grid = np.meshgrid(lon_axis, lat_axis)
+    cell_xy = _project(lon_grid.ravel(), lat_grid.ravel())
+    result = np.full((values.shape[0], len(cell_xy)), np.nan, dtype='float32')
+    valid_values = np.isfinite(values)
+    filled_values = np.where(valid_values, values, 0.0).astype('float32')
+
+    for start in range(0, len(cell_xy), chunk_size):
+        block = cell_xy[start:start + chunk_size]
+        dist, idx = tree.query(block, k=k)
+        dist, idx = dist.reshape(len(block), k), idx.reshape(len(block), k)
+        if method == 'idw':
+            weights = _idw_weights(dist, power)
+        else:
+            weights = _kriging_weights(block, station_xy, idx, range_km * 1000.0, nugget)
+
+        # (años, celdas, k): valores y disponibilidad de los vecinos de cada celda
+        neighbour_values = filled_values[:, idx]
+        neighbour_valid = valid_values[:, idx]
+        weighted = np.einsum('yck,ck->yc', neighbour_values, weights)
+        weight_sum = np.einsum('yck,ck->yc', neighbour_valid.astype('float32'), weights)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            block_result = np.where(np.abs(weight_sum) > 1e-12, weighted / weight_sum, np.nan)
+        if method == 'kriging':
+            # Los pesos negativos del kriging pueden extrapolar por debajo de cero
+            block_result = np.maximum(block_result, 0.0)
+        if max_distance_km is not None:
+            block_result[:, dist[:, 0] > max_distance_km * 1000.0] = np.nan
+        result[:, start:start + len(block)] = block_result
+
+    return PrecipGrid(lon_axis, lat_axis, years,
+                      result.reshape(values.shape[0], len(lat_axis), len(lon_axis)),
+                      resolution_km, method)
@@ -0,0 +1,215 @@
+"""Carga y limpieza de los datos de estaciones (CSV) y del shapefile (ZIP).
+
+Las coordenadas ``Latitud``/``Longitud`` del CSV vienen proyectadas (en metros); al
+cargar se detecta su CRS y se agregan las columnas ``Latitud_WGS84``/``Longitud_WGS84``
+con una sola transformación vectorizada de pyproj.
+
+Las funciones de este módulo no dependen de Streamlit: la aplicación las envuelve
+con ``st.cache_resource`` usando ``source_key`` como clave, de modo que cada
+archivo se lee, limpia y reproyecta una sola vez y el resultado se comparte entre
+reruns y sesiones. Por eso los DataFrames devueltos no deben modificarse en sitio.
+"""
+import codecs
+import functools
+import hashlib
+import io
+import os
+import re
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapefile
+import shapely
+import shapely.geometry
+from pyproj import Transformer
+
+# Nombres de columnas del CSV original -> nombres usados en la aplicación
+COLUMN_RENAMES = {'Mpio': 'municipio', 'NOMBRE_VER': 'vereda'}
+
+REQUIRED_COLUMNS = ['Nom_Est', 'Latitud', 'Longitud', 'municipio', 'Celda_XY', 'vereda', 'Id_estacion', 'departamento']
+
+# MAGNA-SIRGAS_CMT12 corresponde a EPSG:9377
+SOURCE_CRS = "EPSG:9377"
+TARGET_CRS = "EPSG:4326"
+# MAGNA-SIRGAS / Colombia Bogotá, usado en archivos anteriores al origen único nacional
+LEGACY_CRS = "EPSG:3116"
+
+# Archivos del shapefile que se leen del ZIP; .shp, .shx y .dbf son obligatorios
+SHAPEFILE_EXTENSIONS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+# Codificación del .dbf cuando no hay .cpg o no se reconoce (la misma que asume GDAL)
+DEFAULT_DBF_ENCODING = 'latin-1'
+
+LAT_WGS84 = 'Latitud_WGS84'
+LON_WGS84 = 'Longitud_WGS84'
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def source_key(source):
+    """Clave de contenido: ruta+mtime+tamaño para archivos en disco, hash de los bytes en otro caso."""
+    if isinstance(source, (str, os.PathLike)):
+        stat = os.stat(source)
+        return f"file:{os.path.abspath(source)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return "sha1:" + hashlib.sha1(_read_bytes(source)).hexdigest()
+
+
+def missing_columns(df, required=REQUIRED_COLUMNS):
+    return [col for col in required if col not in df.columns]
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(source_crs, target_crs=TARGET_CRS):
+    """Transformer de pyproj (x/y en orden lon/lat) reutilizado durante toda la vida del proceso."""
+    return Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+
+def detect_coordinates_crs(x, y):
+    """Infiere el CRS de columnas de coordenadas (``x`` = Longitud, ``y`` = Latitud) por sus rangos.
+
+    Grados dentro de ±180/±90 se toman como WGS84; valores en metros con falso este de
+    millones (origen nacional CMT12, falso este 5 000 000) como EPSG:9377, y valores
+    alrededor de 1 000 000 como MAGNA-SIRGAS Bogotá (EPSG:3116). Si no es concluyente
+    se asume EPSG:9377, igual que para el shapefile.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return SOURCE_CRS
+    x, y = x[finite], y[finite]
+    if np.abs(x).max() <= 180 and np.abs(y).max() <= 90:
+        return TARGET_CRS
+    if x.min() >= 3_000_000:
+        return SOURCE_CRS
+    if x.max() <= 2_000_000 and y.max() <= 2_500_000:
+        return LEGACY_CRS
+    return SOURCE_CRS
+
+
+def normalize_coordinates(df):
+    """Agrega columnas WGS84 (``Latitud_WGS84``/``Longitud_WGS84``) si aún no existen.
+
+    Las columnas originales se conservan; toda la tabla se transforma en una sola llamada.
+    """
+    if (LAT_WGS84 in df.columns and LON_WGS84 in df.columns) or 'Latitud' not in df.columns or 'Longitud' not in df.columns:
+        return df
+    x = df['Longitud'].to_numpy(dtype='float64')
+    y = df['Latitud'].to_numpy(dtype='float64')
+    crs = detect_coordinates_crs(x, y)
+    if crs == TARGET_CRS:
+        lon, lat = x, y
+    else:
+        lon, lat = get_transformer(crs).transform(x, y)
+    return df.assign(**{LAT_WGS84: lat, LON_WGS84: lon})
+
+
+def clean_stations(df):
+    """Renombra columnas, convierte coordenadas a número, descarta filas sin coordenadas y agrega WGS84."""
+    df = df.rename(columns=COLUMN_RENAMES)
+    if 'Latitud' in df.columns and 'Longitud' in df.columns:
+        # Convertir columnas a tipo numérico, manejando errores de 'nan'
+        df['Latitud'] = pd.to_numeric(df['Latitud'], errors='coerce')
+        df['Longitud'] = pd.to_numeric(df['Longitud'], errors='coerce')
+        # Eliminar filas con valores NaN en latitud/longitud
+        df = df.dropna(subset=['Latitud', 'Longitud']).reset_index(drop=True)
+        df = normalize_coordinates(df)
+    return df
+
+
+def read_stations_csv(source):
+    """Lee el CSV de estaciones (ruta, bytes o archivo subido) separado por ';' y lo limpia."""
+    if not isinstance(source, (str, os.PathLike)):
+        source = io.BytesIO(_read_bytes(source))
+    return clean_stations(pd.read_csv(source, sep=';'))
+
+
+def shapefile_members(zip_ref):
+    """Nombres dentro del ZIP del primer .shp y sus archivos compañeros (``.shx``, ``.dbf``, ``.prj``, ``.cpg``).
+
+    Sólo se revisa el índice del ZIP. Lanza ``FileNotFoundError`` si no hay ningún .shp o
+    si falta su .shx o su .dbf.
+    """
+    names = [name for name in zip_ref.namelist() if not name.endswith('/')]
+    shp_files = [name for name in names if name.lower().endswith('.shp')]
+    if not shp_files:
+        raise FileNotFoundError("No se encontró ningún archivo .shp en el archivo ZIP.")
+    stem = shp_files[0][:-4]
+    by_name = {name.lower(): name for name in names}
+    members = {ext: by_name[(stem + ext).lower()] for ext in SHAPEFILE_EXTENSIONS if (stem + ext).lower() in by_name}
+    missing = [stem + ext for ext in ('.shx', '.dbf') if ext not in members]
+    if missing:
+        raise FileNotFoundError(f"Faltan archivos del shapefile en el ZIP: {', '.join(missing)}.")
+    return members
+
+
+def cpg_encoding(text):
+    """Nombre de codec de Python para el contenido de un .cpg, como los interpreta GDAL.
+
+    Reconoce los valores de ESRI (``ANSI 1252``, ``88591``, ``UTF-8``, ``OEM``, números de
+    página de códigos) además de los nombres de codec; si no se reconoce se usa ISO-8859-1.
+    """
+    value = text.strip().upper()
+    if value == 'OEM':
+        return 'cp437'
+    match = re.fullmatch(r'(?:ISO[ _-]?)?8859[_-]?(\d{1,2})', value)
+    if match:
+        return f'iso8859-{match.group(1)}'
+    match = re.fullmatch(r'(?:ANSI|CP|WINDOWS)?[ _-]?(\d{3,5})', value)
+    if match:
+        value = 'UTF-8' if match.group(1) == '65001' else f'cp{match.group(1)}'
+    try:
+        return codecs.lookup(value).name if value else DEFAULT_DBF_ENCODING
+    except LookupError:
+        return DEFAULT_DBF_ENCODING
+
+
+def read_shapefile_zip(source, fields=None):
+    """Lee el primer .shp contenido en un ZIP en memoria (sin extraerlo a disco) y lo convierte a WGS84.
+
+    ``fields`` limita las columnas de atributos que se decodifican del .dbf (por defecto
+    todas). Si el shapefile no trae .prj se asume EPSG:9377; el texto se lee con la
+    codificación del .cpg (ver :func:`cpg_encoding`) o, sin él, como ISO-8859-1, igual que GDAL. Lanza ``FileNotFoundError`` si el ZIP no contiene
+    ningún archivo .shp o le faltan el .shx o el .dbf.
+    """
+    with zipfile.ZipFile(io.BytesIO(_read_bytes(source)), 'r') as zip_ref:
+        members = shapefile_members(zip_ref)
+        buffers = {ext: io.BytesIO(zip_ref.read(name)) for ext, name in members.items()}
+
+    encoding = DEFAULT_DBF_ENCODING
+    if '.cpg' in buffers:
+        encoding = cpg_encoding(buffers['.cpg'].getvalue().decode('ascii', 'ignore'))
+    with shapefile.Reader(shp=buffers['.shp'], shx=buffers['.shx'], dbf=buffers['.dbf'],
+                          encoding=encoding, encodingErrors='replace') as reader:
+        names = [field[0] for field in reader.fields[1:]]
+        if fields is not None:
+            names = [name for name in names if name in fields]
+        character_fields = {field[0] for field in reader.fields[1:] if field[1] == 'C'}
+        records = [list(record) for record in reader.iterRecords(fields=names)]
+        if reader.shapeType in (shapefile.POINT, shapefile.POINTZ, shapefile.POINTM):
+            # Puntos: una sola construcción vectorizada a partir de las coordenadas
+            xy = np.array([shape.points[0] if shape.points else (np.nan, np.nan) for shape in reader.iterShapes()],
+                          dtype='float64').reshape(-1, 2)
+            geometry = shapely.points(xy)
+            geometry[~np.isfinite(xy).all(axis=1)] = None
+        else:
+            geometry = [shapely.geometry.shape(shape.__geo_interface__) if shape.shapeType != shapefile.NULL else None
+                        for shape in reader.iterShapes()]
+
+    # Asignar el CRS correcto (si falta) y convertir a WGS84
+    crs = buffers['.prj'].getvalue().decode('utf-8', 'ignore') if '.prj' in buffers else None
+    attributes = pd.DataFrame(records, columns=names)
+    # Campos de texto vacíos como nulos, igual que GDAL
+    text_fields = [name for name in names if name in character_fields]
+    attributes[text_fields] = attributes[text_fields].replace('', None)
+    gdf = gpd.GeoDataFrame(attributes, geometry=geometry, crs=crs or SOURCE_CRS)
+    return gdf.to_crs(TARGET_CRS)
@@ -0,0 +1,101 @@
+"""Formato largo (estación, año, precipitación) construido una sola vez por conjunto de datos.
+
+En lugar de llamar a ``melt`` en cada gráfico, ``LongTable`` guarda la matriz
+estación × año transpuesta y aplanada en orden año-mayor: la fila de la estación ``i``
+en el año de posición ``j`` está en ``j * n_estaciones + i``. Ese cálculo de posición
+es el índice por estación y año:
+
+* un rango de años con todas las estaciones es un tramo contiguo y se sirve como vista,
+  sin copiar;
+* un subconjunto de estaciones se obtiene con un único ``take`` vectorizado.
+
+Los arreglos son de sólo lectura porque se comparten entre sesiones.
+"""
+import numpy as np
+import pandas as pd
+
+from lluvia.loading import LAT_WGS84, LON_WGS84
+from lluvia.store import year_columns
+
+STATION_COL = 'Nom_Est'
+YEAR_COL = 'Año'
+PRECIP_COL = 'Precipitación'
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+class LongTable:
+    """Tabla larga (estación, año:int16, precipitación:float32) indexada por posición.
+
+    Las coordenadas WGS84 se guardan una vez por estación en ``lat``/``lon``.
+    """
+
+    def __init__(self, df, lat_col=LAT_WGS84, lon_col=LON_WGS84):
+        years = year_columns(df.columns)
+        self.years = np.array([int(year) for year in years], dtype=np.int16)
+        self.n_stations = len(df)
+        n_years = len(years)
+
+        names = pd.Categorical(df[STATION_COL])
+        self._name_dtype = names.dtype
+
+        # Orden año-mayor: los valores de un año quedan contiguos para todas las estaciones
+        self.precip = _readonly(np.ascontiguousarray(df[years].to_numpy(dtype='float32').T).ravel())
+        self.year = _readonly(np.repeat(self.years, self.n_stations))
+        self.name_codes = _readonly(np.tile(names.codes, n_years))
+        self.lat = _readonly(df[lat_col].to_numpy(dtype='float64', copy=True))
+        self.lon = _readonly(df[lon_col].to_numpy(dtype='float64', copy=True))
+
+    def __len__(self):
+        return len(self.precip)
+
+    def positions(self, rows=None, start_year=None, end_year=None):
+        """Posiciones en la tabla larga: un ``slice`` si sirve una vista, o un arreglo de índices.
+
+        ``rows`` son las posiciones de las estaciones en el DataFrame original (todas si es ``None``).
+        """
+        left = 0 if start_year is None else int(np.searchsorted(self.years, start_year, side='left'))
+        right = len(self.years) if end_year is None else int(np.searchsorted(self.years, end_year, side='right'))
+        right = max(left, right)
+        if rows is None:
+            return slice(left * self.n_stations, right * self.n_stations)
+        rows = np.asarray(rows, dtype=np.intp)
+        return (np.arange(left, right)[:, None] * self.n_stations + rows[None, :]).ravel()
+
+    def frame(self, rows=None, start_year=None, end_year=None):
+        """DataFrame largo con columnas ``Nom_Est``, ``Año`` y ``Precipitación``.
+
+        Con ``rows=None`` las columnas numéricas son vistas de los arreglos compartidos.
+        ``Nom_Est`` es categórica para no materializar un texto por fila.
+        """
+        pos = self.positions(rows, start_year, end_year)
+        return pd.DataFrame({
+            STATION_COL: pd.Categorical.from_codes(self.name_codes[pos], dtype=self._name_dtype, validate=False),
+            YEAR_COL: self.year[pos],
+            PRECIP_COL: self.precip[pos],
+        }, copy=False)
+
+    def matrix(self, rows=None, start_year=None, end_year=None):
+        """Años del rango y matriz (años × estaciones) de precipitación.
+
+        Con ``rows=None`` la matriz es una vista sin copia de la tabla compartida.
+        """
+        pos = self.positions(None, start_year, end_year)
+        block = self.precip[pos].reshape(-1, self.n_stations)
+        years = self.years[pos.start // max(self.n_stations, 1):pos.stop // max(self.n_stations, 1)]
+        if rows is not None:
+            block = block[:, np.asarray(rows, dtype=np.intp)]
+        return years, block
+
+    def stations(self, rows=None):
+        """Nombre y coordenadas WGS84 (``LAT_WGS84``/``LON_WGS84``) de cada estación, una por fila."""
+        first = slice(0, self.n_stations)
+        frame = pd.DataFrame({
+            STATION_COL: pd.Categorical.from_codes(self.name_codes[first], dtype=self._name_dtype, validate=False),
+            LAT_WGS84: self.lat,
+            LON_WGS84: self.lon,
+        }, copy=False)
+        return frame if rows is None else frame.iloc[np.asarray(rows, dtype=np.intp)]
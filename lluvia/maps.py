@@ -0,0 +1,153 @@
+"""Capas de mapa Folium construidas por columnas.
+
+En lugar de crear un ``folium.CircleMarker`` con su popup HTML por cada estación, las
+estaciones se envían al navegador como una sola FeatureCollection de puntos, armada a
+partir de columnas completas. Los marcadores, el agrupamiento (MarkerCluster), los
+popups y los tooltips se generan en el cliente a partir de las propiedades.
+Las superficies interpoladas se envían como una sola imagen PNG superpuesta.
+"""
+import branca
+import folium
+import matplotlib
+import numpy as np
+import pandas as pd
+from folium.plugins import MarkerCluster
+
+TOOLTIP_STYLE = "background-color: white; color: #333333; font-family: sans-serif; font-size: 12px; padding: 10px;"
+
+
+def _column_values(values):
+    """Lista serializable a JSON: flotantes redondeados a 2 decimales y vacíos como ``None``."""
+    values = pd.Series(values)
+    if pd.api.types.is_float_dtype(values):
+        values = values.round(2)
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def point_feature_collection(lat, lon, properties):
+    """FeatureCollection de puntos a partir de columnas.
+
+    ``properties`` es un diccionario ``nombre -> columna``; todas las columnas deben tener
+    la misma longitud que ``lat`` y ``lon``.
+    """
+    coords = np.column_stack([np.asarray(lon, dtype='float64'), np.asarray(lat, dtype='float64')]).round(6).tolist()
+    keys = list(properties)
+    columns = [_column_values(properties[key]) for key in keys]
+    features = [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': xy}, 'properties': dict(zip(keys, values))}
+        for xy, *values in zip(coords, *columns)
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def point_layer(lat, lon, properties, fields, aliases, name='Estaciones', color='blue', color_field=None, cluster=True):
+    """Capa de puntos (una sola GeoJson) opcionalmente agrupada con MarkerCluster.
+
+    ``properties`` es un diccionario ``nombre -> columna``; ``fields`` son las propiedades
+    que se muestran en el tooltip y el popup con las etiquetas ``aliases``. Si se indica
+    ``color_field``, el color de cada punto se toma de esa propiedad en lugar de ``color``.
+    """
+    collection = point_feature_collection(lat, lon, properties)
+    style = {}
+    if color_field is not None:
+        style['style_function'] = lambda feature: {'color': feature['properties'][color_field],
+                                                   'fillColor': feature['properties'][color_field]}
+    layer = folium.GeoJson(
+        collection,
+        name=name,
+        marker=folium.CircleMarker(radius=6, color=color, fill=True, fill_color=color, fill_opacity=0.6),
+        tooltip=folium.GeoJsonTooltip(fields=fields, aliases=aliases, style=TOOLTIP_STYLE),
+        popup=folium.GeoJsonPopup(fields=fields, aliases=aliases),
+        control=not cluster,
+        **style,
+    )
+    if not cluster:
+        return layer
+    group = MarkerCluster(name=name)
+    layer.add_to(group)
+    return group
+
+
+def station_layer(gdf, fields, aliases, name='Estaciones', color='blue', cluster=True):
+    """Capa de estaciones de un GeoDataFrame (ver :func:`point_layer`).
+
+    Para geometrías que no son puntos se usa un punto representativo. ``fields`` son las
+    columnas de ``gdf`` que se muestran en el tooltip y el popup con las etiquetas ``aliases``.
+    """
+    points = gdf.geometry.representative_point()
+    return point_layer(points.y.to_numpy(), points.x.to_numpy(), {field: gdf[field] for field in fields},
+                       fields, aliases, name=name, color=color, cluster=cluster)
+
+
+def area_layer(area, name='Área de búsqueda', color='red'):
+    """Contorno (sin relleno) de un área de búsqueda en WGS84: geometría shapely o GeoSeries."""
+    return folium.GeoJson(
+        area,
+        name=name,
+        style_function=lambda feature: {'color': color, 'weight': 2, 'fill': False, 'dashArray': '5, 5'},
+    )
+
+
+def raster_layer(surface, bounds, value_range=None, name='Superficie interpolada', cmap='YlGnBu', levels=None, opacity=0.6):
+    """Imagen RGBA de una superficie (filas de sur a norte) y su leyenda de colores.
+
+    ``levels`` clasifica los valores en ese número de intervalos (aspecto de isoyetas
+    rellenas); las celdas sin valor quedan transparentes.
+    """
+    surface = np.asarray(surface, dtype='float64')
+    finite = surface[np.isfinite(surface)]
+    if value_range is None:
+        value_range = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 1.0)
+    low, high = value_range
+    span = high - low if high > low else 1.0
+    scaled = np.clip((surface - low) / span, 0.0, 1.0)
+    if levels:
+        scaled = np.minimum(np.floor(scaled * levels), levels - 1) / max(levels - 1, 1)
+    colormap = matplotlib.colormaps[cmap]
+    rgba = colormap(np.nan_to_num(scaled), bytes=True)
+    rgba[..., 3] = np.where(np.isfinite(surface), 255, 0)
+    image = folium.raster_layers.ImageOverlay(
+        image=rgba, bounds=bounds, origin='lower', opacity=opacity, mercator_project=True, name=name,
+    )
+    # La escala continua necesita al menos dos colores aunque haya una sola clase
+    steps = max(levels or 8, 2)
+    legend = branca.colormap.LinearColormap(
+        [matplotlib.colors.to_hex(colormap(i / (steps - 1))) for i in range(steps)],
+        vmin=low, vmax=high, caption='Precipitación (mm)',
+    )
+    if levels == 1:
+        legend = branca.colormap.StepColormap([legend.colors[0]], vmin=low, vmax=high, caption=legend.caption)
+    elif levels:
+        legend = legend.to_step(levels)
+    return image, legend
+
+
+def choropleth_layer(polygons, values, name_field, caption, name='Agregación zonal', cmap='YlGnBu', opacity=0.7):
+    """Polígonos coloreados por ``values`` (alineados con las filas de ``polygons``) y su leyenda.
+
+    Los polígonos sin valor se dibujan en gris. El tooltip muestra ``name_field`` y el valor.
+    """
+    values = np.asarray(values, dtype='float64')
+    finite = values[np.isfinite(values)]
+    low, high = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 1.0)
+    colormap = matplotlib.colormaps[cmap]
+    legend = branca.colormap.LinearColormap(
+        [matplotlib.colors.to_hex(colormap(i / 7)) for i in range(8)], vmin=low, vmax=high if high > low else low + 1,
+        caption=caption,
+    )
+    shapes = polygons[[name_field, polygons.geometry.name]].copy()
+    shapes[name_field] = shapes[name_field].astype(str)
+    shapes['valor'] = _column_values(values)
+
+    def style(feature):
+        value = feature['properties']['valor']
+        return {'fillColor': legend(value) if value is not None else '#cccccc',
+                'color': '#555555', 'weight': 1, 'fillOpacity': opacity}
+
+    layer = folium.GeoJson(
+        shapes,
+        name=name,
+        style_function=style,
+        tooltip=folium.GeoJsonTooltip(fields=[name_field, 'valor'], aliases=['Nombre', caption], style=TOOLTIP_STYLE),
+    )
+    return layer, legend
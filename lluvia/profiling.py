@@ -0,0 +1,182 @@
+"""Mediciones opcionales de cada recarga de la aplicación.
+
+``RerunProfiler`` registra, por etapa con nombre, el tiempo transcurrido, el pico de
+memoria reservada (``tracemalloc``) y, para lo que se envía al navegador, el tamaño en
+bytes. Desactivado, ``stage`` devuelve un contexto vacío compartido, ``payload`` no
+evalúa el tamaño y ``timed`` llama directamente a la función, así que el costo es una
+comparación por etapa.
+
+``tracemalloc`` es global al proceso y encarece todas las reservas de memoria de todas
+las sesiones, así que no lo enciende ni lo apaga cada perfilador: se inicia una sola vez
+al importar este módulo si ``LLUVIA_PROFILE_MEMORY=1``. Sin esa variable los perfiles
+sólo tienen tiempos y tamaños.
+
+Las etapas pueden anidarse (una pestaña y el gráfico que construye). El pico de cada
+etapa incluye el de sus etapas internas, y el tiempo que toma calcular un tamaño con
+``payload`` (p. ej. serializar un mapa) se descuenta de las etapas que lo contienen.
+Con varias sesiones a la vez, los picos de memoria de una recarga incluyen lo que
+reservaron las demás.
+
+Al terminar la recarga (o la de un fragmento) los registros se agregan a un archivo
+JSON Lines, uno por etapa, con el identificador y el tipo de la recarga.
+"""
+import contextlib
+import datetime
+import functools
+import json
+import os
+import time
+import tracemalloc
+import uuid
+
+import altair as alt
+import pandas as pd
+
+FULL_RUN = 'completa'
+FRAGMENT_RUN = 'fragmento'
+
+_NULL_STAGE = contextlib.nullcontext()
+
+# Interruptor del proceso para medir memoria; se lee una sola vez
+TRACE_MEMORY = os.environ.get('LLUVIA_PROFILE_MEMORY') == '1'
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+def _traced_memory():
+    """``(actual, pico)`` de ``tracemalloc``, o ``None`` si no está midiendo."""
+    return tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+
+
+class RerunProfiler:
+    """Tiempos, picos de memoria y tamaños de las etapas de una recarga."""
+
+    def __init__(self, enabled=False, log_path=None):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.records = []
+        self.finished = False
+        self._stack = []
+        self._restart(FULL_RUN)
+
+    def _restart(self, kind):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.records = []
+        self.finished = False
+        self._started = time.perf_counter()
+
+    def stage(self, name):
+        """Contexto que mide la etapa ``name``."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._measure(name)
+
+    @contextlib.contextmanager
+    def _measure(self, name):
+        memory = _traced_memory()
+        current = 0
+        if memory is not None:
+            current, peak = memory
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+        frame = {'memory': current, 'peak': current, 'excluded': 0.0}
+        # Se agrega al empezar para que la tabla quede en el orden de ejecución
+        record = {'stage': name, 'depth': len(self._stack)}
+        self.records.append(record)
+        self._stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started - frame['excluded']
+            self._stack.pop()
+            record['seconds'] = round(elapsed, 6)
+            memory = _traced_memory()
+            if memory is not None:
+                frame['peak'] = max(frame['peak'], memory[1])
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], frame['peak'])
+                record['peak_mb'] = round((frame['peak'] - frame['memory']) / 2 ** 20, 3)
+
+    def payload(self, name, size):
+        """Registra el tamaño en bytes que devuelve ``size()``; sólo se evalúa si el perfilado está activo."""
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        nbytes = int(size())
+        elapsed = time.perf_counter() - started
+        for frame in self._stack:
+            frame['excluded'] += elapsed
+        self.records.append({'stage': name, 'depth': len(self._stack), 'bytes': nbytes})
+
+    def timed(self, name):
+        """Decorador que mide la función como etapa ``name``.
+
+        Si la función se vuelve a ejecutar después de terminada la recarga (un fragmento
+        de Streamlit que se recarga solo), la ejecución se registra como una recarga propia.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                if not self.finished:
+                    with self._measure(name):
+                        return func(*args, **kwargs)
+                self._restart(FRAGMENT_RUN)
+                try:
+                    with self._measure(name):
+                        return func(*args, **kwargs)
+                finally:
+                    self.finish()
+            return wrapper
+        return decorate
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self._started
+
+    def finish(self):
+        """Cierra la recarga y agrega sus registros al archivo de log (si hay uno)."""
+        if not self.enabled or self.finished:
+            return
+        self.finished = True
+        # El pico de la recarga es el mayor de sus etapas
+        total = {'stage': 'total', 'depth': 0, 'seconds': round(self.total_seconds, 6)}
+        peaks = [record['peak_mb'] for record in self.records if 'peak_mb' in record]
+        if peaks:
+            total['peak_mb'] = max(peaks)
+        self.records.append(total)
+        if self.log_path:
+            timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+            header = {'timestamp': timestamp, 'run_id': self.run_id, 'run': self.kind}
+            with open(self.log_path, 'a', encoding='utf-8') as log:
+                for record in self.records:
+                    log.write(json.dumps({**header, **record}, ensure_ascii=False) + '\n')
+
+    def frame(self):
+        """Tabla de la recarga para mostrar: etapa (con sangría según el anidamiento), ms, MB y bytes."""
+        table = pd.DataFrame(self.records, columns=['stage', 'depth', 'seconds', 'peak_mb', 'bytes'])
+        return pd.DataFrame({
+            'Etapa': [' ' * depth + stage for stage, depth in zip(table['stage'], table['depth'])],
+            'ms': (table['seconds'] * 1000).round(1),
+            'Pico (MB)': table['peak_mb'],
+            'Bytes': table['bytes'].astype('Int64'),
+        })
+
+
+def json_size(figure):
+    """Bytes del JSON de una figura de Plotly o un gráfico de Altair (lo que recibe el navegador).
+
+    ``st.altair_chart`` no limita las filas, así que el tamaño se mide sin el límite de
+    5000 filas de Altair (``MaxRowsError``).
+    """
+    with alt.data_transformers.disable_max_rows():
+        return len(figure.to_json().encode('utf-8'))
+
+
+def html_size(fmap):
+    """Bytes del HTML de un mapa de Folium."""
+    return len(fmap.get_root().render().encode('utf-8'))
@@ -0,0 +1,128 @@
+"""Búsqueda de estaciones por nombre, código, municipio y vereda.
+
+``StationSearch`` se construye una vez por conjunto de datos. El texto de cada campo se
+normaliza con :func:`lluvia.zonal.normalize_name` (sin tildes y en mayúsculas, así que
+"Abriaqui" encuentra "Abriaquí") y se parte en palabras. Con eso se arman:
+
+* la lista ordenada de todas las palabras con su estación, donde las palabras que
+  empiezan por un término se encuentran con dos búsquedas binarias;
+* una matriz dispersa estación × trigrama (a partir de una matriz palabra × trigrama,
+  para no repetir el trabajo de las palabras comunes), para tolerar errores de escritura.
+
+Cada término que es prefijo de alguna palabra de la estación suma un punto, y la
+similitud de trigramas (fracción de los trigramas de la consulta presentes en la
+estación) desempata y encuentra las estaciones mal escritas. Sólo se ordenan los
+``limit`` mejores resultados; el orden alfabético de los nombres se calcula una vez.
+"""
+import re
+
+import numpy as np
+from scipy import sparse
+
+from lluvia.zonal import normalize_name
+
+SEARCH_COLUMNS = ('Nom_Est', 'Id_estacion', 'municipio', 'vereda')
+
+# Similitud de trigramas mínima para que una estación sin términos coincidentes aparezca
+MIN_SIMILARITY = 0.35
+
+_WORD = re.compile(r'[0-9A-Z]+')
+
+
+def words(text):
+    """Palabras normalizadas (sin tildes, en mayúsculas, sólo letras y dígitos) de ``text``."""
+    return _WORD.findall(normalize_name(text))
+
+
+def trigrams(word):
+    """Trigramas de una palabra con un espacio de relleno al principio y al final."""
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StationSearch:
+    """Índice de prefijos y de trigramas de las estaciones (posiciones 0..n-1 del DataFrame)."""
+
+    def __init__(self, df, columns=SEARCH_COLUMNS):
+        self.names = df['Nom_Est'].astype(str).to_numpy(dtype=object)
+        # Orden alfabético de los nombres, calculado una sola vez
+        self.order = np.argsort(self.names, kind='stable')
+        self.rank = np.empty(len(self.names), dtype=np.int64)
+        self.rank[self.order] = np.arange(len(self.names))
+
+        vocabulary = {}
+        station_ids, word_ids = [], []
+        columns = [col for col in columns if col in df.columns]
+        texts = [df[col].astype(object).where(df[col].notna(), '').astype(str).to_numpy() for col in columns]
+        for station, values in enumerate(zip(*texts)):
+            for word in set(words(' '.join(values))):
+                station_ids.append(station)
+                word_ids.append(vocabulary.setdefault(word, len(vocabulary)))
+        station_ids = np.asarray(station_ids, dtype=np.int64)
+        word_ids = np.asarray(word_ids, dtype=np.int64)
+
+        # Palabras ordenadas (una entrada por palabra y estación) para buscar por prefijo
+        vocab = np.empty(len(vocabulary), dtype=object)
+        vocab[list(vocabulary.values())] = list(vocabulary)
+        by_word = np.lexsort((station_ids, vocab[word_ids].astype(str)))
+        self._words = vocab[word_ids[by_word]]
+        self._word_stations = station_ids[by_word]
+
+        # Estación × trigrama (binaria) = estación × palabra @ palabra × trigrama
+        self._trigrams = {}
+        word_rows, trigram_cols = [], []
+        for word_id, word in enumerate(vocab):
+            for gram in trigrams(word):
+                word_rows.append(word_id)
+                trigram_cols.append(self._trigrams.setdefault(gram, len(self._trigrams)))
+        word_trigram = sparse.csr_matrix((np.ones(len(word_rows), dtype=np.float32), (word_rows, trigram_cols)),
+                                         shape=(len(vocab), len(self._trigrams)))
+        station_word = sparse.csr_matrix((np.ones(len(station_ids), dtype=np.float32), (station_ids, word_ids)),
+                                         shape=(len(self.names), len(vocab)))
+        self._station_trigram = (station_word @ word_trigram).tocsc()
+        self._station_trigram.data[:] = 1.0
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix_stations(self, term):
+        lo = np.searchsorted(self._words, term, side='left')
+        hi = np.searchsorted(self._words, term + '\uffff', side='right')
+        return np.unique(self._word_stations[lo:hi])
+
+    def scores(self, query):
+        """Puntaje de cada estación: términos que son prefijo de alguna palabra más la similitud de trigramas."""
+        terms = words(query)
+        prefix = np.zeros(len(self.names))
+        for term in terms:
+            prefix[self._prefix_stations(term)] += 1.0
+        grams = set().union(*(trigrams(term) for term in terms)) if terms else set()
+        columns = [self._trigrams[gram] for gram in grams if gram in self._trigrams]
+        similarity = np.zeros(len(self.names))
+        if grams and columns:
+            similarity = np.asarray(self._station_trigram[:, columns].sum(axis=1)).ravel() / len(grams)
+        return prefix, similarity, len(terms)
+
+    def search(self, query, mask=None, limit=50):
+        """Posiciones de las ``limit`` estaciones que mejor coinciden con ``query`` dentro de ``mask``.
+
+        Sin consulta devuelve las primeras estaciones de ``mask`` en orden alfabético.
+        """
+        if not words(query):
+            order = self.order if mask is None else self.order[mask[self.order]]
+            return order[:limit]
+        prefix, similarity, _ = self.scores(query)
+        score = prefix + similarity
+        candidates = np.flatnonzero((prefix > 0) | (similarity >= MIN_SIMILARITY))
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if len(candidates) > limit:
+            # Sólo los mejores ``limit`` se ordenan; el resto se descarta con una partición
+            candidates = candidates[np.argpartition(-score[candidates], limit - 1)[:limit]]
+        return candidates[np.lexsort((self.rank[candidates], -score[candidates]))]
+
+    def matches(self, query, mask=None):
+        """Máscara de las estaciones en las que cada término de ``query`` es prefijo de alguna palabra."""
+        prefix, _, n_terms = self.scores(query)
+        found = (prefix >= n_terms) if n_terms else np.zeros(len(self.names), dtype=bool)
+        return found if mask is None else found & mask
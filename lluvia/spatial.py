@@ -0,0 +1,86 @@
+"""Índice espacial de estaciones (STRtree) y consultas por rectángulo, distancia y polígono.
+
+El índice se construye una vez por conjunto de datos proyectando las coordenadas WGS84 de
+las estaciones a MAGNA-SIRGAS CMT12 (EPSG:9377, en metros), de modo que las distancias se
+miden directamente en metros sin importar el CRS original del CSV. Las consultas reciben
+coordenadas WGS84 (lon/lat) o geometrías en cualquier CRS y devuelven las posiciones
+(ordenadas) de las estaciones en el DataFrame.
+"""
+import numpy as np
+import shapely
+from pyproj import CRS
+from shapely import STRtree
+
+from lluvia.loading import LAT_WGS84, LON_WGS84, SOURCE_CRS, TARGET_CRS, get_transformer
+
+# Longitud máxima (en grados) de los lados de un rectángulo lon/lat antes de proyectarlo,
+# para que sus bordes sigan los meridianos y paralelos en el CRS del índice
+BOX_SEGMENT_DEGREES = 0.05
+
+
+def _transform_geometry(geometry, transformer):
+    return shapely.transform(geometry, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+
+class StationIndex:
+    """STRtree sobre los puntos de las estaciones en un CRS proyectado (en metros)."""
+
+    def __init__(self, x, y, crs=SOURCE_CRS):
+        self.crs = CRS.from_user_input(crs)
+        self.points = shapely.points(np.asarray(x, dtype='float64'), np.asarray(y, dtype='float64'))
+        self.tree = STRtree(self.points)
+        self._from_lonlat = get_transformer(TARGET_CRS, self.crs.to_string())
+        self._to_lonlat = get_transformer(self.crs.to_string(), TARGET_CRS)
+
+    @classmethod
+    def from_frame(cls, df, crs=SOURCE_CRS):
+        """Índice a partir de las columnas WGS84 de la tabla de estaciones."""
+        x, y = get_transformer(TARGET_CRS, crs).transform(df[LON_WGS84].to_numpy(dtype='float64'),
+                                                          df[LAT_WGS84].to_numpy(dtype='float64'))
+        return cls(x, y, crs=crs)
+
+    def __len__(self):
+        return len(self.points)
+
+    def to_index_crs(self, geometry, crs=TARGET_CRS):
+        """Reproyecta una geometría (o arreglo de geometrías) al CRS del índice."""
+        crs = CRS.from_user_input(crs)
+        if crs == self.crs:
+            return geometry
+        transformer = get_transformer(crs.to_string(), self.crs.to_string())
+        return _transform_geometry(geometry, transformer)
+
+    def to_lonlat(self, geometry):
+        """Reproyecta una geometría del CRS del índice a WGS84."""
+        return _transform_geometry(geometry, self._to_lonlat)
+
+    def bounds_lonlat(self):
+        """Extensión de las estaciones en WGS84: ``(lon_min, lat_min, lon_max, lat_max)``."""
+        if not len(self):
+            return (np.nan, np.nan, np.nan, np.nan)
+        return self._to_lonlat.transform_bounds(*shapely.total_bounds(self.points))
+
+    def in_polygon(self, geometry, crs=TARGET_CRS):
+        """Estaciones dentro de (o sobre el borde de) una geometría o de cualquiera de un arreglo de geometrías."""
+        geometry = self.to_index_crs(geometry, crs)
+        hits = self.tree.query(geometry, predicate='intersects')
+        return np.unique(hits[-1] if hits.ndim == 2 else hits)
+
+    def in_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """Estaciones dentro de un rectángulo lon/lat."""
+        return self.in_polygon(self.bbox_area(min_lon, min_lat, max_lon, max_lat))
+
+    def within_distance(self, lon, lat, km):
+        """Estaciones a ``km`` kilómetros o menos de un punto lon/lat (distancia en el plano CMT12)."""
+        x, y = self._from_lonlat.transform(lon, lat)
+        return np.sort(self.tree.query(shapely.Point(x, y), predicate='dwithin', distance=km * 1000.0))
+
+    @staticmethod
+    def bbox_area(min_lon, min_lat, max_lon, max_lat):
+        """Rectángulo lon/lat densificado, listo para consultar o dibujar."""
+        return shapely.segmentize(shapely.box(min_lon, min_lat, max_lon, max_lat), BOX_SEGMENT_DEGREES)
+
+    def circle_area(self, lon, lat, km):
+        """Círculo de ``km`` kilómetros alrededor de un punto, en WGS84, para dibujarlo en el mapa."""
+        x, y = self._from_lonlat.transform(lon, lat)
+        return self.to_lonlat(shapely.Point(x, y).buffer(km * 1000.0, quad_segs=32))
@@ -0,0 +1,181 @@
+"""Estadísticas por estación sobre rangos de años, respondidas en tiempo constante.
+
+``StatsCube`` se construye una vez por conjunto de datos a partir de la matriz
+estación × año:
+
+* sumas prefijas de valores, cuadrados y conteos para la media y la desviación estándar;
+* tablas dispersas (sparse tables) con el índice del máximo y del mínimo de cada bloque
+  de 2^k años, para consultar máximo/mínimo y su año en cualquier rango.
+
+Cualquier rango ``(inicio, fin)`` del deslizador se resuelve con unas pocas operaciones
+vectorizadas sobre todas las estaciones, sin recorrer los años del rango.
+"""
+import numpy as np
+import pandas as pd
+
+from lluvia.store import year_columns
+
+MAX_COL = 'Precipitación Máxima (mm)'
+MAX_YEAR_COL = 'Año Máximo'
+MIN_COL = 'Precipitación Mínima (mm)'
+MIN_YEAR_COL = 'Año Mínimo'
+MEAN_COL = 'Precipitación Media (mm)'
+STD_COL = 'Desviación Estándar'
+
+STAT_COLUMNS = [MAX_COL, MAX_YEAR_COL, MIN_COL, MIN_YEAR_COL, MEAN_COL, STD_COL]
+
+
+def _sparse_table(values, prefer_left):
+    """Índices del mejor valor de cada bloque ``[i, i + 2^k)``, un arreglo por nivel ``k``.
+
+    En caso de empate se conserva el índice de la izquierda, igual que ``idxmax``/``idxmin``.
+    """
+    n_years = values.shape[1]
+    dtype = np.int16 if n_years < 2 ** 15 else np.int32
+    levels = [np.broadcast_to(np.arange(n_years, dtype=dtype), values.shape).copy()]
+    span = 1
+    while 2 * span <= n_years:
+        prev = levels[-1]
+        left, right = prev[:, :-span], prev[:, span:]
+        keep_left = prefer_left(np.take_along_axis(values, left, axis=1),
+                                np.take_along_axis(values, right, axis=1))
+        levels.append(np.where(keep_left, left, right))
+        span *= 2
+    return levels
+
+
+class StatsCube:
+    """Estructura precalculada para estadísticas de rango de años por estación."""
+
+    def __init__(self, values, years):
+        values = np.asarray(values, dtype='float64')
+        self.years = np.asarray([int(year) for year in years])
+        self.year_labels = np.array([str(year) for year in self.years], dtype=object)
+
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        zeros = np.zeros((values.shape[0], 1))
+        self._sum = np.hstack([zeros, np.cumsum(filled, axis=1)])
+        self._sumsq = np.hstack([zeros, np.cumsum(filled ** 2, axis=1)])
+        self._count = np.hstack([zeros, np.cumsum(valid, axis=1)])
+
+        # Los vacíos nunca ganan un máximo ni un mínimo
+        self._max_values = np.where(valid, values, -np.inf)
+        self._min_values = np.where(valid, values, np.inf)
+        self._argmax = _sparse_table(self._max_values, np.greater_equal)
+        self._argmin = _sparse_table(self._min_values, np.less_equal)
+
+    @classmethod
+    def from_frame(cls, df):
+        years = year_columns(df.columns)
+        return cls(df[years].to_numpy(dtype='float64'), years)
+
+    def __len__(self):
+        return self._sum.shape[0]
+
+    def _bounds(self, start_year, end_year):
+        """Posiciones ``[l, r]`` de las columnas de año presentes en el rango (``l > r`` si no hay ninguna)."""
+        left = int(np.searchsorted(self.years, start_year, side='left'))
+        right = int(np.searchsorted(self.years, end_year, side='right')) - 1
+        return left, right
+
+    def _rows(self, rows):
+        return np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.intp)
+
+    def _range_arg(self, levels, values, prefer_left, rows, left, right):
+        k = (right - left + 1).bit_length() - 1
+        table = levels[k]
+        a = table[rows, left].astype(np.intp)
+        b = table[rows, right - (1 << k) + 1].astype(np.intp)
+        value_a, value_b = values[rows, a], values[rows, b]
+        keep_a = prefer_left(value_a, value_b)
+        return np.where(keep_a, a, b), np.where(keep_a, value_a, value_b)
+
+    def _sums(self, rows, left, right):
+        total = self._sum[rows, right + 1] - self._sum[rows, left]
+        total_sq = self._sumsq[rows, right + 1] - self._sumsq[rows, left]
+        count = self._count[rows, right + 1] - self._count[rows, left]
+        return total, total_sq, count
+
+    @staticmethod
+    def _mean_std(total, total_sq, count):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+            var = np.where(count > 1, (total_sq - total * total / count) / (count - 1), np.nan)
+        return mean, np.sqrt(np.clip(var, 0.0, None))
+
+    def query(self, start_year, end_year, rows=None):
+        """Máximo, mínimo (con su año), media y desviación estándar por estación en el rango.
+
+        ``rows`` son las posiciones de las estaciones (por defecto, todas). Devuelve un
+        DataFrame con una fila por estación en el mismo orden y las columnas ``STAT_COLUMNS``.
+        """
+        rows = self._rows(rows)
+        left, right = self._bounds(start_year, end_year)
+        if left > right or len(rows) == 0:
+            empty, no_year = np.full(len(rows), np.nan), np.full(len(rows), None, dtype=object)
+            return pd.DataFrame({MAX_COL: empty, MAX_YEAR_COL: no_year, MIN_COL: empty,
+                                 MIN_YEAR_COL: no_year, MEAN_COL: empty, STD_COL: empty})
+
+        max_idx, max_values = self._range_arg(self._argmax, self._max_values, np.greater_equal, rows, left, right)
+        min_idx, min_values = self._range_arg(self._argmin, self._min_values, np.less_equal, rows, left, right)
+        has_data = np.isfinite(max_values)
+        mean, std = self._mean_std(*self._sums(rows, left, right))
+
+        return pd.DataFrame({
+            MAX_COL: np.where(has_data, max_values, np.nan).round(2),
+            MAX_YEAR_COL: np.where(has_data, self.year_labels[max_idx], None),
+            MIN_COL: np.where(has_data, min_values, np.nan).round(2),
+            MIN_YEAR_COL: np.where(has_data, self.year_labels[min_idx], None),
+            MEAN_COL: mean.round(2),
+            STD_COL: std.round(2),
+        })
+
+    def summary(self, start_year, end_year, rows=None):
+        """Estadísticas del conjunto de estaciones en el rango, como si se juntaran todos sus valores.
+
+        El año del máximo/mínimo es el primero en el que alguna estación alcanza ese valor.
+        """
+        rows = self._rows(rows)
+        left, right = self._bounds(start_year, end_year)
+        result = {MAX_COL: np.nan, MAX_YEAR_COL: 'N/A', MIN_COL: np.nan, MIN_YEAR_COL: 'N/A',
+                  MEAN_COL: np.nan, STD_COL: np.nan}
+        if left > right or len(rows) == 0:
+            return result
+
+        max_idx, max_values = self._range_arg(self._argmax, self._max_values, np.greater_equal, rows, left, right)
+        min_idx, min_values = self._range_arg(self._argmin, self._min_values, np.less_equal, rows, left, right)
+        total, total_sq, count = (part.sum() for part in self._sums(rows, left, right))
+        mean, std = self._mean_std(np.array([total]), np.array([total_sq]), np.array([count]))
+
+        if np.isfinite(max_values).any():
+            max_value, min_value = max_values.max(), min_values.min()
+            result[MAX_COL] = float(max_value)
+            result[MAX_YEAR_COL] = self.year_labels[max_idx[max_values == max_value].min()]
+            result[MIN_COL] = float(min_value)
+            result[MIN_YEAR_COL] = self.year_labels[min_idx[min_values == min_value].min()]
+        result[MEAN_COL] = round(float(mean[0]), 2)
+        result[STD_COL] = round(float(std[0]), 2)
+        return result
+
+
+# Columnas de identificación que acompañan a las estadísticas en la tabla por estación
+INFO_COLUMNS = ['Nom_Est', 'Id_estacion', 'municipio', 'vereda']
+
+SUMMARY_LABEL = 'Todas las estaciones'
+
+
+def stats_table(df, cube, start_year, end_year, rows, info_columns=INFO_COLUMNS):
+    """Tabla por estación (columnas de ``info_columns`` y estadísticas) más una fila de resumen.
+
+    Devuelve la tabla y el diccionario del resumen; sin estaciones la tabla sólo trae las
+    columnas de identificación y el resumen está vacío.
+    """
+    table = df.iloc[np.asarray(rows, dtype=np.intp)][info_columns].copy()
+    if not len(table):
+        return table, {}
+    for col, values in cube.query(start_year, end_year, rows).items():
+        table[col] = values.to_numpy()
+    summary = cube.summary(start_year, end_year, rows)
+    summary_row = pd.DataFrame([{**{col: None for col in info_columns}, info_columns[0]: SUMMARY_LABEL, **summary}])
+    return pd.concat([table, summary_row], ignore_index=True), summary
@@ -0,0 +1,124 @@
+"""Almacenamiento columnar (Parquet) de la matriz estación × año.
+
+El CSV de estaciones se convierte una sola vez a Parquet con tipos compactos: los años
+quedan en ``float32`` y las columnas de agrupación como ``category``. ``read_store``
+proyecta sólo las columnas y los años pedidos, así que no hace falta decodificar texto
+ni columnas que no se van a usar; ``lluvia.batch`` lee así sólo lo que usan sus trabajos.
+
+Conversión desde la línea de comandos::
+
+    python -m lluvia.store mapaCV.csv
+"""
+import argparse
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from lluvia.loading import LAT_WGS84, LON_WGS84, normalize_coordinates, read_stations_csv
+
+# Columnas de agrupación que se guardan como categóricas
+CATEGORICAL_COLUMNS = ['municipio', 'Celda_XY', 'departamento', 'SUBREGION', 'AH', 'ZSZH']
+
+STORE_SUFFIX = '.parquet'
+
+
+def year_columns(columns):
+    """Columnas cuyo nombre es un año de cuatro dígitos, en el orden original."""
+    return [col for col in columns if str(col).isdigit() and len(str(col)) == 4]
+
+
+def to_columnar(df):
+    """Devuelve una copia con los años en float32 y las columnas de agrupación categóricas."""
+    typed = {col: pd.to_numeric(df[col], errors='coerce').astype('float32') for col in year_columns(df.columns)}
+    typed.update({col: df[col].astype('category') for col in CATEGORICAL_COLUMNS if col in df.columns})
+    return df.assign(**typed)
+
+
+def store_path(source, output_dir=None):
+    """Ruta del store para un CSV: ``mapaCV.csv`` -> ``mapaCV.parquet``."""
+    root, _ = os.path.splitext(os.path.basename(source))
+    return os.path.join(output_dir or os.path.dirname(os.path.abspath(source)), root + STORE_SUFFIX)
+
+
+def write_store(df, path):
+    to_columnar(df).to_parquet(path, index=False, compression='zstd')
+    return path
+
+
+def store_columns(path):
+    return pq.read_schema(path).names
+
+
+def projection(names, columns=None, years=None):
+    """Columnas de ``names`` a leer: metadatos de ``columns`` y años dentro de los rangos ``years``.
+
+    ``columns=None`` son todas las columnas que no son años; ``years`` es una lista de rangos
+    ``(inicio, fin)`` inclusivos (``None``, todos los años; una lista vacía, ninguno).
+    """
+    all_years = year_columns(names)
+    if columns is None:
+        meta = [col for col in names if col not in all_years]
+    else:
+        meta = [col for col in names if col in columns and col not in all_years]
+    if years is None:
+        selected_years = all_years
+    else:
+        selected_years = [col for col in all_years if any(start <= int(col) <= end for start, end in years)]
+    return meta + selected_years
+
+
+def read_store(path, columns=None, years=None):
+    """Lee el store proyectando sólo lo necesario (ver :func:`projection`)."""
+    if columns is None and years is None:
+        return pd.read_parquet(path)
+    return pd.read_parquet(path, columns=projection(store_columns(path), columns, years))
+
+
+def read_stations(source, columns=None, years=None):
+    """Lee la tabla de estaciones desde un store Parquet o desde el CSV, siempre con tipos compactos.
+
+    ``columns`` y ``years`` limitan lo que se lee (ver :func:`projection`). Un store se lee
+    sólo con esas columnas; un CSV se lee completo y luego se proyecta.
+    """
+    if isinstance(source, (str, os.PathLike)) and str(source).endswith(STORE_SUFFIX):
+        read_columns = columns
+        if columns is not None and {LAT_WGS84, LON_WGS84} & set(columns):
+            # Stores escritos antes de agregar las columnas WGS84: se calculan desde las originales
+            read_columns = [*columns, 'Latitud', 'Longitud']
+        df = normalize_coordinates(read_store(source, read_columns, years))
+    else:
+        df = to_columnar(read_stations_csv(source))
+    if columns is None and years is None:
+        return df
+    return df[projection(list(df.columns), columns, years)]
+
+
+def source_years(source):
+    """Columnas de año de un store o un CSV, leyendo sólo el esquema o el encabezado."""
+    if str(source).endswith(STORE_SUFFIX):
+        return year_columns(store_columns(source))
+    return year_columns(pd.read_csv(source, sep=';', nrows=0).columns)
+
+
+def bundled_source(csv_path):
+    """Prefiere el store Parquet junto al CSV si existe y no es más antiguo que el CSV."""
+    path = store_path(csv_path)
+    if os.path.exists(path) and (not os.path.exists(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path)):
+        return path
+    return csv_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convierte el CSV de estaciones a Parquet.")
+    parser.add_argument('csv', help="Archivo CSV separado por ';' (p. ej. mapaCV.csv)")
+    parser.add_argument('-o', '--output-dir', help="Directorio de salida (por defecto, junto al CSV)")
+    args = parser.parse_args(argv)
+
+    df = read_stations_csv(args.csv)
+    path = write_store(df, store_path(args.csv, args.output_dir))
+    print(f"{args.csv} -> {path} ({len(df)} filas, {len(year_columns(df.columns))} años)")
+
+
+if __name__ == '__main__':
+    main()
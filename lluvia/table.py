@@ -0,0 +1,79 @@
+"""Tabla paginada de estaciones con escala de colores calculada sólo para la página visible.
+
+``Styler.background_gradient`` sobre toda la selección calcula y serializa un estilo CSS
+por celda estación × año. Aquí se ordena la selección una vez (un ``argsort``), se
+toma sólo la página pedida y los colores se calculan de forma vectorizada para esas
+filas, con los límites de cada columna tomados de la selección completa para que una
+misma cifra tenga el mismo color en todas las páginas.
+"""
+import math
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+PAGE_SIZES = (25, 50, 100, 250)
+
+# Umbral de luminancia relativa bajo el cual el texto pasa a blanco (el de ``background_gradient``)
+TEXT_COLOR_THRESHOLD = 0.408
+
+
+def page_count(n_rows, page_size):
+    return max(1, math.ceil(n_rows / page_size))
+
+
+def sort_positions(column, ascending=True):
+    """Posiciones que ordenan ``column`` (vacíos al final); ordenamiento estable."""
+    values = pd.Series(column).reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+
+def column_limits(df, columns):
+    """Mínimo y máximo de cada columna sobre todas las filas, como Series indexadas por columna."""
+    values = df[columns].to_numpy(dtype='float64')
+    finite = np.isfinite(values)
+    low = np.where(finite, values, np.inf).min(axis=0, initial=np.inf)
+    high = np.where(finite, values, -np.inf).max(axis=0, initial=-np.inf)
+    return pd.Series(low, index=columns), pd.Series(high, index=columns)
+
+
+def gradient_css(values, low, high, cmap='RdYlBu_r'):
+    """Estilos CSS (fondo y color de texto) para una matriz, escalando cada columna entre ``low`` y ``high``."""
+    values = np.asarray(values, dtype='float64')
+    span = np.where(high > low, high - low, 1.0)
+    scaled = np.clip((values - low) / span, 0.0, 1.0)
+    rgba = matplotlib.colormaps[cmap](np.nan_to_num(scaled))
+    linear = np.where(rgba[..., :3] <= 0.03928, rgba[..., :3] / 12.92, ((rgba[..., :3] + 0.055) / 1.055) ** 2.4)
+    luminance = linear @ np.array([0.2126, 0.7152, 0.0722])
+    rgb = (rgba[..., :3] * 255).round().astype(np.int64)
+    hex_colors = np.char.mod('#%06x', rgb @ np.array([1 << 16, 1 << 8, 1]))
+    text = np.where(luminance < TEXT_COLOR_THRESHOLD, '#f1f1f1', '#000000')
+    css = np.char.add(np.char.add(np.char.add('background-color: ', hex_colors), '; color: '), text)
+    return np.where(np.isfinite(values), css, '')
+
+
+def table_page(df, page, page_size, sort_by=None, ascending=True, columns=None):
+    """Filas de la página ``page`` (desde 1) de ``df`` ordenado por ``sort_by``, con las columnas ``columns``."""
+    order = sort_positions(df[sort_by], ascending) if sort_by is not None else np.arange(len(df))
+    start = (page - 1) * page_size
+    return df.iloc[order[start:start + page_size]][columns if columns is not None else df.columns]
+
+
+def styled_page(page, color_columns, low, high, cmap='RdYlBu_r', marks=None, mark=' *'):
+    """Styler de una página con la escala de colores de ``color_columns``.
+
+    ``low`` y ``high`` son los límites por columna de :func:`column_limits`. ``marks`` es una
+    matriz booleana (filas × ``color_columns``) de celdas que se muestran con el sufijo ``mark``.
+    """
+    color_columns = [col for col in color_columns if col in page.columns]
+    if not color_columns or page.empty:
+        return page.style
+    values = page[color_columns].to_numpy(dtype='float64')
+    css = gradient_css(values, low[color_columns].to_numpy(), high[color_columns].to_numpy(), cmap)
+    styles = pd.DataFrame(css, index=page.index, columns=color_columns)
+    if marks is None:
+        return page.style.apply(lambda _: styles, axis=None, subset=color_columns).format(precision=2, subset=color_columns)
+    text = np.where(np.isfinite(values), np.char.mod('%.2f', values), '')
+    text = np.where(np.asarray(marks, dtype=bool), np.char.add(text, mark), text)
+    display = page.assign(**{col: text[:, j] for j, col in enumerate(color_columns)})
+    return display.style.apply(lambda _: styles, axis=None, subset=color_columns)
@@ -0,0 +1,133 @@
+"""Tendencias y anomalías de toda la red, calculadas por bloques sobre la matriz estación × año.
+
+Para ``n`` años hay ``n (n - 1) / 2`` parejas de años ``i < j``. En lugar de recorrer
+estaciones y parejas en Python, las diferencias de todas las parejas se calculan de una
+vez para un bloque de estaciones (matriz estaciones × parejas) y de ahí salen:
+
+* el estadístico ``S`` de Mann-Kendall (suma de signos), su varianza con corrección por
+  empates, ``Z`` y el valor p bilateral;
+* la pendiente de Sen (mediana de las pendientes de todas las parejas).
+
+Las anomalías son z-scores respecto a la climatología (media y desviación estándar) de
+cada estación en el rango, y los años húmedos/secos son los que superan ``±threshold``.
+Los años sin dato (NaN) se excluyen de cada estación.
+"""
+import numpy as np
+import pandas as pd
+from scipy.special import erfc
+
+# Etiquetas de las columnas de resultados
+S_COL = 'S de Mann-Kendall'
+Z_COL = 'Z'
+P_COL = 'Valor p'
+TREND_COL = 'Tendencia'
+SLOPE_COL = 'Pendiente de Sen (mm/año)'
+WET_COL = 'Años húmedos'
+DRY_COL = 'Años secos'
+
+INCREASING = 'Creciente'
+DECREASING = 'Decreciente'
+NO_TREND = 'Sin tendencia'
+
+# Colores de cada dirección de tendencia en el mapa
+TREND_COLORS = {INCREASING: '#2166ac', DECREASING: '#b2182b', NO_TREND: '#999999'}
+
+# Marcas de años húmedos/secos
+WET, NORMAL, DRY = 1, 0, -1
+
+
+def _tie_correction(values):
+    """``Σ t (t - 1) (2t + 5)`` sobre los grupos de valores empatados de cada fila (sin NaN)."""
+    ordered = np.sort(values, axis=1)
+    n_rows, n_cols = ordered.shape
+    valid = np.isfinite(ordered)
+    starts = np.ones_like(valid)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    # Etiqueta única por (fila, grupo de empate); los NaN no cuentan
+    labels = (np.arange(n_rows)[:, None] * (n_cols + 1) + np.cumsum(starts, axis=1))[valid]
+    groups, sizes = np.unique(labels, return_counts=True)
+    term = sizes * (sizes - 1) * (2 * sizes + 5)
+    return np.bincount(groups // (n_cols + 1), weights=term, minlength=n_rows)
+
+
+class TrendResult:
+    """Resultados por estación (arreglos alineados con las filas de la matriz de entrada)."""
+
+    def __init__(self, years, s, var_s, z, p, slope, n_years, zscores, alpha=0.05, threshold=1.0):
+        self.years = years
+        self.s = s
+        self.var_s = var_s
+        self.z = z
+        self.p = p
+        self.slope = slope
+        self.n_years = n_years
+        self.zscores = zscores
+        self.alpha = alpha
+        self.threshold = threshold
+
+    def __len__(self):
+        return len(self.s)
+
+    def trend(self, alpha=None):
+        """Dirección de la tendencia significativa al nivel ``alpha`` (por defecto el del cálculo)."""
+        alpha = self.alpha if alpha is None else alpha
+        significant = self.p < alpha
+        return np.where(significant & (self.z > 0), INCREASING, np.where(significant & (self.z < 0), DECREASING, NO_TREND))
+
+    def flags(self, threshold=None):
+        """Matriz (estaciones × años) int8: 1 húmedo, -1 seco, 0 normal o sin dato."""
+        threshold = self.threshold if threshold is None else threshold
+        zscores = np.nan_to_num(self.zscores)
+        return np.where(zscores >= threshold, WET, np.where(zscores <= -threshold, DRY, NORMAL)).astype(np.int8)
+
+    def frame(self, rows=None, alpha=None, threshold=None):
+        """Tabla por estación: S, Z, valor p, tendencia, pendiente de Sen y años húmedos/secos."""
+        rows = slice(None) if rows is None else np.asarray(rows, dtype=np.intp)
+        flags = self.flags(threshold)[rows]
+        return pd.DataFrame({
+            S_COL: self.s[rows],
+            Z_COL: np.round(self.z[rows], 3),
+            P_COL: np.round(self.p[rows], 4),
+            TREND_COL: self.trend(alpha)[rows],
+            SLOPE_COL: np.round(self.slope[rows], 3),
+            WET_COL: (flags == WET).sum(axis=1),
+            DRY_COL: (flags == DRY).sum(axis=1),
+        })
+
+
+def mann_kendall(values, years, alpha=0.05, threshold=1.0, chunk_size=2048):
+    """Mann-Kendall, pendiente de Sen y anomalías para la matriz (estaciones × años) ``values``."""
+    values = np.asarray(values, dtype='float64')
+    years = np.asarray(years, dtype='float64')
+    n_stations, n_years = values.shape
+    first, second = np.triu_indices(n_years, k=1)
+    span = years[second] - years[first]
+
+    s = np.zeros(n_stations)
+    slope = np.full(n_stations, np.nan)
+    for start in range(0, n_stations, chunk_size):
+        block = values[start:start + chunk_size]
+        # (estaciones del bloque × parejas de años); NaN si falta alguno de los dos años
+        diffs = block[:, second] - block[:, first]
+        s[start:start + len(block)] = np.nansum(np.sign(diffs), axis=1)
+        has_pairs = np.isfinite(diffs).any(axis=1)
+        if has_pairs.any():
+            slope[start:start + len(block)][has_pairs] = np.nanmedian(diffs[has_pairs] / span, axis=1)
+
+    valid = np.isfinite(values)
+    n = valid.sum(axis=1).astype('float64')
+    var_s = (n * (n - 1) * (2 * n + 5) - _tie_correction(values)) / 18.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(var_s > 0, (s - np.sign(s)) / np.sqrt(var_s), 0.0)
+    p = erfc(np.abs(z) / np.sqrt(2.0))
+
+    # Anomalías estandarizadas respecto a la climatología de cada estación en el rango
+    counts = np.maximum(n, 1)
+    mean = np.where(valid, values, 0.0).sum(axis=1) / counts
+    deviations = np.where(valid, values - mean[:, None], 0.0)
+    std = np.sqrt((deviations ** 2).sum(axis=1) / np.maximum(n - 1, 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zscores = np.where(valid & (std[:, None] > 0), deviations / std[:, None], np.nan)
+
+    return TrendResult(years.astype(int), s.astype(np.int64), var_s, z, p, slope, n.astype(int),
+                       zscores.astype('float32'), alpha=alpha, threshold=threshold)
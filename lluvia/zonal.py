@@ -0,0 +1,158 @@
+"""Agregación zonal de la matriz estación × año por municipio, cuenca y demás agrupaciones.
+
+``ZonalIndex`` factoriza una sola vez cada columna de agrupación en códigos enteros
+(``-1`` para vacíos) y guarda, por columna, una matriz dispersa de pertenencia
+grupo × estación. Con ella:
+
+* los filtros de la barra lateral son máscaras booleanas sobre los códigos (sin ``isin``
+  sobre texto ni copias del DataFrame);
+* las series por grupo (media, total, número de estaciones con dato y cobertura) salen
+  de dos productos dispersos sobre todos los años a la vez.
+"""
+import unicodedata
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from lluvia.store import year_columns
+
+# Columnas de agrupación y su nombre para mostrar
+GROUP_COLUMNS = {
+    'municipio': 'Municipio',
+    'departamento': 'Departamento',
+    'SUBREGION': 'Subregión',
+    'AH': 'Área hidrográfica',
+    'ZSZH': 'Zona / subzona hidrográfica',
+    'vereda': 'Vereda',
+    'Celda_XY': 'Celda',
+}
+
+STATISTICS = {
+    'mean': 'Precipitación media (mm)',
+    'total': 'Precipitación total (mm)',
+    'count': 'Estaciones con dato',
+    'coverage': 'Cobertura de datos (%)',
+}
+
+
+def normalize_name(value):
+    """Nombre sin tildes, en mayúsculas y sin espacios extra, para cruzar tablas con nombres escritos distinto."""
+    text = unicodedata.normalize('NFKD', str(value))
+    return ' '.join(''.join(ch for ch in text if not unicodedata.combining(ch)).upper().split())
+
+
+class ZonalStats:
+    """Resultado de una agregación: matrices (grupos × años) y estaciones por grupo."""
+
+    def __init__(self, column, labels, years, mean, total, count, coverage, n_stations):
+        self.column = column
+        self.labels = labels
+        self.years = years
+        self.mean = mean
+        self.total = total
+        self.count = count
+        self.coverage = coverage
+        self.n_stations = n_stations
+
+    def __len__(self):
+        return len(self.labels)
+
+    def matrix(self, statistic):
+        """Matriz de ``mean``, ``total``, ``count`` o ``coverage`` (esta última en porcentaje)."""
+        if statistic == 'coverage':
+            return self.coverage * 100.0
+        return getattr(self, statistic)
+
+    def range_mean(self, statistic='mean'):
+        """Promedio de cada grupo sobre los años del rango, ignorando los años sin dato."""
+        matrix = self.matrix(statistic)
+        valid = np.isfinite(matrix)
+        counts = valid.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, np.where(valid, matrix, 0.0).sum(axis=1) / counts, np.nan)
+
+    def frame(self, statistic='mean'):
+        """Tabla ancha: una fila por grupo, el número de estaciones, el promedio del rango y una columna por año."""
+        matrix = self.matrix(statistic)
+        table = pd.DataFrame(np.round(matrix, 2), columns=[str(year) for year in self.years])
+        table.insert(0, 'Promedio del rango', np.round(self.range_mean(statistic), 2))
+        table.insert(0, 'Estaciones', self.n_stations)
+        table.insert(0, GROUP_COLUMNS.get(self.column, self.column), self.labels)
+        return table
+
+    def long_frame(self, statistic='mean', groups=None):
+        """Formato largo (grupo, año, valor) para graficar series; ``groups`` limita los grupos."""
+        positions = np.arange(len(self.labels)) if groups is None else np.flatnonzero(np.isin(self.labels, groups))
+        values = self.matrix(statistic)[positions]
+        return pd.DataFrame({
+            GROUP_COLUMNS.get(self.column, self.column): np.repeat(self.labels[positions], len(self.years)),
+            'Año': np.tile(self.years, len(positions)),
+            STATISTICS[statistic]: values.ravel(),
+        })
+
+
+class ZonalIndex:
+    """Códigos de grupo precalculados por columna y matriz (estaciones × años) en float32."""
+
+    def __init__(self, df, columns=GROUP_COLUMNS):
+        years = year_columns(df.columns)
+        self.years = np.array([int(year) for year in years], dtype=np.int16)
+        self.values = df[years].to_numpy(dtype='float32')
+        self.values.flags.writeable = False
+        self.n_stations = len(df)
+        self.codes = {}
+        self.labels = {}
+        self._membership = {}
+        for column in columns:
+            if column not in df.columns:
+                continue
+            codes, labels = pd.factorize(df[column].astype(object), sort=True)
+            codes = codes.astype(np.int32)
+            codes.flags.writeable = False
+            self.codes[column] = codes
+            self.labels[column] = np.asarray(labels.astype(str), dtype=object)
+            stations = np.flatnonzero(codes >= 0)
+            self._membership[column] = sparse.csr_matrix(
+                (np.ones(len(stations), dtype='float32'), (codes[stations], stations)),
+                shape=(len(labels), self.n_stations),
+            )
+
+    @property
+    def columns(self):
+        return list(self.codes)
+
+    def mask(self, column, labels):
+        """Máscara booleana de las estaciones cuyo grupo está en ``labels``."""
+        wanted = np.isin(self.labels[column], np.asarray(list(labels), dtype=object))
+        codes = self.codes[column]
+        return (codes >= 0) & wanted[np.maximum(codes, 0)]
+
+    def aggregate(self, column, rows=None, start_year=None, end_year=None):
+        """Media, total, estaciones con dato y cobertura por grupo y año.
+
+        ``rows`` limita las estaciones (posiciones en el DataFrame); los grupos sin
+        estaciones en ``rows`` se omiten. La cobertura es la fracción de estaciones del
+        grupo con dato ese año.
+        """
+        left = 0 if start_year is None else int(np.searchsorted(self.years, start_year, side='left'))
+        right = len(self.years) if end_year is None else int(np.searchsorted(self.years, end_year, side='right'))
+        values = self.values[:, left:right]
+        membership = self._membership[column]
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            membership = membership[:, rows]
+            values = values[rows]
+
+        valid = np.isfinite(values)
+        total = np.asarray(membership @ np.where(valid, values, 0.0), dtype='float64')
+        count = np.asarray(membership @ valid.astype('float32'), dtype='float64')
+        n_stations = np.asarray(membership.sum(axis=1)).ravel()
+        present = n_stations > 0
+        total, count, n_stations = total[present], count[present], n_stations[present]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+            total = np.where(count > 0, total, np.nan)
+            coverage = count / n_stations[:, None]
+        return ZonalStats(column, self.labels[column][present], self.years[left:right],
+                          mean, total, count.astype(np.int32), coverage, n_stations.astype(np.int32))
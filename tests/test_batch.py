@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from lluvia import batch
+from lluvia.batch import BatchContext, job_columns, job_directory, main, run_job
+from lluvia.bench import synthetic_stations, write_csv
+from lluvia.loading import read_stations_csv
+from lluvia.stats import MEAN_COL
+from lluvia.store import store_path, write_store
+
+
+def test_run_job(tmp_path, monkeypatch):
+    source = write_csv(synthetic_stations(40, years=(1981, 1990)), tmp_path / 'mapaCV.csv')
+    context = BatchContext(source)
+    group = context.zonal_index.labels['municipio'][0]
+    rows = context.rows('municipio', group)
+
+    # Nombres que recibe la leyenda del PNG
+    legends = []
+    annual_chart_png = batch.annual_chart_png
+
+    def recording_chart_png(years, values, names, path, title=None):
+        legends.append(list(names))
+        return annual_chart_png(years, values, names, path, title=title)
+
+    monkeypatch.setattr(batch, 'annual_chart_png', recording_chart_png)
+    output_dir = str(tmp_path / 'salida')
+    result = run_job(context, output_dir, 'municipio', group, 1983, 1988)
+
+    directory = job_directory(output_dir, 'municipio', group, 1983, 1988)
+    assert result['directorio'] == directory
+    assert sorted(os.listdir(directory)) == ['estadisticas.csv', 'mapa.html', 'serie.html', 'serie.png']
+    assert result['archivos'] == 4
+    assert result['estaciones'] == len(rows)
+    assert legends == [context.df['Nom_Est'].to_numpy()[rows].tolist()]
+
+    stats = pd.read_csv(os.path.join(directory, 'estadisticas.csv'))
+    assert len(stats) == len(rows) + 1
+    values = context.df[[str(year) for year in range(1983, 1989)]].to_numpy(dtype='float64')[rows]
+    np.testing.assert_allclose(stats[MEAN_COL].to_numpy()[:len(rows)], np.round(np.nanmean(values, axis=1), 2))
+
+
+def test_context_reads_only_job_columns(tmp_path):
+    csv_path = write_csv(synthetic_stations(40, years=(1981, 1990)), tmp_path / 'mapaCV.csv')
+    path = write_store(read_stations_csv(csv_path), store_path(str(csv_path)))
+    context = BatchContext(path, filters={'departamento': ['Antioquia']},
+                           columns=job_columns('municipio', {'departamento': ['Antioquia']}), years=[(1983, 1985)])
+    assert set(context.df.columns) == set(job_columns('municipio', {'departamento': []})) | {'1983', '1984', '1985'}
+    # Con relleno se leen todos los años
+    filled = BatchContext(path, fill_method='idw', columns=job_columns('municipio'), years=[(1983, 1985)])
+    assert len([col for col in filled.df.columns if col.isdigit()]) == 10
+
+
+def test_main(tmp_path):
+    csv_path = write_csv(synthetic_stations(40, years=(1981, 1990)), tmp_path / 'mapaCV.csv')
+    output_dir = tmp_path / 'salida'
+    main([str(csv_path), '--years', '1981-1985', '--years', '1986-1990', '-o', str(output_dir), '-j', '1',
+          '--no-charts', '--no-map'])
+    summary = pd.read_csv(output_dir / 'resumen.csv')
+    assert len(summary) == 2 * summary['grupo'].nunique()
+    assert summary['estaciones'].sum() == 2 * 40
+    assert (summary['archivos'] == 1).all()
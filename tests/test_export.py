@@ -0,0 +1,65 @@
+import gzip
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from lluvia.export import frame_chunks, long_chunks, wide_chunks, write_csv, write_parquet
+
+
+def stations(n=7):
+    """Estaciones con columnas de texto nulas al principio (como SUBREGION o vereda)."""
+    return pd.DataFrame({
+        'Id_estacion': np.arange(100, 100 + n),
+        'Nom_Est': [f'EST {i}' for i in range(n)],
+        'SUBREGION': pd.Series([None] * (n - 2) + ['NORTE', 'URABA'], dtype=object),
+        'vereda': pd.Series([np.nan] * (n - 1) + ['La Loma'], dtype=object),
+        '2000': np.linspace(0, 60, n).astype('float32'),
+        '2001': np.full(n, np.nan, dtype='float32'),
+    })
+
+
+def test_parquet_first_chunk_all_null():
+    df = stations()
+    out = write_parquet(wide_chunks(df, np.arange(len(df)), chunk_size=2))
+    result = pq.read_table(out).to_pandas()
+    assert result['SUBREGION'].tolist()[-2:] == ['NORTE', 'URABA']
+    assert result['SUBREGION'].isna().sum() == len(df) - 2
+    assert result['vereda'].iloc[-1] == 'La Loma'
+    np.testing.assert_allclose(result['2000'], df['2000'])
+
+
+def test_parquet_raw_chunks_first_all_null():
+    # Bloques armados a mano: la columna nula del primer bloque se escribe como texto
+    chunks = [pd.DataFrame({'a': pd.Series([None, None], dtype=object)}), pd.DataFrame({'a': ['x', None]})]
+    result = pq.read_table(write_parquet(iter(chunks))).to_pandas()
+    assert result['a'].tolist()[2] == 'x'
+    assert result['a'].isna().sum() == 3
+
+
+def test_stats_with_summary_row():
+    stats = pd.DataFrame({'Nom_Est': ['A', 'B', 'Todas'], 'Id_estacion': [1, 2, None], 'vereda': [None, None, None],
+                          'Precipitación Media (mm)': [1.0, 3.0, 2.0]})
+    result = pd.read_parquet(write_parquet(frame_chunks(stats, chunk_size=1)))
+    assert result['Id_estacion'].tolist()[:2] == [1, 2]
+    assert result['Id_estacion'].isna().iloc[-1]
+    assert result['vereda'].isna().all()
+
+
+def test_csv_matches_frame():
+    df = stations()
+    rows = np.array([6, 0, 3])
+    out = write_csv(wide_chunks(df, rows, 2000, 2000, chunk_size=2))
+    result = pd.read_csv(io.BytesIO(gzip.decompress(out.read())))
+    assert list(result.columns) == ['Id_estacion', 'Nom_Est', 'SUBREGION', 'vereda', '2000']
+    assert result['Id_estacion'].tolist() == [106, 100, 103]
+    np.testing.assert_allclose(result['2000'], df['2000'].to_numpy()[rows], rtol=1e-6)
+
+
+def test_long_chunks():
+    df = stations(3)
+    result = pd.concat(list(long_chunks(df, np.arange(3), chunk_size=2)), ignore_index=True)
+    assert len(result) == 3 * 2
+    assert result['Año'].tolist() == [2000, 2001] * 3
+    np.testing.assert_allclose(result['Precipitación'].to_numpy()[::2], df['2000'])
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lluvia.gaps import METHODS, GapFiller
+from lluvia.loading import LAT_WGS84, LON_WGS84, SOURCE_CRS, TARGET_CRS, get_transformer
+
+YEARS = [str(year) for year in range(1980, 2010)]
+
+
+def stations(seed, n_stations=60):
+    """Estaciones cercanas con una señal regional común, años vacíos y años en 0."""
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(100.0, 25.0, len(YEARS))
+    scale = rng.uniform(0.5, 2.0, n_stations)
+    values = scale[:, None] * signal + rng.normal(0.0, 15.0, (n_stations, len(YEARS)))
+    values = np.maximum(values, 1.0).round(1)
+    values[rng.random(values.shape) < 0.15] = np.nan
+    values[rng.random(values.shape) < 0.05] = 0.0
+    df = pd.DataFrame(values, columns=YEARS)
+    df[LAT_WGS84] = rng.uniform(6.0, 6.6, n_stations)
+    df[LON_WGS84] = rng.uniform(-75.8, -75.2, n_stations)
+    df['Porc_datos'] = rng.uniform(30.0, 100.0, n_stations).round()
+    return df
+
+
+def reference_fill(df, method, k=8, max_distance_km=50.0, min_overlap=10, min_donor_coverage=50.0, min_correlation=0.5):
+    """Relleno celda por celda, con vecinos y estadísticas de cada pareja calculados en el momento."""
+    raw = df[YEARS].to_numpy(dtype='float64')
+    observed = np.where(np.isfinite(raw) & (raw != 0), raw, np.nan)
+    x, y = get_transformer(TARGET_CRS, SOURCE_CRS).transform(df[LON_WGS84].to_numpy(), df[LAT_WGS84].to_numpy())
+    distance = np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+    coverage = df['Porc_datos'].to_numpy()
+
+    values = raw.copy()
+    filled = np.zeros(raw.shape, dtype=bool)
+    for station in range(len(df)):
+        neighbours = [nb for nb in np.argsort(distance[station], kind='stable') if nb != station][:k]
+        donors = []
+        for nb in neighbours:
+            both = np.isfinite(observed[station]) & np.isfinite(observed[nb])
+            if (coverage[nb] < min_donor_coverage or distance[station, nb] > max_distance_km * 1000.0
+                    or both.sum() < min_overlap):
+                continue
+            a, b = observed[station, both], observed[nb, both]
+            r = np.corrcoef(a, b)[0, 1]
+            if method == 'idw':
+                weight = 1.0 / max(distance[station, nb], 1.0) ** 2
+            elif r < min_correlation:
+                continue
+            else:
+                weight = r ** 2 * (both.sum() - 2) / (1.0 - r ** 2)
+            slope, intercept = np.polyfit(b, a, 1)
+            donors.append((nb, weight, a.mean() / b.mean(), slope, intercept))
+
+        for year in np.flatnonzero(~np.isfinite(observed[station])):
+            total = estimate = 0.0
+            for nb, weight, ratio, slope, intercept in donors:
+                value = observed[nb, year]
+                if not np.isfinite(value):
+                    continue
+                if method == 'normal_ratio':
+                    value = value * ratio
+                elif method == 'regression':
+                    value = intercept + slope * value
+                total += weight
+                estimate += weight * value
+            if total > 0:
+                values[station, year] = max(estimate / total, 0.0)
+                filled[station, year] = True
+    return values, filled
+
+
+@pytest.mark.parametrize('method', list(METHODS))
+@pytest.mark.parametrize('seed', [0, 1])
+def test_matches_reference(method, seed):
+    df = stations(seed)
+    result = GapFiller(df, chunk_size=16).fill(method)
+    values, filled = reference_fill(df, method)
+    assert filled.any()
+    np.testing.assert_array_equal(result.filled, filled)
+    np.testing.assert_allclose(result.values, values, rtol=1e-5, atol=1e-3, equal_nan=True)
+
+
+def test_min_correlation_only_for_correlation_methods():
+    df = stations(2)
+    filler = GapFiller(df)
+    loose, strict = filler.fill('regression', min_correlation=0.0), filler.fill('regression', min_correlation=0.99)
+    assert loose.filled.sum() > strict.filled.sum()
+    np.testing.assert_array_equal(filler.fill('idw', min_correlation=0.0).values,
+                                  filler.fill('idw', min_correlation=0.99).values)
+
+
+def test_observed_values_unchanged():
+    df = stations(3)
+    result = GapFiller(df).fill('normal_ratio')
+    raw = df[YEARS].to_numpy(dtype='float32')
+    np.testing.assert_array_equal(result.values[~result.missing], raw[~result.missing])
+    assert not result.filled[~result.missing].any()
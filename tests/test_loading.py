@@ -0,0 +1,48 @@
+import io
+import zipfile
+
+import pytest
+import shapefile
+
+from lluvia.loading import cpg_encoding, read_shapefile_zip
+
+
+@pytest.mark.parametrize('cpg, codec', [
+    ('ANSI 1252', 'cp1252'), ('1252', 'cp1252'), ('88591', 'iso8859-1'), ('8859_1', 'iso8859-1'),
+    ('ISO-8859-15', 'iso8859-15'), ('UTF-8', 'utf-8'), ('utf8\r\n', 'utf-8'), ('65001', 'utf-8'),
+    ('OEM', 'cp437'), ('', 'latin-1'), ('no es un codec', 'latin-1'),
+])
+def test_cpg_encoding(cpg, codec):
+    assert cpg_encoding(cpg) == codec
+
+
+def shapefile_zip(names, encoding, cpg=None):
+    """ZIP con un shapefile de puntos (EPSG:4326) cuyo .dbf está escrito en ``encoding``."""
+    shp, shx, dbf = io.BytesIO(), io.BytesIO(), io.BytesIO()
+    with shapefile.Writer(shp=shp, shx=shx, dbf=dbf, shapeType=shapefile.POINT, encoding=encoding) as writer:
+        writer.field('Nom_Est', 'C', size=40)
+        for i, name in enumerate(names):
+            writer.point(-75.5 + i * 0.01, 6.2)
+            writer.record(name)
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as zip_ref:
+        zip_ref.writestr('estaciones.shp', shp.getvalue())
+        zip_ref.writestr('estaciones.shx', shx.getvalue())
+        zip_ref.writestr('estaciones.dbf', dbf.getvalue())
+        zip_ref.writestr('estaciones.prj', 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],'
+                                           'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]')
+        if cpg is not None:
+            zip_ref.writestr('estaciones.cpg', cpg)
+    return out.getvalue()
+
+
+NAMES = ['Abriaquí', 'Peñol', 'Santa Bárbara']
+
+
+@pytest.mark.parametrize('cpg, encoding', [
+    ('ANSI 1252', 'cp1252'), ('88591', 'latin-1'), ('UTF-8', 'utf-8'), (None, 'latin-1'), ('desconocido', 'latin-1'),
+])
+def test_read_shapefile_zip_encodings(cpg, encoding):
+    gdf = read_shapefile_zip(shapefile_zip(NAMES, encoding, cpg))
+    assert gdf['Nom_Est'].tolist() == NAMES
+    assert len(gdf) == len(NAMES)
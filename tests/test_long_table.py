@@ -0,0 +1,40 @@
+import numpy as np
+
+from lluvia.bench import synthetic_stations, write_csv
+from lluvia.loading import LAT_WGS84, LON_WGS84, read_stations_csv
+from lluvia.long_table import PRECIP_COL, STATION_COL, YEAR_COL, LongTable
+
+
+def load(tmp_path, n_stations=12, years=(1981, 1990)):
+    source = write_csv(synthetic_stations(n_stations, years=years), tmp_path / 'mapaCV.csv')
+    return read_stations_csv(source)
+
+
+def test_frame_positions(tmp_path):
+    df = load(tmp_path)
+    table = LongTable(df)
+    assert len(table) == 12 * 10
+
+    rows = [3, 0, 7]
+    frame = table.frame(rows, 1983, 1985)
+    assert list(frame.columns) == [STATION_COL, YEAR_COL, PRECIP_COL]
+    assert frame[YEAR_COL].tolist() == [1983] * 3 + [1984] * 3 + [1985] * 3
+    assert frame[STATION_COL].tolist() == df[STATION_COL].to_numpy()[rows].tolist() * 3
+    expected = df[['1983', '1984', '1985']].to_numpy(dtype='float32')[rows].T.ravel()
+    np.testing.assert_array_equal(frame[PRECIP_COL].to_numpy(), expected)
+
+    years, block = table.matrix(rows, 1983, 1985)
+    assert years.tolist() == [1983, 1984, 1985]
+    np.testing.assert_array_equal(block.ravel(), expected)
+
+
+def test_stations_keep_one_coordinate_per_station(tmp_path):
+    df = load(tmp_path)
+    table = LongTable(df)
+    assert table.lat.shape == table.lon.shape == (len(df),)
+    assert not table.lat.flags.writeable
+
+    stations = table.stations([5, 1])
+    assert stations[STATION_COL].tolist() == df[STATION_COL].to_numpy()[[5, 1]].tolist()
+    np.testing.assert_array_equal(stations[LAT_WGS84].to_numpy(), df[LAT_WGS84].to_numpy()[[5, 1]])
+    np.testing.assert_array_equal(stations[LON_WGS84].to_numpy(), df[LON_WGS84].to_numpy()[[5, 1]])
@@ -0,0 +1,46 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+import pytest
+
+from lluvia.profiling import RerunProfiler, json_size
+
+
+def long_frame(n_stations=120, n_years=52):
+    """Formato largo más grande que el límite de 5000 filas de Altair."""
+    return pd.DataFrame({
+        'Nom_Est': np.repeat([f'EST {i}' for i in range(n_stations)], n_years),
+        'Año': np.tile(np.arange(1970, 1970 + n_years), n_stations),
+        'Precipitación': np.random.default_rng(0).uniform(0, 100, n_stations * n_years),
+    })
+
+
+def test_payload_of_large_altair_chart():
+    chart = alt.Chart(long_frame()).mark_line().encode(x='Año:O', y='Precipitación:Q', color='Nom_Est:N')
+    profiler = RerunProfiler(enabled=True)
+    with profiler.stage('gráficos'):
+        profiler.payload('gráficos: Altair (bytes)', lambda: json_size(chart))
+    profiler.finish()
+    sizes = [record['bytes'] for record in profiler.records if 'bytes' in record]
+    assert len(sizes) == 1 and sizes[0] > 6240 * 20
+    # El límite de filas sigue activo fuera de la medición
+    with pytest.raises(alt.MaxRowsError):
+        chart.to_json()
+
+
+def test_disabled_profiler_does_not_measure():
+    profiler = RerunProfiler(enabled=False)
+    profiler.payload('nunca', lambda: 1 / 0)
+    with profiler.stage('etapa'):
+        pass
+    profiler.finish()
+    assert profiler.records == []
+
+
+def test_nested_stages():
+    profiler = RerunProfiler(enabled=True)
+    with profiler.stage('afuera'):
+        with profiler.stage('adentro'):
+            pass
+    profiler.finish()
+    assert [(record['stage'], record['depth']) for record in profiler.records] == [('afuera', 0), ('adentro', 1), ('total', 0)]
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lluvia.stats import MAX_COL, MAX_YEAR_COL, MEAN_COL, MIN_COL, MIN_YEAR_COL, STD_COL, StatsCube
+
+YEARS = [str(year) for year in range(1970, 2022)]
+
+
+def random_frame(seed, n_stations=40):
+    """Valores enteros (muchos empates) con vacíos; algunas estaciones sin ningún dato en 1990-1999."""
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 30, size=(n_stations, len(YEARS))).astype('float64')
+    values[rng.random(values.shape) < 0.3] = np.nan
+    values[:5, YEARS.index('1990'):YEARS.index('1999') + 1] = np.nan
+    values[5] = np.nan
+    return pd.DataFrame(values, columns=YEARS)
+
+
+def reference(df, start_year, end_year):
+    """Estadísticas con pandas, estación por estación."""
+    block = df[[year for year in YEARS if start_year <= int(year) <= end_year]]
+    records = []
+    for _, row in block.iterrows():
+        has_data = row.notna().any()
+        records.append({
+            MAX_COL: row.max(), MAX_YEAR_COL: row.idxmax() if has_data else None,
+            MIN_COL: row.min(), MIN_YEAR_COL: row.idxmin() if has_data else None,
+            MEAN_COL: row.mean(), STD_COL: row.std(),
+        })
+    return pd.DataFrame(records, columns=[MAX_COL, MAX_YEAR_COL, MIN_COL, MIN_YEAR_COL, MEAN_COL, STD_COL])
+
+
+def ranges(seed, n=25):
+    rng = np.random.default_rng(seed)
+    pairs = [tuple(sorted(rng.integers(1965, 2026, size=2))) for _ in range(n)]
+    return pairs + [(1990, 1999), (1970, 2021), (2000, 2000), (1960, 1965), (2030, 2040)]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_query_matches_pandas(seed):
+    df = random_frame(seed)
+    cube = StatsCube.from_frame(df)
+    rows = np.random.default_rng(seed).permutation(len(df))[:30]
+    for start_year, end_year in ranges(seed):
+        result = cube.query(start_year, end_year, rows)
+        expected = reference(df, start_year, end_year).iloc[rows].reset_index(drop=True)
+        for col in (MAX_COL, MIN_COL, MEAN_COL, STD_COL):
+            np.testing.assert_allclose(result[col].to_numpy(dtype='float64'), expected[col].to_numpy(dtype='float64'),
+                                       atol=0.006, equal_nan=True, err_msg=f'{col} {start_year}-{end_year}')
+        for col in (MAX_YEAR_COL, MIN_YEAR_COL):
+            assert result[col].tolist() == expected[col].tolist(), f'{col} {start_year}-{end_year}'
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_summary_matches_pandas(seed):
+    df = random_frame(seed)
+    cube = StatsCube.from_frame(df)
+    rows = np.arange(0, len(df), 2)
+    for start_year, end_year in ranges(seed):
+        block = df.iloc[rows][[year for year in YEARS if start_year <= int(year) <= end_year]]
+        result = cube.summary(start_year, end_year, rows)
+        stacked = block.to_numpy().ravel()
+        if np.isnan(stacked).all():
+            assert np.isnan(result[MAX_COL]) and result[MAX_YEAR_COL] == 'N/A'
+            assert np.isnan(result[MEAN_COL])
+            continue
+        assert result[MAX_COL] == np.nanmax(stacked)
+        assert result[MIN_COL] == np.nanmin(stacked)
+        # Primer año en el que alguna estación alcanza el extremo
+        assert result[MAX_YEAR_COL] == block.columns[(block == np.nanmax(stacked)).any(axis=0)][0]
+        assert result[MIN_YEAR_COL] == block.columns[(block == np.nanmin(stacked)).any(axis=0)][0]
+        assert result[MEAN_COL] == pytest.approx(np.nanmean(stacked), abs=0.006)
+        if np.isfinite(stacked).sum() > 1:
+            assert result[STD_COL] == pytest.approx(np.nanstd(stacked, ddof=1), abs=0.006)
+
+
+def test_all_stations_by_default():
+    df = random_frame(3)
+    cube = StatsCube.from_frame(df)
+    assert len(cube.query(1980, 1989)) == len(df)
+    empty = cube.query(1990, 1999, rows=[5])
+    assert empty[MAX_YEAR_COL].tolist() == [None]
+    assert np.isnan(empty[MEAN_COL].iloc[0])
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from lluvia.bench import synthetic_stations, write_csv
+from lluvia.loading import LAT_WGS84, LON_WGS84, read_stations_csv
+from lluvia.store import projection, read_stations, source_years, store_path, write_store
+
+
+def test_projection():
+    names = ['Nom_Est', 'municipio', '1990', '1991', '2000', '2001']
+    assert projection(names) == names
+    assert projection(names, columns=['municipio', 'x']) == ['municipio', '1990', '1991', '2000', '2001']
+    assert projection(names, years=[(1991, 2000)]) == ['Nom_Est', 'municipio', '1991', '2000']
+    assert projection(names, columns=['Nom_Est'], years=[(1990, 1990), (2001, 2005)]) == ['Nom_Est', '1990', '2001']
+    assert projection(names, columns=['Nom_Est'], years=[]) == ['Nom_Est']
+
+
+def test_projected_read_matches_full_read(tmp_path):
+    csv_path = write_csv(synthetic_stations(30, years=(1981, 1990)), tmp_path / 'mapaCV.csv')
+    path = write_store(read_stations_csv(csv_path), store_path(str(csv_path)))
+    assert source_years(path) == source_years(csv_path) == [str(year) for year in range(1981, 1991)]
+
+    full = read_stations(path)
+    columns = ['Nom_Est', 'municipio', LAT_WGS84, LON_WGS84]
+    for source in (path, csv_path):
+        part = read_stations(source, columns=columns, years=[(1985, 1987)])
+        assert list(part.columns) == columns + ['1985', '1986', '1987']
+        pd.testing.assert_frame_equal(part, full[list(part.columns)], check_categorical=False)
+
+
+def test_old_store_gains_wgs84_columns(tmp_path):
+    csv_path = write_csv(synthetic_stations(10, years=(1981, 1983)), tmp_path / 'mapaCV.csv')
+    df = read_stations_csv(csv_path)
+    path = write_store(df.drop(columns=[LAT_WGS84, LON_WGS84]), store_path(str(csv_path)))
+    part = read_stations(path, columns=['Nom_Est', LAT_WGS84, LON_WGS84], years=[])
+    assert list(part.columns) == ['Nom_Est', LAT_WGS84, LON_WGS84]
+    np.testing.assert_allclose(part[LAT_WGS84], df[LAT_WGS84])
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from lluvia.trends import DECREASING, INCREASING, NO_TREND, mann_kendall
+
+YEARS = np.arange(1981, 2011)
+
+
+def random_series(seed, n_stations=25):
+    """Series enteras (con empates), con tendencia en algunas estaciones y años faltantes."""
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 12, size=(n_stations, len(YEARS))).astype('float64')
+    values[::3] += np.arange(len(YEARS)) * 0.5
+    values[1::3] -= np.arange(len(YEARS)) * 0.5
+    values[rng.random(values.shape) < 0.2] = np.nan
+    return values
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_against_scipy(seed):
+    values = random_series(seed)
+    result = mann_kendall(values, YEARS)
+    for row, series in enumerate(values):
+        valid = np.isfinite(series)
+        x, t = series[valid], YEARS[valid]
+        n = len(x)
+        # S por fuerza bruta sobre las parejas de años
+        i, j = np.triu_indices(n, k=1)
+        s = np.sign(x[j] - x[i]).sum()
+        assert result.s[row] == s
+        assert result.n_years[row] == n
+
+        # kendalltau (sin empates en los años): tau_b = S / sqrt(n0 (n0 - n2)) y z = S / sqrt(var(S))
+        tau, p_asymptotic = stats.kendalltau(t, x, method='asymptotic')
+        _, counts = np.unique(x, return_counts=True)
+        n0, n2 = n * (n - 1) / 2, (counts * (counts - 1) / 2).sum()
+        assert s / np.sqrt(n0 * (n0 - n2)) == pytest.approx(tau)
+        assert abs(s) / np.sqrt(result.var_s[row]) == pytest.approx(stats.norm.isf(p_asymptotic / 2), rel=1e-6)
+
+        # Z con corrección por continuidad y valor p bilateral
+        z = (s - np.sign(s)) / np.sqrt(result.var_s[row])
+        assert result.z[row] == pytest.approx(z)
+        assert result.p[row] == pytest.approx(2 * stats.norm.sf(abs(z)))
+
+        assert result.slope[row] == pytest.approx(stats.theilslopes(x, t)[0])
+
+
+def test_trend_direction():
+    values = random_series(3)
+    result = mann_kendall(values, YEARS)
+    trend = result.trend()
+    assert set(trend[::3]) == {INCREASING}
+    assert set(trend[1::3]) == {DECREASING}
+    assert set(result.trend(alpha=0.0)) == {NO_TREND}
+
+
+def test_series_too_short():
+    values = np.full((3, len(YEARS)), np.nan)
+    values[1, 4] = 10.0
+    values[2, [4, 9]] = [5.0, 5.0]
+    result = mann_kendall(values, YEARS)
+    assert result.s.tolist() == [0, 0, 0]
+    assert result.z.tolist() == [0.0, 0.0, 0.0]
+    assert result.p.tolist() == [1.0, 1.0, 1.0]
+    assert np.isnan(result.slope[:2]).all()
+    assert result.slope[2] == 0.0
+    assert result.trend().tolist() == [NO_TREND] * 3
+    assert np.isnan(result.zscores[:2]).all()